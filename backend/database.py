@@ -1,16 +1,37 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from pathlib import Path
+import os
 
 BASE_DIR = Path(__file__).resolve().parent.parent
-DB_PATH = BASE_DIR / "attendance.db"
+DB_PATH = Path(os.getenv("ATTENDANCE_DB_PATH", str(BASE_DIR / "attendance.db")))
 
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
 
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# SQLite allows one writer at a time, so keep the write pool small;
+# WAL lets any number of readers run alongside it.
+DB_WRITE_POOL_SIZE = int(os.getenv("DB_WRITE_POOL_SIZE", "2"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "8"))
+
+def _sqlite_pragmas(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cur.close()
+
 # For SQLite you must set check_same_thread=False
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+                       pool_size=DB_WRITE_POOL_SIZE, max_overflow=0)
+read_engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+                            pool_size=DB_READ_POOL_SIZE, max_overflow=0)
+event.listen(engine, "connect", _sqlite_pragmas)
+event.listen(read_engine, "connect", _sqlite_pragmas)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 Base = declarative_base()
 
 # Dependency to get DB session in FastAPI endpoints
@@ -20,3 +41,12 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Same, for endpoints that only read
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
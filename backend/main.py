@@ -1,13 +1,22 @@
+from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
-from backend.routers import students, teachers, attendance, admin, schedules
-from backend.database import Base, engine
+from backend.routers import students, teachers, attendance, admin, schedules, embeddings
+from backend.utils import metrics, warmup
 
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # schema first: every endpoint needs it, and it is quick on an existing database
+    warmup.prepare_database()
+    warmup.start()
+    yield
 
-app = FastAPI(title="School Attendance System")
+app = FastAPI(title="School Attendance System", lifespan=lifespan)
+if metrics.SERVER_TIMING:
+    app.add_middleware(metrics.ServerTimingMiddleware)
 
 
 # --- API routes first ---
@@ -16,11 +25,21 @@ app.include_router(teachers.router, prefix="/api/teachers", tags=["Teachers"])
 app.include_router(attendance.router, prefix="/api", tags=["Attendance"])
 app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 app.include_router(schedules.router, prefix="/api/schedules", tags=["Schedules"])
+app.include_router(embeddings.router, prefix="/api/embeddings", tags=["Embeddings"])
 
 @app.get("/api/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/api/ready")
+def ready():
+    """Readiness: 200 once models and galleries are loaded, 503 before (or if warmup failed)."""
+    return JSONResponse(warmup.status(), status_code=200 if warmup.ready() else 503)
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # --- Mount static frontend last ---
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 FRONTEND_DIR = PROJECT_ROOT / "frontend"
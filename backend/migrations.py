@@ -0,0 +1,140 @@
+"""
+Lightweight schema migrations for existing attendance.db files.
+
+Base.metadata.create_all only creates missing tables; it never changes an
+existing one. Each step below upgrades an older database in place and is
+written so it is a no-op on a database create_all has just built. The
+number of applied steps is kept in SQLite's PRAGMA user_version.
+"""
+from sqlalchemy import text
+from backend.utils.schedule_import import parse_day, parse_time
+
+def _columns(conn, table: str) -> set:
+    return {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+
+def _has_table(conn, table: str) -> bool:
+    return conn.execute(text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:t"),
+                        {"t": table}).fetchone() is not None
+
+def _rebuild_people(conn, table: str, id_col: str) -> None:
+    # early databases keyed students/teachers by their external id with no
+    # surrogate integer id; rebuild them in the shape of the models
+    if not _has_table(conn, table) or "id" in _columns(conn, table):
+        return
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+    conn.execute(text(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, "
+                      f"{id_col} VARCHAR NOT NULL UNIQUE, name VARCHAR NOT NULL)"))
+    conn.execute(text(f"INSERT INTO {table} ({id_col}, name) "
+                      f"SELECT {id_col}, COALESCE(name, '') FROM {table}_old WHERE {id_col} IS NOT NULL"))
+    conn.execute(text(f"DROP TABLE {table}_old"))
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_id ON {table} (id)"))
+    conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{table}_{id_col} ON {table} ({id_col})"))
+
+def m001_people_surrogate_ids(conn):
+    _rebuild_people(conn, "students", "student_id")
+    _rebuild_people(conn, "teachers", "teacher_id")
+
+def m002_attendance_unique_person_date(conn):
+    # collapse duplicates written before the constraint existed, keeping the earliest
+    for table, col in (("attendance_students", "student_id"), ("attendance_teachers", "teacher_id")):
+        conn.execute(text(f"DELETE FROM {table} WHERE id NOT IN "
+                          f"(SELECT MIN(id) FROM {table} GROUP BY {col}, date)"))
+        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{table}_person_date ON {table} ({col}, date)"))
+
+def m003_attendance_class_and_indexes(conn):
+    for table in ("attendance_students", "attendance_teachers"):
+        if "class_id" not in _columns(conn, table):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN class_id VARCHAR"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_date ON {table} (date)"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_class_date ON {table} (class_id, date)"))
+        # the person+date unique index covers lookups by person alone
+        conn.execute(text(f"DROP INDEX IF EXISTS ix_{table}_student_id"))
+        conn.execute(text(f"DROP INDEX IF EXISTS ix_{table}_teacher_id"))
+        # time strings written with microseconds by older builds
+        conn.execute(text(f"UPDATE {table} SET time = substr(time, 1, 8) WHERE length(time) > 8"))
+
+def m004_backfill_rollups(conn):
+    # rollup tables are created empty by create_all; seed them from raw rows
+    if conn.execute(text("SELECT 1 FROM attendance_daily LIMIT 1")).fetchone():
+        return
+    for role, table, col in (("students", "attendance_students", "student_id"),
+                             ("teachers", "attendance_teachers", "teacher_id")):
+        conn.execute(text(f"INSERT INTO attendance_daily (role, date, present) "
+                          f"SELECT '{role}', date, COUNT(*) FROM {table} GROUP BY date"))
+        conn.execute(text(f"INSERT INTO attendance_monthly (role, person_id, month, days_present) "
+                          f"SELECT '{role}', {col}, substr(date, 1, 7), COUNT(*) FROM {table} "
+                          f"GROUP BY {col}, substr(date, 1, 7)"))
+    conn.execute(text("INSERT INTO attendance_class_daily (class_id, date, present) "
+                      "SELECT class_id, date, COUNT(*) FROM attendance_students "
+                      "WHERE class_id IS NOT NULL GROUP BY class_id, date"))
+    conn.execute(text("INSERT INTO attendance_class_members (class_id, student_id) "
+                      "SELECT DISTINCT class_id, student_id FROM attendance_students WHERE class_id IS NOT NULL"))
+
+def _normalise_schedules(conn) -> None:
+    # rows written before uploads were validated spell days and times freely
+    # ("mon", "9:00:00"); rewrite them as imports do, so they match the
+    # unique slot index and timetable lookups. Unparseable values are kept.
+    updates = []
+    for row_id, day, start, end in conn.execute(text("SELECT id, day, start_time, end_time FROM schedules")):
+        new = (parse_day(day) or day, _try_time(start), _try_time(end))
+        if new != (day, start, end):
+            updates.append({"id": row_id, "day": new[0], "start": new[1], "end": new[2]})
+    if updates:
+        conn.execute(text("UPDATE schedules SET day = :day, start_time = :start, end_time = :end "
+                          "WHERE id = :id"), updates)
+    # repeated CSV uploads appended duplicate slots; keep the latest of each
+    conn.execute(text("DELETE FROM schedules WHERE id NOT IN "
+                      "(SELECT MAX(id) FROM schedules GROUP BY class_id, day, start_time)"))
+
+def _try_time(value):
+    try:
+        return parse_time(value)
+    except ValueError:
+        return value
+
+def m005_schedules_unique_slot(conn):
+    _normalise_schedules(conn)
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_schedules_class_day_start "
+                      "ON schedules (class_id, day, start_time)"))
+
+def m006_schedules_room(conn):
+    # class_rosters is new and created by create_all; schedules needs the column
+    if "room" not in _columns(conn, "schedules"):
+        conn.execute(text("ALTER TABLE schedules ADD COLUMN room VARCHAR"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_schedules_room_day_time "
+                      "ON schedules (room, day, start_time, end_time)"))
+
+def m007_schedules_normalise(conn):
+    # databases that ran m005 before it normalised rows; the index is
+    # rebuilt since normalising can make two slots the same
+    conn.execute(text("DROP INDEX IF EXISTS ux_schedules_class_day_start"))
+    m005_schedules_unique_slot(conn)
+
+def m008_attendance_unique_per_class(conn):
+    # a person attends several class sessions a day: one row per session.
+    # COALESCE because SQLite treats NULLs in a unique index as distinct.
+    for table, col in (("attendance_students", "student_id"), ("attendance_teachers", "teacher_id")):
+        conn.execute(text(f"DROP INDEX IF EXISTS ux_{table}_person_date"))
+        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{table}_person_date_class "
+                          f"ON {table} ({col}, date, COALESCE(class_id, ''))"))
+
+MIGRATIONS = [
+    m001_people_surrogate_ids,
+    m002_attendance_unique_person_date,
+    m003_attendance_class_and_indexes,
+    m004_backfill_rollups,
+    m005_schedules_unique_slot,
+    m006_schedules_room,
+    m007_schedules_normalise,
+    m008_attendance_unique_per_class,
+]
+
+def run_migrations(engine) -> int:
+    """Apply pending migrations; returns the schema version afterwards."""
+    with engine.begin() as conn:
+        version = conn.execute(text("PRAGMA user_version")).scalar() or 0
+        for step in MIGRATIONS[version:]:
+            step(conn)
+            version += 1
+            conn.execute(text(f"PRAGMA user_version = {version}"))
+    return version
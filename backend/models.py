@@ -1,5 +1,13 @@
-from sqlalchemy import Column, Integer, String
-from database import Base
+from sqlalchemy import Column, Integer, String, Date, Time, Index, func
+from sqlalchemy.dialects.sqlite import TIME as SQLITE_TIME
+from backend.database import Base
+
+# Stored as 'HH:MM:SS' in SQLite, matching rows written before times were typed
+HHMMSS = Time().with_variant(
+    SQLITE_TIME(storage_format="%(hour)02d:%(minute)02d:%(second)02d",
+                regexp=r"(\d+):(\d+):(\d+)"),
+    "sqlite",
+)
 
 class Student(Base):
     __tablename__ = "students"
@@ -16,18 +24,34 @@ class Teacher(Base):
 class AttendanceStudent(Base):
     __tablename__ = "attendance_students"
     id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(String, index=True, nullable=False)
-    date = Column(String)
-    time = Column(String)
+    student_id = Column(String, nullable=False)
+    date = Column(Date, nullable=False)
+    time = Column(HHMMSS)
     status = Column(String)
+    class_id = Column(String)
+    __table_args__ = (
+        # one row per student per day and class session (NULL class: one
+        # untagged row a day); also serves lookups by student
+        Index("ux_attendance_students_person_date_class", student_id, date, func.coalesce(class_id, ""),
+              unique=True),
+        Index("ix_attendance_students_date", "date"),
+        Index("ix_attendance_students_class_date", "class_id", "date"),
+    )
 
 class AttendanceTeacher(Base):
     __tablename__ = "attendance_teachers"
     id = Column(Integer, primary_key=True, index=True)
-    teacher_id = Column(String, index=True, nullable=False)
-    date = Column(String)
-    time = Column(String)
+    teacher_id = Column(String, nullable=False)
+    date = Column(Date, nullable=False)
+    time = Column(HHMMSS)
     status = Column(String)
+    class_id = Column(String)
+    __table_args__ = (
+        Index("ux_attendance_teachers_person_date_class", teacher_id, date, func.coalesce(class_id, ""),
+              unique=True),
+        Index("ix_attendance_teachers_date", "date"),
+        Index("ix_attendance_teachers_class_date", "class_id", "date"),
+    )
 
 class Schedule(Base):
     __tablename__ = "schedules"
@@ -38,8 +62,54 @@ class Schedule(Base):
     day = Column(String)
     start_time = Column(String)
     end_time = Column(String)
+    room = Column(String)
+    __table_args__ = (
+        # one slot per class per day and start time; CSV imports upsert on it
+        Index("ux_schedules_class_day_start", "class_id", "day", "start_time", unique=True),
+        # "what is on in this room now": backend/utils/timetable.py
+        Index("ix_schedules_room_day_time", "room", "day", "start_time", "end_time"),
+    )
+
+class ClassRoster(Base):
+    __tablename__ = "class_rosters"
+    class_id = Column(String, primary_key=True)
+    student_id = Column(String, primary_key=True)
 
 class Admin(Base):
     __tablename__ = "admin"
     id = Column(Integer, primary_key=True, index=True)
     password_hash = Column(String)
+
+# Rollups maintained by the attendance writer (backend/utils/rollups.py)
+class AttendanceDaily(Base):
+    __tablename__ = "attendance_daily"
+    role = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    present = Column(Integer, nullable=False, default=0)
+
+class AttendanceMonthly(Base):
+    __tablename__ = "attendance_monthly"
+    role = Column(String, primary_key=True)
+    person_id = Column(String, primary_key=True)
+    month = Column(String, primary_key=True)  # 'YYYY-MM'
+    days_present = Column(Integer, nullable=False, default=0)
+
+class AttendanceClassDaily(Base):
+    __tablename__ = "attendance_class_daily"
+    class_id = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    present = Column(Integer, nullable=False, default=0)
+
+class AttendanceClassMember(Base):
+    __tablename__ = "attendance_class_members"
+    class_id = Column(String, primary_key=True)
+    student_id = Column(String, primary_key=True)
+
+def row_to_dict(obj) -> dict:
+    return {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
+
+# role name used across the app -> (attendance model, person id column)
+ATTENDANCE_MODELS = {
+    "students": (AttendanceStudent, AttendanceStudent.student_id),
+    "teachers": (AttendanceTeacher, AttendanceTeacher.teacher_id),
+}
@@ -1,68 +1,100 @@
 from fastapi import APIRouter, Depends, HTTPException, Form
-from backend.database import get_db
-from backend.utils.security import hash_password, verify_password, require_admin
-from backend.utils.embeddings import build_embeddings_for, load_embeddings
+from fastapi.responses import StreamingResponse
+from backend.database import get_db, get_read_db
+from backend.utils.security import (
+    hash_password, verify_password, require_admin, admin_hash, set_admin_hash, issue_token,
+    ADMIN_TOKEN_TTL_SECONDS,
+)
+from backend.utils.embeddings import get_gallery
+from backend.utils.jobs import submit_rebuild
+from backend.utils import attendance_queries, rollups
+from backend.utils.attendance_cache import marked
+from backend.models import Admin, AttendanceStudent, AttendanceTeacher
 from pathlib import Path
+import datetime
 
 router = APIRouter()
 BASE_DIR = Path(__file__).resolve().parent.parent
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
 
 @router.post("/set-password")
 def set_password(password: str = Form(...), db=Depends(get_db)):
     pw_hash = hash_password(password)
     # Either update existing admin row or create one
-    if db.execute("SELECT 1 FROM admin WHERE id=1").fetchone():
-        db.execute("UPDATE admin SET password_hash = ? WHERE id = 1", (pw_hash,))
+    admin = db.get(Admin, 1)
+    if admin:
+        admin.password_hash = pw_hash
     else:
-        db.execute("INSERT INTO admin (id, password_hash) VALUES (1, ?)", (pw_hash,))
+        db.add(Admin(id=1, password_hash=pw_hash))
     db.commit()
+    set_admin_hash(pw_hash)
     return {"message": "Admin password set"}
 
 @router.post("/check-password")
-def check_password(password: str = Form(...), db=Depends(get_db)):
-    row = db.execute("SELECT password_hash FROM admin WHERE id=1").fetchone()
-    if not row:
+def check_password(password: str = Form(...)):
+    stored = admin_hash()
+    if not stored:
         raise HTTPException(404, "Admin password not set")
-    if verify_password(password, row[0]):
+    if verify_password(password, stored):
         return {"valid": True}
     raise HTTPException(401, "Invalid password")
 
-@router.post("/regen-embeddings")
-def regen_all(admin_pw: str = Depends(require_admin), db=Depends(get_db)):
-    # We require header presence via require_admin; verify value against stored hash
-    stored = db.execute("SELECT password_hash FROM admin WHERE id=1").fetchone()
+@router.post("/login")
+def login(password: str = Form(...)):
+    """Verify the password once and return a short-lived bearer token for the admin endpoints."""
+    stored = admin_hash()
     if not stored:
-        raise HTTPException(400, "Admin password not set")
-    if not verify_password(admin_pw, stored[0]):
-        raise HTTPException(401, "Bad admin password")
-    s_count = build_embeddings_for("students")
-    t_count = build_embeddings_for("teachers")
-    return {"message": f"Embeddings regenerated. Students: {s_count}, Teachers: {t_count}"}
+        raise HTTPException(404, "Admin password not set")
+    if not verify_password(password, stored):
+        raise HTTPException(401, "Invalid password")
+    return {"token": issue_token(stored), "token_type": "bearer", "expires_in": ADMIN_TOKEN_TTL_SECONDS}
+
+@router.post("/regen-embeddings")
+def regen_all(admin=Depends(require_admin)):
+    s_job = submit_rebuild("students")
+    t_job = submit_rebuild("teachers")
+    return {"message": "Embeddings regeneration queued",
+            "jobs": {"students": s_job.id, "teachers": t_job.id}}
 
 @router.get("/embeddings-info")
-def embeddings_info(admin_pw: str = Depends(require_admin), db=Depends(get_db)):
-    stored = db.execute("SELECT password_hash FROM admin WHERE id=1").fetchone()
-    if not stored or not verify_password(admin_pw, stored[0]):
-        raise HTTPException(401, "Bad admin password")
-    s = load_embeddings("students")
-    t = load_embeddings("teachers")
-    return {"students": len(s), "teachers": len(t)}
+def embeddings_info(admin=Depends(require_admin)):
+    return {"students": len(get_gallery("students")), "teachers": len(get_gallery("teachers"))}
+
+@router.get("/attendance")
+def list_attendance(role: str = "students", limit: int = 500, cursor: str = None,
+                    date_from: datetime.date = None, date_to: datetime.date = None,
+                    person_id: str = None, class_id: str = None,
+                    admin=Depends(require_admin), db=Depends(get_read_db)):
+    """Keyset-paginated attendance rows; pass next_cursor back as cursor for the next page."""
+    try:
+        return attendance_queries.page(db.connection(), role, limit, cursor, date_from=date_from,
+                                       date_to=date_to, person_id=person_id, class_id=class_id)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
 
-@router.get("/attendance/all")
-def all_attendance(admin_pw: str = Depends(require_admin), db=Depends(get_db)):
-    stored = db.execute("SELECT password_hash FROM admin WHERE id=1").fetchone()
-    if not stored or not verify_password(admin_pw, stored[0]):
-        raise HTTPException(401, "Bad admin password")
-    s = db.execute("SELECT * FROM attendance_students").fetchall()
-    t = db.execute("SELECT * FROM attendance_teachers").fetchall()
-    return {"students": [dict(r) for r in s], "teachers": [dict(r) for r in t]}
+@router.get("/attendance/export")
+def export_attendance(role: str = "students", format: str = "csv",
+                      date_from: datetime.date = None, date_to: datetime.date = None,
+                      person_id: str = None, class_id: str = None,
+                      admin=Depends(require_admin)):
+    """Stream every matching row as CSV or NDJSON."""
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(400, "format must be csv or ndjson")
+    try:
+        attendance_queries.attendance_model(role)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    chunks = attendance_queries.export_rows(role, format, date_from=date_from, date_to=date_to,
+                                            person_id=person_id, class_id=class_id)
+    filename = f"attendance_{role}.{format}"
+    return StreamingResponse(chunks, media_type=EXPORT_MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 @router.delete("/attendance/reset")
-def reset_attendance(admin_pw: str = Depends(require_admin), db=Depends(get_db)):
-    stored = db.execute("SELECT password_hash FROM admin WHERE id=1").fetchone()
-    if not stored or not verify_password(admin_pw, stored[0]):
-        raise HTTPException(401, "Bad admin password")
-    db.execute("DELETE FROM attendance_students")
-    db.execute("DELETE FROM attendance_teachers")
+def reset_attendance(admin=Depends(require_admin), db=Depends(get_db)):
+    db.query(AttendanceStudent).delete()
+    db.query(AttendanceTeacher).delete()
+    rollups.clear(db)
     db.commit()
+    marked.clear()
     return {"message": "Attendance cleared"}
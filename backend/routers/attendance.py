@@ -1,56 +1,247 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Depends
+from fastapi import APIRouter, File, UploadFile, HTTPException, Request, Depends, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.requests import HTTPConnection
 from pathlib import Path
-from io import BytesIO
-import face_recognition
-from backend.utils.embeddings import match_embedding
-from backend.database import get_db
+from backend.utils.recognition import (
+    pool, recognize_face, recognize_group, recognize_tracked, RecognitionError, PoolBusy, RECOGNITION_RETRY_AFTER,
+)
+from backend.utils.attendance_cache import marked
+from backend.utils.attendance_writer import writer, ATTENDANCE_MARKS
+from backend.utils import attendance_queries, rollups, timetable
+from backend.database import get_read_db
+import asyncio
 import datetime
 
 router = APIRouter()
 BASE_DIR = Path(__file__).resolve().parent.parent
+MAX_GROUP_FRAMES = 5
+KIOSK_HEADER = "x-kiosk-id"
+# a kiosk tied to a room sends it as ?room= or this header (WebSockets: query only)
+ROOM_HEADER = "x-kiosk-room"
+STREAM_ROLES = {"student": "students", "teacher": "teachers"}
+STREAM_MAX_FRAME_BYTES = 2 * 1024 * 1024
+
+async def _recognize(fn, *args):
+    """Run recognition on the worker pool and map its failures to HTTP errors."""
+    try:
+        return await pool.run(fn, *args)
+    except PoolBusy:
+        raise HTTPException(503, "Recognition busy, retry shortly",
+                            headers={"Retry-After": str(RECOGNITION_RETRY_AFTER)})
+    except RecognitionError as e:
+        raise HTTPException(e.status_code, e.detail)
+
+def _kiosk(request: Request) -> str:
+    # frame reuse only for clients that identify as a kiosk: a client
+    # address can be shared by several cameras behind a proxy or NAT
+    return request.headers.get(KIOSK_HEADER) or None
+
+async def _scope(role: str, conn: HTTPConnection):
+    """(class_id, expected ids) of the session in the kiosk's room right now, or None."""
+    room = conn.query_params.get("room") or conn.headers.get(ROOM_HEADER)
+    if not room:
+        return None
+    return await run_in_threadpool(timetable.session_scope, role, room)
+
+def _class_of(scope, person_id: str):
+    # rows are tagged with the session's class only for people expected in it
+    return scope[0] if scope and person_id in scope[1] else None
+
+async def _mark(role: str, person_id: str, now: datetime.datetime, class_id: str = None) -> bool:
+    """
+    Queue today's attendance row for person_id (for the class session, if
+    any) on the group-commit writer unless it is already marked. Returns
+    True if a row was written, False if the person was already marked.
+    """
+    date = now.date().isoformat()
+    key = (role, person_id, date, class_id)
+    if key in marked:
+        ATTENDANCE_MARKS.inc(role=role, result="cached")
+        return False
+    written = await writer.write(role, person_id, now, class_id=class_id)
+    marked.add(key)
+    return written
+
+def _response(name: str, pid: str, dist: float, written: bool) -> dict:
+    if not written:
+        return {"message": f"Attendance already marked for {name} (ID: {pid})",
+                "distance": dist, "already_marked": True}
+    return {"message": f"Attendance marked for {name} (ID: {pid})", "distance": dist,
+            "already_marked": False}
 
 @router.post("/recognize/student")
-async def recognize_student(file: UploadFile = File(...), db=Depends(get_db)):
+async def recognize_student(request: Request, file: UploadFile = File(...)):
     img_bytes = await file.read()
-    try:
-        img = face_recognition.load_image_file(BytesIO(img_bytes))
-    except Exception:
-        raise HTTPException(400, "Invalid image")
-    locs = face_recognition.face_locations(img)
-    if not locs:
-        raise HTTPException(404, "Face not found")
-    enc = face_recognition.face_encodings(img, locs)[0]
-    matched = match_embedding(enc, "students")
-    if not matched:
-        raise HTTPException(404, "No match")
-    sid, name, dist = matched
-    now = datetime.datetime.now()
-    db.execute(
-        "INSERT INTO attendance_students (student_id, date, time, status) VALUES (?, ?, ?, ?)",
-        (sid, now.date().isoformat(), now.time().strftime("%H:%M:%S"), "Present")
-    )
-    db.commit()
-    return {"message": f"Attendance marked for {name} (ID: {sid})", "distance": dist}
+    scope = await _scope("students", request)
+    sid, name, dist = await _recognize(recognize_face, img_bytes, "students", _kiosk(request), scope)
+    written = await _mark("students", sid, datetime.datetime.now(), _class_of(scope, sid))
+    return _response(name, sid, dist, written)
 
 @router.post("/recognize/teacher")
-async def recognize_teacher(file: UploadFile = File(...), db=Depends(get_db)):
+async def recognize_teacher(request: Request, file: UploadFile = File(...)):
     img_bytes = await file.read()
-    try:
-        img = face_recognition.load_image_file(BytesIO(img_bytes))
-    except Exception:
-        raise HTTPException(400, "Invalid image")
-    locs = face_recognition.face_locations(img)
-    if not locs:
-        raise HTTPException(404, "Face not found")
-    enc = face_recognition.face_encodings(img, locs)[0]
-    matched = match_embedding(enc, "teachers")
-    if not matched:
-        raise HTTPException(404, "No match")
-    tid, name, dist = matched
+    scope = await _scope("teachers", request)
+    tid, name, dist = await _recognize(recognize_face, img_bytes, "teachers", _kiosk(request), scope)
+    written = await _mark("teachers", tid, datetime.datetime.now(), _class_of(scope, tid))
+    return _response(name, tid, dist, written)
+
+@router.post("/recognize/class")
+async def recognize_class(request: Request, files: list[UploadFile] = File(...)):
+    """
+    Mark attendance for every recognised student in a classroom photo
+    (or a burst of up to MAX_GROUP_FRAMES frames); the rows are queued
+    together and land in one writer transaction. Each matched entry says
+    whether the student was already marked; "marked" counts rows written.
+    """
+    if len(files) > MAX_GROUP_FRAMES:
+        raise HTTPException(400, f"At most {MAX_GROUP_FRAMES} images per request")
+    images = [await f.read() for f in files]
+    scope = await _scope("students", request)
+    result = await _recognize(recognize_group, images, "students", scope)
     now = datetime.datetime.now()
-    db.execute(
-        "INSERT INTO attendance_teachers (teacher_id, date, time, status) VALUES (?, ?, ?, ?)",
-        (tid, now.date().isoformat(), now.time().strftime("%H:%M:%S"), "Present")
-    )
-    db.commit()
-    return {"message": f"Attendance marked for {name} (ID: {tid})", "distance": dist}
+    written = await asyncio.gather(*[_mark("students", m["id"], now, _class_of(scope, m["id"]))
+                                     for m in result["matched"]])
+    for m, w in zip(result["matched"], written):
+        m["already_marked"] = not w
+    marked_now = sum(written)
+    message = f"Attendance marked for {marked_now} students"
+    if marked_now < len(written):
+        message += f" ({len(written) - marked_now} already marked)"
+    return {"message": message, "marked": marked_now, **result}
+
+async def _stream_event(role: str, result: dict, scope) -> dict:
+    if result["status"] == "no_face":
+        return {"event": "no_face"}
+    if result["match"] is None:
+        return {"event": "no_match"}
+    pid, name, dist = result["match"]
+    # tracked frames hit the marked cache, so this is free after the first mark
+    written = await _mark(role, pid, datetime.datetime.now(), _class_of(scope, pid))
+    return {"event": "marked" if written else "already_marked", "id": pid, "name": name,
+            **_response(name, pid, dist, written)}
+
+def _event_key(event: dict):
+    return ("person", event["id"]) if "id" in event else (event["event"], event.get("detail"))
+
+@router.websocket("/ws/recognize/{role}")
+async def recognize_stream(websocket: WebSocket, role: str):
+    """
+    Streaming kiosk session for role 'student' or 'teacher'. The client
+    sends JPEG frames as binary messages at any rate; only the newest frame
+    is recognised (frames arriving while one is in flight replace each
+    other) and the face is tracked so a person standing still is encoded
+    once. A kiosk in a room connects with ?room= to match the people
+    timetabled there first. JSON events are pushed when the outcome changes:
+    {"event": "marked" | "already_marked", "id", "name", "distance", "message"},
+    {"event": "no_face" | "no_match" | "busy"} or {"event": "error", "detail"}.
+    """
+    role = STREAM_ROLES.get(role)
+    if role is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    latest = {"frame": None, "closed": False}
+    ready = asyncio.Event()
+
+    async def receive():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                frame = message.get("bytes")
+                if frame and len(frame) <= STREAM_MAX_FRAME_BYTES:
+                    latest["frame"] = frame  # an unprocessed older frame is dropped
+                    ready.set()
+        finally:
+            latest["closed"] = True
+            ready.set()
+
+    reader = asyncio.create_task(receive())
+    track, last_key = None, None
+    try:
+        while True:
+            await ready.wait()
+            ready.clear()
+            if latest["closed"]:
+                break
+            frame, latest["frame"] = latest["frame"], None
+            if frame is None:
+                continue
+            scope = await _scope(role, websocket)
+            try:
+                result = await pool.run(recognize_tracked, frame, role, track, scope)
+            except PoolBusy:
+                event = {"event": "busy"}
+            except RecognitionError as e:
+                event = {"event": "error", "detail": e.detail}
+            else:
+                track = result["track"]
+                event = await _stream_event(role, result, scope)
+            if _event_key(event) != last_key:
+                last_key = _event_key(event)
+                await websocket.send_json(event)
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # client went away mid-send
+    finally:
+        reader.cancel()
+
+def _history(db, role: str, person_id: str, limit: int, cursor: str,
+             date_from: datetime.date, date_to: datetime.date) -> dict:
+    try:
+        page = attendance_queries.page(db.connection(), role, limit, cursor, date_from=date_from,
+                                       date_to=date_to, person_id=person_id)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    records = [{"date": r["date"], "time": r["time"], "status": r["status"], "class_id": r["class_id"]}
+               for r in page["rows"]]
+    return {"status": "ok", "id": person_id, "records": records, "next_cursor": page["next_cursor"]}
+
+@router.get("/attendance/student/{student_id}")
+def student_history(student_id: str, limit: int = 500, cursor: str = None,
+                    date_from: datetime.date = None, date_to: datetime.date = None, db=Depends(get_read_db)):
+    return _history(db, "students", student_id, limit, cursor, date_from, date_to)
+
+@router.get("/attendance/teacher/{teacher_id}")
+def teacher_history(teacher_id: str, limit: int = 500, cursor: str = None,
+                    date_from: datetime.date = None, date_to: datetime.date = None, db=Depends(get_read_db)):
+    return _history(db, "teachers", teacher_id, limit, cursor, date_from, date_to)
+
+def _check_role(role: str) -> None:
+    if role not in ("students", "teachers"):
+        raise HTTPException(400, f"Unknown role: {role}")
+
+@router.get("/attendance/summary/daily")
+def summary_daily(role: str = "students", date_from: datetime.date = None, date_to: datetime.date = None,
+                  db=Depends(get_read_db)):
+    _check_role(role)
+    return {"role": role, "days": rollups.daily(db.connection(), role, date_from, date_to)}
+
+@router.get("/attendance/summary/monthly")
+def summary_monthly(role: str = "students", month_from: str = None, month_to: str = None,
+                    db=Depends(get_read_db)):
+    """month_from / month_to as 'YYYY-MM'."""
+    _check_role(role)
+    return {"role": role, "months": rollups.monthly(db.connection(), role, month_from, month_to)}
+
+@router.get("/attendance/summary/student/{student_id}")
+def summary_student(student_id: str, month_from: str = None, month_to: str = None, db=Depends(get_read_db)):
+    return {"student_id": student_id,
+            **rollups.person_summary(db.connection(), "students", student_id, month_from, month_to)}
+
+@router.get("/attendance/summary/teacher/{teacher_id}")
+def summary_teacher(teacher_id: str, month_from: str = None, month_to: str = None, db=Depends(get_read_db)):
+    return {"teacher_id": teacher_id,
+            **rollups.person_summary(db.connection(), "teachers", teacher_id, month_from, month_to)}
+
+@router.get("/attendance/summary/class/{class_id}")
+def summary_class(class_id: str, date_from: datetime.date = None, date_to: datetime.date = None,
+                  db=Depends(get_read_db)):
+    return rollups.class_summary(db.connection(), class_id, date_from, date_to)
+
+@router.get("/attendance/summary/teacher/{teacher_id}/sessions")
+def summary_teacher_sessions(teacher_id: str, date_from: datetime.date, date_to: datetime.date = None,
+                             db=Depends(get_read_db)):
+    """Scheduled vs attended timetable sessions for one teacher."""
+    date_to = date_to or datetime.date.today()
+    return rollups.teacher_sessions(db.connection(), teacher_id, date_from, date_to)
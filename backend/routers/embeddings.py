@@ -0,0 +1,15 @@
+from fastapi import APIRouter, HTTPException
+from backend.utils.jobs import runner
+
+router = APIRouter()
+
+@router.get("/jobs")
+def list_jobs():
+    return {"jobs": [j.to_dict() for j in reversed(runner.list())]}
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = runner.get(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return job.to_dict()
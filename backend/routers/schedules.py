@@ -1,24 +1,53 @@
+import datetime
 from fastapi import APIRouter, File, UploadFile, HTTPException, Depends
-from backend.database import get_db
-import csv
-from io import StringIO
+from backend.database import get_db, get_read_db
+from backend.models import Schedule, row_to_dict
+from backend.utils.schedule_import import import_schedules, import_roster, ScheduleImportError
+from backend.utils import timetable
 
 router = APIRouter()
 
 @router.post("/upload-csv")
-async def upload_csv(file: UploadFile = File(...), db=Depends(get_db)):
-    content = (await file.read()).decode('utf-8')
-    reader = csv.DictReader(StringIO(content))
-    count = 0
-    for row in reader:
-        # expected columns: class_id,subject,teacher_id,day,start_time,end_time
-        db.execute("INSERT INTO schedules (class_id, subject, teacher_id, day, start_time, end_time) VALUES (?, ?, ?, ?, ?, ?)",
-                   (row.get('class_id'), row.get('subject'), row.get('teacher_id'), row.get('day'), row.get('start_time'), row.get('end_time')))
-        count += 1
+def upload_csv(file: UploadFile = File(...), db=Depends(get_db)):
+    # expected columns: class_id,subject,teacher_id,day,start_time,end_time[,room]
+    # rows are upserted on (class_id, day, start_time), so re-uploading a timetable replaces it
+    try:
+        result = import_schedules(db.connection(), file.file)
+    except ScheduleImportError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except UnicodeDecodeError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8")
     db.commit()
-    return {"message": f"Uploaded {count} schedule rows"}
+    timetable.clear_cache()
+    return {"message": f"Uploaded {result['imported']} schedule rows", **result}
+
+@router.post("/roster/upload-csv")
+def upload_roster_csv(file: UploadFile = File(...), db=Depends(get_db)):
+    # expected columns: class_id,student_id; each class in the file gets exactly the file's students
+    try:
+        result = import_roster(db.connection(), file.file)
+    except ScheduleImportError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except UnicodeDecodeError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8")
+    db.commit()
+    timetable.clear_cache()
+    return {"message": f"Uploaded rosters for {result['classes']} classes", **result}
+
+@router.get("/roster/{class_id}")
+def get_roster(class_id: str, db=Depends(get_read_db)):
+    return {"class_id": class_id, "student_ids": sorted(timetable.class_roster(db.connection(), class_id))}
+
+@router.get("/current")
+def current_session(room: str, db=Depends(get_read_db)):
+    """The session timetabled in room right now, or null."""
+    return {"room": room, "session": timetable.current_session(db.connection(), room, datetime.datetime.now())}
 
 @router.get("/list")
-def list_schedules(db=Depends(get_db)):
-    rows = db.execute("SELECT * FROM schedules").fetchall()
-    return {"schedules": [dict(r) for r in rows]}
+def list_schedules(db=Depends(get_read_db)):
+    rows = db.query(Schedule).all()
+    return {"schedules": [row_to_dict(r) for r in rows]}
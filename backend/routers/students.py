@@ -1,9 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from sqlalchemy.orm import Session
-from backend.database import get_db
+from backend.database import get_db, get_read_db
 from backend.schemas import StudentCreate
+from backend.models import Student
 from pathlib import Path
-from backend.utils.embeddings import build_embeddings_for
+from backend.utils.jobs import submit_rebuild
+from backend.utils.ingest import ingest_files
+from fastapi.concurrency import run_in_threadpool
 import shutil
 import os
 
@@ -16,14 +19,13 @@ DATASET_DIR.mkdir(parents=True, exist_ok=True)
 @router.post("/register")
 def create_student(data: StudentCreate, db: Session = Depends(get_db)):
     # check exists
-    row = db.execute("SELECT 1 FROM students WHERE student_id = :id", {"id": data.student_id}).fetchone()
-    if row:
+    if db.query(Student.id).filter(Student.student_id == data.student_id).first():
         raise HTTPException(400, "Student ID already exists")
-    db.execute("INSERT INTO students (student_id, name) VALUES (:id, :name)", {"id": data.student_id, "name": data.name})
+    db.add(Student(student_id=data.student_id, name=data.name))
     db.commit()
     folder = DATASET_DIR / "students" / f"{data.student_id}_{data.name.replace(' ', '_')}"
     folder.mkdir(parents=True, exist_ok=True)
-    # Note: embeddings will be regenerated after images upload or you may call build_embeddings_for('students')
+    # Note: embeddings will be regenerated after images upload or you may call submit_rebuild('students')
     return {"message": "Student registered", "folder": str(folder)}
 
 @router.post("/register/upload-images")
@@ -36,25 +38,23 @@ async def upload_student_images(student_id: str = Form(...), files: list[UploadF
             break
     if not target:
         raise HTTPException(400, "Student folder not found; register first")
-    saved = 0
-    for f in files:
-        contents = await f.read()
-        out_path = target / f.filename
-        out_path.write_bytes(contents)
-        saved += 1
-    # regenerate embeddings automatically
-    count = build_embeddings_for("students")
-    return {"message": f"Saved {saved} files; embeddings updated (total identities: {count})"}
+    result = await run_in_threadpool(ingest_files, "students", target, [(f.filename, f.file) for f in files])
+    saved, skipped = result["saved"], result["skipped"]
+    # regenerate embeddings in the background; new images are already encoded
+    job = submit_rebuild("students") if saved else None
+    return {"message": f"Saved {len(saved)} files, skipped {len(skipped)}"
+                       + ("; embeddings rebuild queued" if job else ""),
+            "saved": saved, "skipped": skipped, "job_id": job.id if job else None}
 
 @router.get("/list")
-def list_students(db: Session = Depends(get_db)):
-    rows = db.execute("SELECT student_id, name FROM students").fetchall()
+def list_students(db: Session = Depends(get_read_db)):
+    rows = db.query(Student.student_id, Student.name).all()
     return {"students": [{"student_id": r[0], "name": r[1]} for r in rows]}
 
 @router.delete("/{student_id}")
 def delete_student(student_id: str, db: Session = Depends(get_db)):
     # remove DB entry
-    db.execute("DELETE FROM students WHERE student_id = :id", {"id": student_id})
+    db.query(Student).filter(Student.student_id == student_id).delete()
     db.commit()
     # remove dataset folder if present
     base = DATASET_DIR / "students"
@@ -62,6 +62,6 @@ def delete_student(student_id: str, db: Session = Depends(get_db)):
         if d.is_dir():
             # delete directory tree
             shutil.rmtree(d)
-    # regenerate embeddings
-    build_embeddings_for("students")
-    return {"message": "Student removed"}
+    # regenerate embeddings in the background
+    job = submit_rebuild("students")
+    return {"message": "Student removed", "job_id": job.id}
@@ -1,9 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from sqlalchemy.orm import Session
-from backend.database import get_db
+from backend.database import get_db, get_read_db
 from backend.schemas import TeacherCreate
+from backend.models import Teacher
 from pathlib import Path
-from backend.utils.embeddings import build_embeddings_for
+from backend.utils.jobs import submit_rebuild
+from backend.utils.ingest import ingest_files
+from fastapi.concurrency import run_in_threadpool
 
 router = APIRouter()
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -13,10 +16,9 @@ DATASET_DIR.mkdir(parents=True, exist_ok=True)
 
 @router.post("/register")
 def create_teacher(data: TeacherCreate, db: Session = Depends(get_db)):
-    row = db.execute("SELECT 1 FROM teachers WHERE teacher_id = :id", {"id": data.teacher_id}).fetchone()
-    if row:
+    if db.query(Teacher.id).filter(Teacher.teacher_id == data.teacher_id).first():
         raise HTTPException(400, "Teacher ID already exists")
-    db.execute("INSERT INTO teachers (teacher_id, name) VALUES (:id, :name)", {"id": data.teacher_id, "name": data.name})
+    db.add(Teacher(teacher_id=data.teacher_id, name=data.name))
     db.commit()
     folder = DATASET_DIR / "teachers" / f"{data.teacher_id}_{data.name.replace(' ', '_')}"
     folder.mkdir(parents=True, exist_ok=True)
@@ -32,28 +34,26 @@ async def upload_teacher_images(teacher_id: str = Form(...), files: list[UploadF
             break
     if not target:
         raise HTTPException(400, "Teacher folder not found; register first")
-    saved = 0
-    for f in files:
-        contents = await f.read()
-        out_path = target / f.filename
-        out_path.write_bytes(contents)
-        saved += 1
-    count = build_embeddings_for("teachers")
-    return {"message": f"Saved {saved} files; embeddings updated (total identities: {count})"}
+    result = await run_in_threadpool(ingest_files, "teachers", target, [(f.filename, f.file) for f in files])
+    saved, skipped = result["saved"], result["skipped"]
+    job = submit_rebuild("teachers") if saved else None
+    return {"message": f"Saved {len(saved)} files, skipped {len(skipped)}"
+                       + ("; embeddings rebuild queued" if job else ""),
+            "saved": saved, "skipped": skipped, "job_id": job.id if job else None}
 
 @router.get("/list")
-def list_teachers(db: Session = Depends(get_db)):
-    rows = db.execute("SELECT teacher_id, name FROM teachers").fetchall()
+def list_teachers(db: Session = Depends(get_read_db)):
+    rows = db.query(Teacher.teacher_id, Teacher.name).all()
     return {"teachers": [{"teacher_id": r[0], "name": r[1]} for r in rows]}
 
 @router.delete("/{teacher_id}")
 def delete_teacher(teacher_id: str, db: Session = Depends(get_db)):
-    db.execute("DELETE FROM teachers WHERE teacher_id = :id", {"id": teacher_id})
+    db.query(Teacher).filter(Teacher.teacher_id == teacher_id).delete()
     db.commit()
     base = DATASET_DIR / "teachers"
     for d in base.glob(f"{teacher_id}_*"):
         if d.is_dir():
             import shutil
             shutil.rmtree(d)
-    build_embeddings_for("teachers")
-    return {"message": "Teacher removed"}
+    job = submit_rebuild("teachers")
+    return {"message": "Teacher removed", "job_id": job.id}
@@ -0,0 +1,115 @@
+import hashlib
+import os
+from pathlib import Path
+import numpy as np
+
+# Per-role settings: ANN_INDEX_STUDENTS=ivf enables the index for students,
+# ANN_NPROBE_STUDENTS overrides ANN_NPROBE for that role, and so on.
+ANN_INDEX = os.getenv("ANN_INDEX", "none")           # 'ivf' or 'none'
+ANN_MIN_IDENTITIES = int(os.getenv("ANN_MIN_IDENTITIES", "5000"))
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))          # 0 = about 4 * sqrt(n)
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+ANN_KMEANS_ITERS = int(os.getenv("ANN_KMEANS_ITERS", "20"))
+
+def ann_settings(role: str) -> dict:
+    suffix = role.upper()
+    return {
+        "kind": os.getenv(f"ANN_INDEX_{suffix}", ANN_INDEX),
+        "min_identities": int(os.getenv(f"ANN_MIN_IDENTITIES_{suffix}", ANN_MIN_IDENTITIES)),
+        "nlist": int(os.getenv(f"ANN_NLIST_{suffix}", ANN_NLIST)),
+        "nprobe": int(os.getenv(f"ANN_NPROBE_{suffix}", ANN_NPROBE)),
+    }
+
+def ids_digest(ids) -> str:
+    """Fingerprint of the gallery row order an index was built against."""
+    h = hashlib.sha1()
+    for i in ids:
+        h.update(str(i).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _sq_dists(x: np.ndarray, c: np.ndarray, c_sq: np.ndarray) -> np.ndarray:
+    # |x - c|^2 without the |x|^2 term, which is constant per row
+    return c_sq[None, :] - 2.0 * (x @ c.T)
+
+def _assign(x: np.ndarray, c: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    c_sq = np.einsum("ij,ij->i", c, c)
+    out = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), chunk):
+        out[start:start + chunk] = np.argmin(_sq_dists(x[start:start + chunk], c, c_sq), axis=1)
+    return out
+
+def kmeans(x: np.ndarray, k: int, iters: int = 20, seed: int = 0) -> np.ndarray:
+    """Plain Lloyd's k-means; empty clusters are re-seeded from random points."""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iters):
+        labels = _assign(x, centroids)
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+        # per-cluster sums via one sort + reduceat
+        order = np.argsort(labels, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[~empty]
+        centroids[~empty] = np.add.reduceat(x[order], starts, axis=0) / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+    return centroids
+
+class IVFIndex:
+    """
+    Inverted-file index: rows are bucketed by their nearest k-means centroid.
+    A query scans only the rows in its `nprobe` nearest buckets; the caller
+    computes exact distances over those candidate rows.
+       order   : row numbers grouped by bucket
+       offsets : bucket b holds order[offsets[b]:offsets[b + 1]]
+    """
+
+    def __init__(self, centroids, order, offsets, digest: str = ""):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.centroid_sq = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        self.order = np.asarray(order, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.digest = digest
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, nlist: int = 0, iters: int = 20, seed: int = 0,
+              digest: str = "") -> "IVFIndex":
+        x = np.ascontiguousarray(matrix, dtype=np.float32)
+        n = len(x)
+        if nlist <= 0:
+            nlist = int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        # train on a sample; ~256 points per centroid is plenty
+        rng = np.random.default_rng(seed)
+        train = x if n <= 256 * nlist else x[rng.choice(n, size=256 * nlist, replace=False)]
+        centroids = kmeans(train, nlist, iters=iters, seed=seed)
+        labels = _assign(x, centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+        return cls(centroids, order, offsets, digest)
+
+    def candidates(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        """Row numbers in the nprobe buckets nearest to q."""
+        nprobe = max(1, min(nprobe, self.nlist))
+        d = self.centroid_sq - 2.0 * (self.centroids @ q)
+        if nprobe < self.nlist:
+            probe = np.argpartition(d, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.nlist)
+        return np.concatenate([self.order[self.offsets[b]:self.offsets[b + 1]] for b in probe])
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(tmp, centroids=self.centroids, order=self.order,
+                 offsets=self.offsets, digest=np.array(self.digest))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex":
+        with np.load(path) as z:
+            return cls(z["centroids"], z["order"], z["offsets"], str(z["digest"]))
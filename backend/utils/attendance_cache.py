@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+import numpy as np
+from backend.utils import detection
+
+# How long an "already marked" entry is trusted before we ask the DB again
+MARKED_TTL_SECONDS = float(os.getenv("MARKED_TTL_SECONDS", "900"))
+MARKED_MAX_ENTRIES = int(os.getenv("MARKED_MAX_ENTRIES", "100000"))
+# A kiosk frame this similar to the previous one (mean abs difference of a
+# normalised 16x16 thumbnail), with its face detected where the previous
+# one was, reuses the previous match without re-encoding. Frames flatter
+# than FRAME_REUSE_MIN_STD grey levels (covered or dark camera) never do:
+# normalising them amplifies noise and any two of them look alike.
+FRAME_REUSE_SECONDS = float(os.getenv("FRAME_REUSE_SECONDS", "10"))
+FRAME_REUSE_MAX_DIFF = float(os.getenv("FRAME_REUSE_MAX_DIFF", "0.15"))
+FRAME_REUSE_MIN_STD = float(os.getenv("FRAME_REUSE_MIN_STD", "8"))
+FRAME_REUSE_MIN_IOU = float(os.getenv("FRAME_REUSE_MIN_IOU", "0.6"))
+
+class MarkedCache:
+    """
+    TTL cache of attendance keys (role, person_id, date, class_id) already written.
+    Backed by the unique indexes on the attendance tables: a miss here only
+    costs an INSERT OR IGNORE, never a duplicate row.
+    """
+
+    def __init__(self, ttl: float = MARKED_TTL_SECONDS, max_entries: int = MARKED_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires < now:
+                del self._entries[key]
+                return False
+            return True
+
+    def add(self, key) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._evict(now)
+            self._entries[key] = now + self.ttl
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self, now: float) -> None:
+        expired = [k for k, exp in self._entries.items() if exp < now]
+        for k in expired:
+            del self._entries[k]
+        if len(self._entries) >= self.max_entries:
+            # still full: drop the oldest half (dicts keep insertion order)
+            for k in list(self._entries)[: len(self._entries) // 2]:
+                del self._entries[k]
+
+def frame_signature(img: np.ndarray, min_std: float = FRAME_REUSE_MIN_STD):
+    """
+    Cheap 16x16 grayscale thumbnail, normalised for brightness and contrast;
+    None for a frame too flat to compare.
+    """
+    h, w = img.shape[:2]
+    gray = img.mean(axis=2) if img.ndim == 3 else img.astype(np.float32)
+    ys = np.linspace(0, h - 1, 16).astype(int)
+    xs = np.linspace(0, w - 1, 16).astype(int)
+    thumb = gray[np.ix_(ys, xs)].astype(np.float32)
+    std = float(thumb.std())
+    if std < min_std:
+        return None
+    return (thumb - thumb.mean()) / std
+
+class RecentFrames:
+    """
+    Last matched frame per kiosk, so a person standing still is not
+    re-encoded. Only consulted once a face has been detected in the new
+    frame, and only if its box overlaps the remembered one.
+    """
+
+    def __init__(self, ttl: float = FRAME_REUSE_SECONDS, max_diff: float = FRAME_REUSE_MAX_DIFF,
+                 min_iou: float = FRAME_REUSE_MIN_IOU):
+        self.ttl = ttl
+        self.max_diff = max_diff
+        self.min_iou = min_iou
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, kiosk, signature, box):
+        if kiosk is None or signature is None or self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(kiosk)
+        if entry is None:
+            return None
+        sig, cached_box, matched, expires = entry
+        if (expires < time.monotonic() or float(np.abs(sig - signature).mean()) > self.max_diff
+                or detection.iou(box, cached_box) < self.min_iou):
+            return None
+        return matched
+
+    def remember(self, kiosk, signature, box, matched) -> None:
+        if kiosk is None or signature is None or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[kiosk] = (signature, tuple(box), matched, time.monotonic() + self.ttl)
+
+marked = MarkedCache()
+recent_frames = RecentFrames()
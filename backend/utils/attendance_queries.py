@@ -0,0 +1,97 @@
+import csv
+import datetime
+import io
+import json
+from sqlalchemy import select, and_, or_
+from backend.database import read_engine
+from backend.models import ATTENDANCE_MODELS
+
+MAX_PAGE_SIZE = 5000
+EXPORT_CHUNK_ROWS = 1000
+
+def attendance_model(role: str):
+    """(model, person id column) for 'students' / 'teachers'; ValueError otherwise."""
+    try:
+        return ATTENDANCE_MODELS[role]
+    except KeyError:
+        raise ValueError(f"Unknown role: {role}")
+
+def filtered_select(role: str, date_from: datetime.date = None, date_to: datetime.date = None,
+                    person_id: str = None, class_id: str = None):
+    """
+    SELECT over one attendance table, ordered by (date, id) so every filter
+    combination is served by one of the (person, date), (class_id, date)
+    or (date) indexes.
+    """
+    model, id_col = attendance_model(role)
+    table = model.__table__
+    conds = []
+    if date_from:
+        conds.append(table.c.date >= date_from)
+    if date_to:
+        conds.append(table.c.date <= date_to)
+    if person_id:
+        conds.append(id_col == person_id)
+    if class_id:
+        conds.append(table.c.class_id == class_id)
+    stmt = select(table)
+    if conds:
+        stmt = stmt.where(and_(*conds))
+    return stmt.order_by(table.c.date, table.c.id)
+
+def encode_cursor(row) -> str:
+    return f"{row['date'].isoformat()}_{row['id']}"
+
+def decode_cursor(cursor: str):
+    try:
+        day, row_id = cursor.split("_", 1)
+        return datetime.date.fromisoformat(day), int(row_id)
+    except ValueError:
+        raise ValueError("Bad cursor")
+
+def page(conn, role: str, limit: int, cursor: str = None, **filters) -> dict:
+    """
+    One keyset page: rows strictly after `cursor` in (date, id) order.
+    Returns {"rows": [...], "next_cursor": str | None}.
+    """
+    model, _ = attendance_model(role)
+    table = model.__table__
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    stmt = filtered_select(role, **filters)
+    if cursor:
+        day, row_id = decode_cursor(cursor)
+        stmt = stmt.where(or_(table.c.date > day, and_(table.c.date == day, table.c.id > row_id)))
+    rows = [dict(r._mapping) for r in conn.execute(stmt.limit(limit + 1))]
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"rows": rows[:limit], "next_cursor": next_cursor}
+
+def _jsonable(row: dict) -> dict:
+    return {k: (v.isoformat() if isinstance(v, (datetime.date, datetime.time)) else v)
+            for k, v in row.items()}
+
+def export_rows(role: str, fmt: str, **filters):
+    """
+    Generator of CSV or NDJSON text chunks for every matching row. Uses its
+    own connection and a streaming cursor, so memory stays constant no
+    matter how many rows match.
+    """
+    stmt = filtered_select(role, **filters)
+    with read_engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_ROWS).execute(stmt)
+        columns = list(result.keys())
+        buf = io.StringIO()
+        writer = csv.writer(buf) if fmt == "csv" else None
+        if writer:
+            writer.writerow(columns)
+        for rows in result.partitions(EXPORT_CHUNK_ROWS):
+            for r in rows:
+                if writer:
+                    writer.writerow(r)
+                else:
+                    buf.write(json.dumps(_jsonable(dict(r._mapping))))
+                    buf.write("\n")
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+        if buf.tell():
+            yield buf.getvalue()
@@ -0,0 +1,115 @@
+import asyncio
+import datetime
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from sqlalchemy import bindparam, func, insert, select
+from backend.database import engine
+from backend.models import ATTENDANCE_MODELS
+from backend.utils import rollups, metrics
+
+# A batch is committed when it reaches this many rows or has waited this long
+WRITER_MAX_BATCH = int(os.getenv("ATTENDANCE_WRITER_MAX_BATCH", "256"))
+WRITER_MAX_DELAY_MS = float(os.getenv("ATTENDANCE_WRITER_MAX_DELAY_MS", "5"))
+
+# INSERT OR IGNORE: the (person, date, class) unique index decides what is a duplicate
+_INSERTS = {role: (insert(model).prefix_with("OR IGNORE"), col.key)
+            for role, (model, col) in ATTENDANCE_MODELS.items()}
+# rows the person has that day, to tell a new present day from another session
+_DAY_ROWS = {role: select(func.count()).select_from(model)
+                   .where(col == bindparam("person_id"), model.date == bindparam("date"))
+             for role, (model, col) in ATTENDANCE_MODELS.items()}
+
+WRITER_COMMIT_SECONDS = metrics.Histogram(
+    "attendance_writer_commit_seconds", "Time to write and commit one attendance batch")
+WRITER_BATCH_ROWS = metrics.Histogram(
+    "attendance_writer_batch_rows", "Rows per attendance batch", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+ATTENDANCE_MARKS = metrics.Counter(
+    "attendance_marks_total", "Attendance marks by role and result (inserted, duplicate, cached)",
+    ["role", "result"])
+
+class AttendanceWriter:
+    """
+    Single writer thread for attendance rows. Requests from every kiosk are
+    queued and written in batches, one transaction (and one fsync) per batch,
+    instead of one commit per recognition. Each submitted row resolves to
+    True if it was inserted, False if the (person, date, class_id) row
+    already existed. Rollups for inserted rows are updated in the same
+    transaction.
+    """
+
+    def __init__(self, max_batch: int = WRITER_MAX_BATCH, max_delay_ms: float = WRITER_MAX_DELAY_MS):
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="attendance-writer", daemon=True)
+                    self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, role: str, person_id: str, when: datetime.datetime, status: str = "Present",
+               class_id: str = None) -> Future:
+        if role not in _INSERTS:
+            raise ValueError(f"Unknown role: {role}")
+        self._ensure_thread()
+        fut = Future()
+        self._queue.put((role, person_id, when, status, class_id, fut))
+        return fut
+
+    async def write(self, role: str, person_id: str, when: datetime.datetime, status: str = "Present",
+                    class_id: str = None) -> bool:
+        return await asyncio.wrap_future(self.submit(role, person_id, when, status, class_id))
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch: list) -> None:
+        results = []
+        t0 = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                for role, person_id, when, status, class_id, _ in batch:
+                    stmt, id_col = _INSERTS[role]
+                    params = {id_col: person_id, "date": when.date(),
+                              "time": when.time().replace(microsecond=0),
+                              "status": status, "class_id": class_id}
+                    inserted = conn.execute(stmt, params).rowcount > 0
+                    if inserted:
+                        new_day = conn.execute(_DAY_ROWS[role], {"person_id": person_id,
+                                                                 "date": when.date()}).scalar() == 1
+                        rollups.record(conn, role, person_id, when.date(), class_id, new_day)
+                    results.append(inserted)
+        except Exception as exc:
+            for *_, fut in batch:
+                fut.set_exception(exc)
+            return
+        WRITER_COMMIT_SECONDS.observe(time.perf_counter() - t0)
+        WRITER_BATCH_ROWS.observe(len(batch))
+        for (role, *_, fut), inserted in zip(batch, results):
+            ATTENDANCE_MARKS.inc(role=role, result="inserted" if inserted else "duplicate")
+            fut.set_result(inserted)
+
+writer = AttendanceWriter()
+metrics.Gauge("attendance_writer_queue_depth", "Attendance rows waiting for the writer", fn=lambda: writer.depth)
@@ -0,0 +1,90 @@
+import os
+import threading
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+try:
+    import cv2
+except ImportError:  # the Haar pre-filter is optional
+    cv2 = None
+
+# Kiosk frames: decode JPEGs at reduced size (PIL draft mode) and run the
+# detector on a further downscaled copy; boxes are mapped back to the
+# decoded image for encoding. 0 disables a limit.
+DECODE_MAX_WIDTH = int(os.getenv("DECODE_MAX_WIDTH", "640"))
+DETECT_MAX_WIDTH = int(os.getenv("DETECT_MAX_WIDTH", "320"))
+# Classroom photos have small faces: full resolution unless configured
+GROUP_DECODE_MAX_WIDTH = int(os.getenv("GROUP_DECODE_MAX_WIDTH", "0"))
+GROUP_DETECT_MAX_WIDTH = int(os.getenv("GROUP_DETECT_MAX_WIDTH", "0"))
+DETECTION_MODEL = os.getenv("DETECTION_MODEL", "hog")  # 'hog' or 'cnn'
+DETECTION_UPSAMPLE = int(os.getenv("DETECTION_UPSAMPLE", "1"))
+# 'haar' rejects faceless kiosk frames before the dlib detector runs; 'none' disables it
+DETECTION_PREFILTER = os.getenv("DETECTION_PREFILTER", "haar")
+HAAR_MAX_WIDTH = int(os.getenv("HAAR_MAX_WIDTH", "320"))
+HAAR_MIN_NEIGHBORS = int(os.getenv("HAAR_MIN_NEIGHBORS", "3"))
+
+_haar = threading.local()  # CascadeClassifier instances are not shared across threads
+
+def load_image(img_bytes: bytes, max_width: int = DECODE_MAX_WIDTH) -> np.ndarray:
+    """RGB uint8 array, decoded no wider than max_width; raises on undecodable input."""
+    img = Image.open(BytesIO(img_bytes))
+    if max_width and img.width > max_width:
+        # JPEG only: lets libjpeg decode at 1/2, 1/4 or 1/8 scale directly
+        img.draft("RGB", (max_width, max(1, img.height * max_width // img.width)))
+    img = img.convert("RGB")
+    if max_width and img.width > max_width:
+        img.thumbnail((max_width, img.height), Image.BILINEAR)
+    return np.array(img)
+
+def _downscale(img: np.ndarray, max_width: int):
+    h, w = img.shape[:2]
+    if not max_width or w <= max_width:
+        return img, 1.0
+    scale = w / max_width
+    small = Image.fromarray(img).resize((max_width, max(1, round(h / scale))), Image.BILINEAR)
+    return np.asarray(small), scale
+
+def _cascade():
+    if not hasattr(_haar, "cascade"):
+        _haar.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    return _haar.cascade
+
+def maybe_has_face(img: np.ndarray) -> bool:
+    """Cheap Haar check on a small grayscale copy; True when the pre-filter is off or unavailable."""
+    if DETECTION_PREFILTER != "haar" or cv2 is None:
+        return True
+    small, _ = _downscale(img, HAAR_MAX_WIDTH)
+    gray = cv2.equalizeHist(cv2.cvtColor(small, cv2.COLOR_RGB2GRAY))
+    faces = _cascade().detectMultiScale(gray, scaleFactor=1.2, minNeighbors=HAAR_MIN_NEIGHBORS,
+                                        minSize=(24, 24))
+    return len(faces) > 0
+
+def face_locations(img: np.ndarray, max_width: int = DETECT_MAX_WIDTH) -> list:
+    """
+    Face boxes (top, right, bottom, left) in img coordinates, detected on a
+    copy no wider than max_width with the configured model and upsampling.
+    """
+    # imported on first use: it loads dlib's models, which app startup should not wait for
+    import face_recognition
+    small, scale = _downscale(img, max_width)
+    locs = face_recognition.face_locations(small, number_of_times_to_upsample=DETECTION_UPSAMPLE,
+                                           model=DETECTION_MODEL)
+    if scale == 1.0:
+        return locs
+    h, w = img.shape[:2]
+    return [(max(0, round(t * scale)), min(w, round(r * scale)),
+             min(h, round(b * scale)), max(0, round(l * scale))) for t, r, b, l in locs]
+
+def largest(locs: list):
+    return max(locs, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]))
+
+def iou(a, b) -> float:
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    inter_h = min(a[2], b[2]) - max(a[0], b[0])
+    inter_w = min(a[1], b[1]) - max(a[3], b[3])
+    if inter_h <= 0 or inter_w <= 0:
+        return 0.0
+    inter = inter_h * inter_w
+    union = (a[2] - a[0]) * (a[1] - a[3]) + (b[2] - b[0]) * (b[1] - b[3]) - inter
+    return inter / union
@@ -1,29 +1,150 @@
 from pathlib import Path
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import face_recognition
+from backend.utils.ann import IVFIndex, ann_settings, ids_digest, ANN_KMEANS_ITERS
+from backend.utils import store, encoders, metrics
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATASET_DIR = BASE_DIR / "dataset"
 EMB_DIR = BASE_DIR / "embeddings"
 EMB_DIR.mkdir(parents=True, exist_ok=True)
 
+# Processes used to encode images during a rebuild (1 = sequential)
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1"))
+# How often get_gallery looks at the gallery files for a new generation;
+# bounds how long another worker's rebuild takes to become visible here
+GALLERY_CHECK_SECONDS = float(os.getenv("GALLERY_CHECK_SECONDS", "0.5"))
+# Class-scoped sub-galleries kept per loaded gallery (see Gallery.subset)
+GALLERY_MAX_SUBSETS = int(os.getenv("GALLERY_MAX_SUBSETS", "256"))
+
+EMBEDDING_IMAGES_ENCODED = metrics.Counter(
+    "embedding_images_encoded_total", "Dataset images decoded and encoded by rebuilds", ["role"])
+
 def _role_dir(role: str) -> Path:
     # role is 'students' or 'teachers'
     return DATASET_DIR / role
 
-def build_embeddings_for(role: str) -> int:
+def _image_cache_file(role: str) -> Path:
+    return EMB_DIR / f"{role[:-1]}_image_cache.npy"
+
+def _load_image_cache(role: str) -> dict:
+    """
+    Per-image encodings from previous builds:
+       { "<person_dir>/<file>": {"sha1": str, "mtime_ns": int, "size": int,
+                                 "encodings": [ndarray, ...], "model": encoder name} }
+    """
+    return _load_dict(_image_cache_file(role))
+
+def _load_dict(f: Path) -> dict:
+    if not f.exists():
+        return {}
+    try:
+        return np.load(f, allow_pickle=True).item()
+    except Exception:
+        return {}
+
+def _save_dict(f: Path, data: dict) -> None:
+    tmp = f.with_suffix(".tmp.npy")
+    np.save(tmp, data)
+    os.replace(tmp, f)
+
+def _save_image_cache(role: str, cache: dict) -> None:
+    _save_dict(_image_cache_file(role), cache)
+
+# serialises read-modify-write of the image cache and upload sidecars
+def _image_cache_lock(role: str):
+    # a file lock: uploads and rebuilds may run in different worker processes
+    return store.role_lock(EMB_DIR, role, "cache")
+
+# Uploads do not touch the role-wide cache (its size grows with the school):
+# each dataset folder has a sidecar of the entries ingest computed for it,
+# keyed by file name, which the next rebuild merges into the cache.
+def _uploads_dir(role: str) -> Path:
+    return EMB_DIR / f"{role[:-1]}_uploads"
+
+def _uploads_file(role: str, person_dir: str) -> Path:
+    return _uploads_dir(role) / f"{person_dir}.npy"
+
+def image_cache_entries(role: str, person_dir: str) -> dict:
+    """Entries uploads stored for one dataset folder, keyed by file name."""
+    return _load_dict(_uploads_file(role, person_dir))
+
+def update_image_cache(role: str, person_dir: str, entries: dict) -> None:
+    """Add per-image entries computed outside a rebuild (at upload) to the folder's sidecar."""
+    f = _uploads_file(role, person_dir)
+    f.parent.mkdir(parents=True, exist_ok=True)
+    with _image_cache_lock(role):
+        sidecar = _load_dict(f)
+        sidecar.update(entries)
+        _save_dict(f, sidecar)
+
+def _encode_image(img_path: Path) -> list:
+    import face_recognition
+    try:
+        img = face_recognition.load_image_file(str(img_path))
+        locs = face_recognition.face_locations(img)
+        if not locs:
+            return []
+        return encoders.get_encoder().encode(img, locs)
+    except Exception:
+        return []
+
+def _encode_many(paths: list, workers: int, progress=None) -> list:
+    """
+    Encodings for each path, in order; uses a process pool when workers > 1.
+    progress(done, total) is called after each image.
+    """
+    total = len(paths)
+    if workers <= 1 or total < 2:
+        results = []
+        for p in paths:
+            results.append(_encode_image(p))
+            if progress:
+                progress(len(results), total)
+        return results
+    workers = min(workers, total)
+    chunksize = max(1, total // (workers * 4))
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for encs in pool.map(_encode_image, paths, chunksize=chunksize):
+            results.append(encs)
+            if progress:
+                progress(len(results), total)
+    return results
+
+def build_embeddings_for(role: str, full: bool = False, workers: int = None, progress=None) -> int:
     """
     role => 'students' or 'teachers'
     Scans dataset/<role>/* and creates a dict:
        { id: {"name": name, "embedding": ndarray} }
-    Saves to embeddings/student_embeddings.npy or teacher_embeddings.npy
+    Saves it as the role's gallery (embeddings/student_gallery.* or
+    teacher_gallery.*, see backend.utils.store).
     Returns number of identities processed.
+
+    Encodings are cached per image (keyed by path + content hash), so only
+    new or changed images are decoded and encoded; the mean is recomputed
+    only for identities whose images changed. full=True ignores the cache.
+    Images that need encoding are spread over `workers` processes
+    (default EMBEDDING_WORKERS); the result is identical to a sequential build.
+    progress(done, total) is called as images are encoded. The new gallery
+    is written atomically and swapped in in-process once complete.
     """
     base = _role_dir(role)
     enc_map = {}
     if not base.exists():
         return 0
-    for person in base.iterdir():
+    if workers is None:
+        workers = EMBEDDING_WORKERS
+    encoder = encoders.get_encoder()
+    cache = {} if full else _load_image_cache(role)
+    previous = {} if full else load_embeddings(role)
+    new_cache = {}
+    people = []  # (pid, name, [keys], changed)
+    todo = []    # (key, path, stat, sha1) for images that must be encoded
+    for person in sorted(base.iterdir()):
         if not person.is_dir():
             continue
         parts = person.name.split("_")
@@ -31,44 +152,306 @@ def build_embeddings_for(role: str) -> int:
             continue
         pid = parts[0]
         name = "_".join(parts[1:])
-        encs = []
-        for img_path in person.glob("*.*"):
-            try:
-                img = face_recognition.load_image_file(str(img_path))
-                locs = face_recognition.face_locations(img)
-                if not locs:
-                    continue
-                encs.extend(face_recognition.face_encodings(img, locs))
-            except Exception:
-                continue
+        prefix = person.name + "/"
+        before = {k for k in cache if k.startswith(prefix)}
+        uploaded = {} if full else image_cache_entries(role, person.name)
+        changed = False
+        keys = []
+        for img_path in sorted(person.glob("*.*")):
+            key = prefix + img_path.name
+            keys.append(key)
+            st = img_path.stat()
+            entry = cache.get(key)
+            up = uploaded.get(img_path.name)
+            if up and (entry is None or (up["mtime_ns"], up["size"]) == (st.st_mtime_ns, st.st_size)):
+                entry = up
+                changed = changed or key not in cache
+            if entry and entry.get("model", "dlib") != encoder.name:
+                entry = None  # encoded by another backend (ENCODER_BACKEND changed)
+            if entry and (entry["mtime_ns"], entry["size"]) != (st.st_mtime_ns, st.st_size):
+                # touched on disk; trust the content hash, not the timestamp
+                sha1 = store.file_sha1(img_path)
+                entry = dict(entry, mtime_ns=st.st_mtime_ns, size=st.st_size) if entry["sha1"] == sha1 else None
+            if entry is None:
+                todo.append((key, img_path, st, store.file_sha1(img_path)))
+                changed = True
+            else:
+                new_cache[key] = entry
+        if before - set(keys):
+            changed = True  # images removed from this identity
+        people.append((pid, name, keys, changed))
+
+    with metrics.stage("encode"):
+        encoded = _encode_many([t[1] for t in todo], workers, progress)
+    EMBEDDING_IMAGES_ENCODED.inc(len(todo), role=role)
+    for (key, _, st, sha1), encs in zip(todo, encoded):
+        new_cache[key] = {"sha1": sha1, "mtime_ns": st.st_mtime_ns,
+                          "size": st.st_size, "encodings": encs, "model": encoder.name}
+
+    for pid, name, keys, changed in people:
+        prev = previous.get(pid)
+        if not changed and prev is not None and prev.get("name") == name:
+            enc_map[pid] = prev
+            continue
+        encs = [e for k in keys for e in new_cache[k]["encodings"]]
         if encs:
             enc_map[pid] = {"name": name, "embedding": np.mean(encs, axis=0)}
-    save_file = EMB_DIR / f"{role[:-1]}_embeddings.npy"  # student_embeddings.npy
-    np.save(save_file, enc_map)
+    ids, names, matrix = store.rows_from_dict(enc_map)
+    with metrics.stage("write"):
+        header = store.write_gallery(EMB_DIR, role, ids, names, matrix, model=encoder.name)
+        # serve the mapped generation, like every other worker, rather than a private copy
+        _, ids, names, matrix = store.open_gallery(EMB_DIR, role, header)
+    g = Gallery(ids, names, matrix, model=encoder.name, generation=header["generation"])
+    with _image_cache_lock(role):
+        _save_image_cache(role, new_cache)
+        # sidecars of deleted folders; the others stay for the next upload's dedupe
+        if _uploads_dir(role).exists():
+            for f in _uploads_dir(role).glob("*.npy"):
+                if not (base / f.stem).is_dir():
+                    f.unlink(missing_ok=True)
+    with metrics.stage("index"):
+        _publish_gallery(role, g)
     return len(enc_map)
 
 def load_embeddings(role: str) -> dict:
-    f = EMB_DIR / f"{role[:-1]}_embeddings.npy"
+    """
+    The role's embeddings as { id: {"name": name, "embedding": ndarray} },
+    from the gallery store, or from a legacy pickled .npy if not converted yet.
+    """
+    opened = store.open_gallery(EMB_DIR, role)
+    if opened is not None:
+        _, ids, names, matrix = opened
+        return {pid: {"name": name, "embedding": np.array(row)}
+                for pid, name, row in zip(ids, names, matrix)}
+    f = _embeddings_file(role)
     if not f.exists():
         return {}
     return np.load(f, allow_pickle=True).item()
 
+def _embeddings_file(role: str) -> Path:
+    # legacy pickled dict (student_embeddings.npy); only read, never written
+    return EMB_DIR / f"{role[:-1]}_embeddings.npy"
+
+
+class Gallery:
+    """
+    In-memory view of one role's embeddings:
+       ids / names : lists aligned with the rows of `matrix`
+       matrix      : contiguous float32 array, one embedding per row
+    Squared norms of the rows are precomputed so a match is a single
+    matrix-vector product plus argmin. With an IVF index attached, only the
+    rows in the query's nprobe nearest buckets are scanned.
+    """
+
+    def __init__(self, ids, names, matrix, stamp=None, version=0, model=None, generation=0):
+        self.ids = list(ids)
+        self.names = list(names)
+        # a float32 memmap from the store is used as-is, without copying
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.model = model
+        self.generation = generation  # store generation it was mapped from; 0 for legacy/in-memory
+        self.sq_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        self.stamp = stamp
+        self.version = version
+        self.index = None
+        self.nprobe = 0
+        self._rows = None
+        self._subsets = {}
+
+    def attach_index(self, index: IVFIndex, nprobe: int) -> bool:
+        """Use index for matching if it was built against this row order."""
+        if index.digest != ids_digest(self.ids) or len(index.order) != len(self.ids):
+            return False
+        self.index, self.nprobe = index, nprobe
+        return True
+
+    @classmethod
+    def from_dict(cls, data: dict, stamp=None, version=0) -> "Gallery":
+        # legacy embeddings files predate the other encoders: always dlib
+        ids, names, matrix = store.rows_from_dict(data)
+        return cls(ids, names, matrix, stamp=stamp, version=version, model="dlib")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def subset(self, ids: frozenset) -> "Gallery":
+        """
+        Gallery of just the given identities (those present here), e.g. a
+        class roster. Cached on this Gallery, so the cache goes with it when
+        a new generation is loaded.
+        """
+        sub = self._subsets.get(ids)
+        if sub is None:
+            if self._rows is None:
+                self._rows = {pid: i for i, pid in enumerate(self.ids)}
+            rows = sorted(self._rows[pid] for pid in ids if pid in self._rows)
+            sub = Gallery([self.ids[i] for i in rows], [self.names[i] for i in rows],
+                          self.matrix[rows].reshape(len(rows), self.matrix.shape[1]),
+                          model=self.model, generation=self.generation)
+            if len(self._subsets) >= GALLERY_MAX_SUBSETS:
+                self._subsets.clear()
+            self._subsets[ids] = sub
+        return sub
+
+    def distances(self, face_encoding) -> np.ndarray:
+        """Euclidean distance from one encoding to every identity."""
+        q = np.asarray(face_encoding, dtype=np.float32).reshape(-1)
+        d2 = self.sq_norms - 2.0 * (self.matrix @ q) + float(q @ q)
+        return np.sqrt(np.maximum(d2, 0.0))
+
+    def _nearest(self, q: np.ndarray):
+        """(row, distance) of the closest identity, via the index when present."""
+        rows = self.index.candidates(q, self.nprobe) if self.index is not None else None
+        if rows is None or rows.size == 0:
+            # no index, or every probed bucket is empty (k-means can leave some): exact scan
+            d2 = self.sq_norms - 2.0 * (self.matrix @ q) + float(q @ q)
+            i = int(np.argmin(d2))
+            return i, float(np.sqrt(max(d2[i], 0.0)))
+        d2 = self.sq_norms[rows] - 2.0 * (self.matrix[rows] @ q) + float(q @ q)
+        j = int(np.argmin(d2))
+        return int(rows[j]), float(np.sqrt(max(d2[j], 0.0)))
+
+    def match(self, face_encoding, threshold: float = 0.6):
+        if not self.ids:
+            return None
+        i, dist = self._nearest(np.asarray(face_encoding, dtype=np.float32).reshape(-1))
+        if dist <= threshold:
+            return (self.ids[i], self.names[i], dist)
+        return None
+
+    def match_many(self, face_encodings, threshold: float = 0.6) -> list:
+        """
+        Match several encodings; exact search uses one (faces x identities)
+        distance matrix, indexed search probes per encoding.
+        Returns, per encoding, (id, name, distance) if matched, else
+        (None, None, best_distance) -- best_distance is None for an empty gallery.
+        """
+        if len(face_encodings) == 0:
+            return []
+        if not self.ids:
+            return [(None, None, None)] * len(face_encodings)
+        q = np.asarray(face_encodings, dtype=np.float32).reshape(len(face_encodings), -1)
+        if self.index is not None:
+            nearest = [self._nearest(row) for row in q]
+        else:
+            d2 = self.sq_norms[None, :] - 2.0 * (q @ self.matrix.T) + np.einsum("ij,ij->i", q, q)[:, None]
+            d = np.sqrt(np.maximum(d2, 0.0))
+            best = np.argmin(d, axis=1)
+            nearest = [(int(i), float(d[row, i])) for row, i in enumerate(best)]
+        out = []
+        for i, dist in nearest:
+            if dist <= threshold:
+                out.append((self.ids[i], self.names[i], dist))
+            else:
+                out.append((None, None, dist))
+        return out
+
+
+_galleries: dict = {}
+_versions: dict = {}
+_checked: dict = {}  # role -> time.monotonic() of the last file check
+_gallery_lock = threading.Lock()
+metrics.Gauge("gallery_identities", "Identities in the loaded gallery", ["role"],
+              fn=lambda: {(role,): len(g) for role, g in list(_galleries.items())})
+metrics.Gauge("gallery_generation", "Store generation of the gallery this process is serving", ["role"],
+              fn=lambda: {(role,): g.generation for role, g in list(_galleries.items())})
+
+def _index_file(role: str) -> Path:
+    return EMB_DIR / f"{role[:-1]}_ivf.npz"
+
+def _build_index(role: str, gallery: Gallery) -> None:
+    """
+    Build (or remove) the role's IVF index next to its embeddings file.
+    Small galleries, and roles with ANN_INDEX_<ROLE> != 'ivf', use exact search.
+    """
+    settings = ann_settings(role)
+    f = _index_file(role)
+    if settings["kind"] != "ivf" or len(gallery) < settings["min_identities"]:
+        f.unlink(missing_ok=True)
+        return
+    index = IVFIndex.build(gallery.matrix, nlist=settings["nlist"], iters=ANN_KMEANS_ITERS,
+                           digest=ids_digest(gallery.ids))
+    index.save(f)
+    gallery.attach_index(index, settings["nprobe"])
+
+def _load_index(role: str, gallery: Gallery) -> None:
+    settings = ann_settings(role)
+    f = _index_file(role)
+    if settings["kind"] != "ivf" or len(gallery) < settings["min_identities"] or not f.exists():
+        return
+    try:
+        gallery.attach_index(IVFIndex.load(f), settings["nprobe"])
+    except Exception:
+        pass  # unreadable index: fall back to exact search
+
+def _gallery_stamp(role: str):
+    return (_file_stamp(store.header_file(EMB_DIR, role)),
+            _file_stamp(_embeddings_file(role)),
+            _file_stamp(_index_file(role)))
+
+def _load_gallery(role: str, stamp, version) -> Gallery:
+    opened = store.open_gallery(EMB_DIR, role) if stamp[0] is not None else None
+    if opened is not None:
+        header, ids, names, matrix = opened
+        return Gallery(ids, names, matrix, stamp=stamp, version=version, model=header["model"],
+                       generation=header["generation"])
+    data = load_embeddings(role) if stamp[1] is not None else {}
+    return Gallery.from_dict(data, stamp=stamp, version=version)
+
+def _file_stamp(f: Path):
+    try:
+        st = f.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def invalidate_gallery(role: str) -> None:
+    """Force the next get_gallery(role) to reload from disk."""
+    with _gallery_lock:
+        _versions[role] = _versions.get(role, 0) + 1
+
+def _publish_gallery(role: str, g: Gallery) -> None:
+    """Build the role's index and swap in the new gallery without re-reading it."""
+    _build_index(role, g)
+    with _gallery_lock:
+        g.stamp = _gallery_stamp(role)
+        g.version = _versions.get(role, 0)
+        _galleries[role] = g
+        _checked[role] = time.monotonic()
+
+def get_gallery(role: str) -> Gallery:
+    """
+    Cached Gallery for role. The gallery files are stat'ed at most every
+    GALLERY_CHECK_SECONDS; it is reloaded only when the header (a new
+    generation, possibly written by another worker process), legacy
+    embeddings or index file changed, or invalidate_gallery(role) bumped
+    the version. Reloading maps the new generation's matrix (no copy) and
+    swaps the Gallery object in one assignment, so a match in flight keeps
+    using the generation it started with.
+    """
+    version = _versions.get(role, 0)
+    g = _galleries.get(role)
+    now = time.monotonic()
+    if g is not None and g.version == version and now - _checked.get(role, 0.0) < GALLERY_CHECK_SECONDS:
+        return g
+    stamp = _gallery_stamp(role)
+    _checked[role] = now
+    if g is not None and g.stamp == stamp and g.version == version:
+        return g
+    with _gallery_lock:
+        g = _galleries.get(role)
+        version = _versions.get(role, 0)
+        if g is not None and g.stamp == stamp and g.version == version:
+            return g
+        g = _load_gallery(role, stamp, version)
+        _load_index(role, g)
+        _galleries[role] = g
+        return g
+
 def match_embedding(face_encoding, role: str, threshold: float = 0.6):
     """
     face_encoding: numpy array
     role: 'students' or 'teachers'
     returns tuple (id, name, distance) if matched else None
     """
-    data = load_embeddings(role)
-    if not data:
-        return None
-    best = None
-    best_d = 1e9
-    for pid, rec in data.items():
-        d = float(np.linalg.norm(face_encoding - rec["embedding"]))
-        if d < best_d:
-            best_d = d
-            best = (pid, rec["name"], d)
-    if best and best[2] <= threshold:
-        return best
-    return None
+    return get_gallery(role).match(face_encoding, threshold)
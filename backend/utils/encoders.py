@@ -0,0 +1,271 @@
+"""
+Face encoder backends.
+
+    dlib          face_recognition's ResNet (128-d); the default
+    facenet       facenet-pytorch InceptionResnetV1 / vggface2 (512-d), eager fp32
+    facenet-int8  the same network with int8 dynamic quantization: ONNX run by
+                  onnxruntime (Conv and MatMul quantized), or, without
+                  onnxruntime, TorchScript with torch's quantize_dynamic
+                  (Linear layers only, so a smaller gain)
+
+    python -m backend.utils.encoders export
+    python -m backend.utils.encoders check --images fixtures/faces
+
+`check` encodes a fixture set (one folder per person, like dataset/) with
+fp32 and int8, reports distance drift, match agreement and faces/s per
+core, and writes an approval file only if the int8 model is within
+ENCODER_MIN_AGREEMENT / ENCODER_MAX_DRIFT. facenet-int8 refuses to load
+without an approval for the exact artifact on disk, so switching
+ENCODER_BACKEND to it is gated on that check.
+
+Galleries record the encoder that built them (store header "model");
+recognition refuses to match against a gallery from an incompatible one.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from backend.utils import store
+
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "dlib")
+ENCODER_DIR = Path(os.getenv("ENCODER_DIR", str(Path(__file__).resolve().parent.parent / "embeddings" / "encoders")))
+# intra-op threads per facenet forward pass; requests are already spread over the recognition pool
+ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", "1"))
+FACENET_THRESHOLD = float(os.getenv("FACENET_THRESHOLD", "1.0"))
+FACENET_MARGIN = float(os.getenv("FACENET_MARGIN", "0.2"))  # crop margin, fraction of the box side
+# facenet-int8 gate: top-1 agreement with fp32, and p95 embedding drift as a fraction of the threshold
+ENCODER_MIN_AGREEMENT = float(os.getenv("ENCODER_MIN_AGREEMENT", "0.99"))
+ENCODER_MAX_DRIFT = float(os.getenv("ENCODER_MAX_DRIFT", "0.1"))
+
+class EncoderNotApproved(RuntimeError):
+    """The quantized encoder has not passed the accuracy check for its current artifact."""
+
+class DlibEncoder:
+    name = "dlib"
+    dim = 128
+    threshold = 0.6
+    compatible = ("dlib",)
+
+    def encode(self, img: np.ndarray, boxes: list) -> list:
+        import face_recognition
+        return face_recognition.face_encodings(img, boxes)
+
+class FacenetEncoder:
+    name = "facenet"
+    dim = 512
+    compatible = ("facenet", "facenet-int8")
+
+    def __init__(self):
+        self.threshold = FACENET_THRESHOLD
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def _load(self):
+        import torch
+        from facenet_pytorch import InceptionResnetV1
+        if ENCODER_THREADS > 0:
+            torch.set_num_threads(ENCODER_THREADS)
+        return InceptionResnetV1(pretrained="vggface2").eval()
+
+    def crops(self, img: np.ndarray, boxes: list) -> np.ndarray:
+        """(N, 3, 160, 160) float32 face crops, standardised like facenet-pytorch's MTCNN output."""
+        h, w = img.shape[:2]
+        out = np.empty((len(boxes), 3, 160, 160), dtype=np.float32)
+        for i, (top, right, bottom, left) in enumerate(boxes):
+            m = FACENET_MARGIN * max(bottom - top, right - left) / 2
+            box = (max(0, int(left - m)), max(0, int(top - m)), min(w, int(right + m)), min(h, int(bottom + m)))
+            face = np.asarray(Image.fromarray(img).crop(box).resize((160, 160), Image.BILINEAR), dtype=np.float32)
+            out[i] = ((face - 127.5) / 128.0).transpose(2, 0, 1)
+        return out
+
+    def embed(self, batch: np.ndarray) -> np.ndarray:
+        import torch
+        with torch.no_grad():
+            return self.model(torch.from_numpy(batch)).numpy()
+
+    def encode(self, img: np.ndarray, boxes: list) -> list:
+        if not boxes:
+            return []
+        return list(self.embed(self.crops(img, boxes)))
+
+def approval_file() -> Path:
+    return ENCODER_DIR / "facenet-int8.approved.json"
+
+def _artifact():
+    """The quantized model to load: ONNX when onnxruntime is installed, else TorchScript."""
+    onnx_path = ENCODER_DIR / "facenet-int8.onnx"
+    if onnx_path.exists():
+        try:
+            import onnxruntime  # noqa: F401
+            return "onnx", onnx_path
+        except ImportError:
+            pass
+    ts_path = ENCODER_DIR / "facenet-int8.pt"
+    if ts_path.exists():
+        return "torchscript", ts_path
+    raise RuntimeError("No quantized facenet model; run `python -m backend.utils.encoders export`")
+
+class QuantizedFacenetEncoder(FacenetEncoder):
+    name = "facenet-int8"
+
+    def __init__(self, gated: bool = True):
+        super().__init__()
+        self.gated = gated
+
+    def _load(self):
+        kind, path = _artifact()
+        if self.gated:
+            try:
+                approved = json.loads(approval_file().read_text())
+            except (OSError, ValueError):
+                approved = {}
+            if approved.get("sha1") != store.file_sha1(path):
+                raise EncoderNotApproved(f"{path.name} has not passed `python -m backend.utils.encoders check`")
+        if kind == "onnx":
+            import onnxruntime as ort
+            opts = ort.SessionOptions()
+            if ENCODER_THREADS > 0:
+                opts.intra_op_num_threads = ENCODER_THREADS
+            return kind, ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+        import torch
+        if ENCODER_THREADS > 0:
+            torch.set_num_threads(ENCODER_THREADS)
+        return kind, torch.jit.load(str(path))
+
+    def embed(self, batch: np.ndarray) -> np.ndarray:
+        kind, model = self.model
+        if kind == "onnx":
+            return model.run(None, {model.get_inputs()[0].name: batch})[0]
+        import torch
+        with torch.no_grad():
+            return model(torch.from_numpy(batch)).numpy()
+
+BACKENDS = {"dlib": DlibEncoder, "facenet": FacenetEncoder, "facenet-int8": QuantizedFacenetEncoder}
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+def get_encoder(name: str = None):
+    """Shared encoder instance for name (default ENCODER_BACKEND); ValueError for unknown names."""
+    name = name or ENCODER_BACKEND
+    enc = _encoders.get(name)
+    if enc is None:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown encoder backend: {name}")
+        with _encoders_lock:
+            enc = _encoders.setdefault(name, BACKENDS[name]())
+    return enc
+
+def export_quantized(fmt: str = "auto") -> Path:
+    """Export InceptionResnetV1 with int8 dynamic quantization; invalidates any previous approval."""
+    import torch
+    from facenet_pytorch import InceptionResnetV1
+    ENCODER_DIR.mkdir(parents=True, exist_ok=True)
+    approval_file().unlink(missing_ok=True)
+    model = InceptionResnetV1(pretrained="vggface2").eval()
+    example = torch.zeros(1, 3, 160, 160)
+    if fmt in ("auto", "onnx"):
+        try:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+        except ImportError:
+            if fmt == "onnx":
+                raise
+        else:
+            fp32 = ENCODER_DIR / "facenet-fp32.onnx"
+            torch.onnx.export(model, example, str(fp32), input_names=["faces"], output_names=["embeddings"],
+                              dynamic_axes={"faces": {0: "n"}, "embeddings": {0: "n"}}, opset_version=13)
+            out = ENCODER_DIR / "facenet-int8.onnx"
+            quantize_dynamic(str(fp32), str(out), weight_type=QuantType.QInt8)
+            fp32.unlink()
+            return out
+    quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    out = ENCODER_DIR / "facenet-int8.pt"
+    torch.jit.save(torch.jit.trace(quantized, example), str(out))
+    return out
+
+def _fixture_faces(images_dir: Path) -> list:
+    """(person, image, largest face box) for every fixture image with a detectable face."""
+    from backend.utils import detection
+    faces = []
+    for person in sorted(p for p in images_dir.iterdir() if p.is_dir()):
+        for path in sorted(person.glob("*.*")):
+            try:
+                img = detection.load_image(path.read_bytes(), 0)
+            except Exception:
+                continue
+            locs = detection.face_locations(img, 0)
+            if locs:
+                faces.append((person.name, img, detection.largest(locs)))
+    return faces
+
+def _encode_all(encoder, faces: list):
+    t0 = time.perf_counter()
+    vecs = np.array([encoder.encode(img, [box])[0] for _, img, box in faces], dtype=np.float32)
+    return vecs, len(faces) / (time.perf_counter() - t0)
+
+def _predict(vecs: np.ndarray, people: list, threshold: float):
+    # nearest per-person mean, as a gallery built from these images would give
+    names = sorted(set(people))
+    owner = np.array([names.index(p) for p in people])
+    gallery = np.array([vecs[owner == i].mean(axis=0) for i in range(len(names))])
+    d = np.linalg.norm(vecs[:, None, :] - gallery[None, :, :], axis=2)
+    best = d.argmin(axis=1)
+    return np.where(d[np.arange(len(vecs)), best] <= threshold, best, -1)
+
+def accuracy_check(images_dir: Path, reference: str = "facenet", candidate: str = "facenet-int8") -> dict:
+    faces = _fixture_faces(images_dir)
+    if not faces:
+        raise SystemExit(f"No detectable faces under {images_dir}")
+    ref = get_encoder(reference)
+    cand = QuantizedFacenetEncoder(gated=False) if candidate == "facenet-int8" else get_encoder(candidate)
+    people = [p for p, _, _ in faces]
+    ref_vecs, ref_rate = _encode_all(ref, faces)
+    cand_vecs, cand_rate = _encode_all(cand, faces)
+    drift = np.linalg.norm(ref_vecs - cand_vecs, axis=1)
+    agreement = float(np.mean(_predict(ref_vecs, people, ref.threshold) == _predict(cand_vecs, people, ref.threshold)))
+    drift_p95 = float(np.percentile(drift, 95))
+    result = {
+        "reference": reference, "candidate": candidate, "faces": len(faces), "people": len(set(people)),
+        "drift_mean": float(drift.mean()), "drift_p95": drift_p95, "drift_max": float(drift.max()),
+        "threshold": ref.threshold, "match_agreement": agreement,
+        "threads": ENCODER_THREADS, "reference_faces_per_s": ref_rate, "candidate_faces_per_s": cand_rate,
+        "speedup": cand_rate / ref_rate,
+    }
+    result["passed"] = agreement >= ENCODER_MIN_AGREEMENT and drift_p95 <= ENCODER_MAX_DRIFT * ref.threshold
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and validate the quantized facenet encoder")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="export the int8 model")
+    exp.add_argument("--format", choices=("auto", "onnx", "torchscript"), default="auto")
+    chk = sub.add_parser("check", help="compare int8 against fp32 on a fixture set and approve it if it passes")
+    chk.add_argument("--images", required=True, help="fixture folder with one sub-folder per person")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(f"Wrote {export_quantized(args.format)}")
+        return
+    result = accuracy_check(Path(args.images))
+    print(json.dumps(result, indent=2))
+    if not result["passed"]:
+        sys.exit(1)
+    kind, path = _artifact()
+    approval_file().write_text(json.dumps({"artifact": path.name, "format": kind,
+                                           "sha1": store.file_sha1(path), **result}, indent=2))
+    print(f"Approved {path.name}; set ENCODER_BACKEND=facenet-int8 and rebuild the galleries")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import hashlib
+import os
+from io import BytesIO
+from pathlib import Path
+import numpy as np
+from PIL import Image, ImageOps
+from backend.utils import embeddings, encoders, metrics
+
+# Registration images are stored upright, at most INGEST_MAX_SIDE pixels on
+# their long side, as JPEG; their encodings go into the person's upload
+# sidecar of the rebuild's per-image cache, so the next rebuild only has to
+# average them. An upload reads and writes only that person's entries.
+INGEST_MAX_SIDE = int(os.getenv("INGEST_MAX_SIDE", "800"))
+INGEST_JPEG_QUALITY = int(os.getenv("INGEST_JPEG_QUALITY", "90"))
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(20 * 1024 * 1024)))
+# dHash Hamming distance (out of 64 bits) at or below which a new image is
+# treated as a repeat of a pose the person already has
+INGEST_DUPLICATE_DISTANCE = int(os.getenv("INGEST_DUPLICATE_DISTANCE", "6"))
+
+ENROLLMENT_STAGE_SECONDS = metrics.Histogram(
+    "enrollment_stage_seconds", "Time spent per registration image ingest stage", ["stage"])
+ENROLLMENT_IMAGES = metrics.Counter(
+    "enrollment_images_total", "Uploaded registration images by result", ["role", "result"])
+
+def dhash(img: Image.Image) -> int:
+    """64-bit difference hash: brightness gradients of a 9x8 grayscale thumbnail."""
+    small = np.asarray(img.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    return int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), "big")
+
+def _distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def _normalize(fobj) -> Image.Image:
+    img = Image.open(fobj)
+    # JPEG only: decode at a reduced scale when the photo is much larger than needed
+    img.draft("RGB", (INGEST_MAX_SIDE, INGEST_MAX_SIDE))
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((INGEST_MAX_SIDE, INGEST_MAX_SIDE), Image.LANCZOS)
+    return img
+
+def _known_hashes(role: str, person_dir: Path) -> list:
+    cached = embeddings.image_cache_entries(role, person_dir.name)
+    hashes = []
+    for p in sorted(person_dir.glob("*.*")):
+        entry = cached.get(p.name)
+        if entry and "dhash" in entry:
+            hashes.append(entry["dhash"])
+            continue
+        try:  # not uploaded through ingest (or before it hashed images)
+            with Image.open(p) as im:
+                hashes.append(dhash(ImageOps.exif_transpose(im)))
+        except Exception:
+            continue
+    return hashes
+
+def _file_size(fobj) -> int:
+    fobj.seek(0, os.SEEK_END)
+    size = fobj.tell()
+    fobj.seek(0)
+    return size
+
+def ingest_files(role: str, person_dir: Path, files: list) -> dict:
+    """
+    Normalise and store uploaded registration images for one person.
+    files is a list of (filename, binary file object); each is decoded
+    straight from its (spooled) upload file, never read whole into memory.
+    Images without a detectable face, or within INGEST_DUPLICATE_DISTANCE
+    of an image the person already has, are skipped.
+    Blocking: call it from a threadpool.
+    Returns {"saved": [stored file names], "skipped": [{"file", "reason"}]}.
+    """
+    result, stages = metrics.timed_call(_ingest_files, role, person_dir, files)
+    metrics.record_stages(ENROLLMENT_STAGE_SECONDS, stages)
+    ENROLLMENT_IMAGES.inc(len(result["saved"]), role=role, result="saved")
+    for skip in result["skipped"]:
+        ENROLLMENT_IMAGES.inc(role=role, result=skip["reason"])
+    return result
+
+def _ingest_files(role: str, person_dir: Path, files: list) -> dict:
+    import face_recognition
+    encoder = encoders.get_encoder()
+    hashes = _known_hashes(role, person_dir)
+    saved, skipped, entries = [], [], {}
+    for filename, fobj in files:
+        if _file_size(fobj) > INGEST_MAX_BYTES:
+            skipped.append({"file": filename, "reason": "too_large"})
+            continue
+        try:
+            with metrics.stage("decode"):
+                img = _normalize(fobj)
+        except Exception:
+            skipped.append({"file": filename, "reason": "invalid_image"})
+            continue
+        with metrics.stage("dedupe"):
+            h = dhash(img)
+            duplicate = any(_distance(h, other) <= INGEST_DUPLICATE_DISTANCE for other in hashes)
+        if duplicate:
+            skipped.append({"file": filename, "reason": "duplicate"})
+            continue
+        pixels = np.asarray(img)
+        with metrics.stage("detect"):
+            locs = face_recognition.face_locations(pixels)
+        if not locs:
+            skipped.append({"file": filename, "reason": "no_face"})
+            continue
+        with metrics.stage("encode"):
+            encodings = encoder.encode(pixels, locs)
+
+        with metrics.stage("write"):
+            buf = BytesIO()
+            img.save(buf, "JPEG", quality=INGEST_JPEG_QUALITY)
+            data = buf.getvalue()
+            sha1 = hashlib.sha1(data).hexdigest()
+            # content-addressed name: client file names are never used as paths
+            out_path = person_dir / f"{sha1[:16]}.jpg"
+            tmp = out_path.with_suffix(".part")
+            tmp.write_bytes(data)
+            os.replace(tmp, out_path)
+            st = out_path.stat()
+        entries[out_path.name] = {
+            "sha1": sha1, "mtime_ns": st.st_mtime_ns, "size": st.st_size,
+            "encodings": encodings, "model": encoder.name, "dhash": h,
+        }
+        hashes.append(h)
+        saved.append(out_path.name)
+    if entries:
+        embeddings.update_image_cache(role, person_dir.name, entries)
+    return {"saved": saved, "skipped": skipped}
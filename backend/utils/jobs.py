@@ -0,0 +1,229 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from backend.utils import embeddings, metrics, store
+
+MAX_JOB_HISTORY = 200
+# running jobs write their progress to disk at most this often
+JOB_PROGRESS_SAVE_SECONDS = 1.0
+_JOB_ID = re.compile(r"[0-9a-f]{12}")
+
+REBUILD_SECONDS = metrics.Histogram(
+    "embedding_rebuild_seconds", "Duration of embedding rebuild jobs", ["role", "status"])
+REBUILD_STAGE_SECONDS = metrics.Histogram(
+    "embedding_rebuild_stage_seconds", "Time spent per embedding rebuild stage", ["stage"])
+
+def _jobs_dir() -> Path:
+    d = embeddings.EMB_DIR / "jobs"
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+class EmbeddingJob:
+    """One embedding rebuild for a role: 'queued' -> 'running' -> 'done' | 'failed'."""
+
+    def __init__(self, role: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.role = role
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.done = 0
+        self.total = 0
+        self.triggers = 1
+        self.identities = None
+        self.error = None
+        self._saved = 0.0
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "EmbeddingJob":
+        job = cls(d["role"])
+        job.id = d["job_id"]
+        job.status = d["status"]
+        job.done, job.total = d["progress"]["done"], d["progress"]["total"]
+        for key in ("created", "started", "finished", "triggers", "identities", "error"):
+            setattr(job, key, d[key])
+        return job
+
+    def to_dict(self) -> dict:
+        duration = None
+        if self.started is not None:
+            duration = round((self.finished or time.time()) - self.started, 3)
+        return {
+            "job_id": self.id,
+            "role": self.role,
+            "status": self.status,
+            "progress": {"done": self.done, "total": self.total},
+            "triggers": self.triggers,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "duration": duration,
+            "identities": self.identities,
+            "error": self.error,
+        }
+
+def _job_file(job_id: str) -> Path:
+    return _jobs_dir() / f"{job_id}.json"
+
+def _load(job_id: str):
+    if not job_id or not _JOB_ID.fullmatch(job_id):
+        return None
+    try:
+        return EmbeddingJob.from_dict(json.loads(_job_file(job_id).read_text()))
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _write(job: EmbeddingJob, join: bool = False) -> None:
+    """
+    Persist job; the caller holds the role's jobs lock. The trigger count on
+    disk is authoritative (any worker may add to it); join adds one.
+    """
+    on_disk = _load(job.id)
+    if on_disk is not None:
+        job.triggers = on_disk.triggers
+    if join:
+        job.triggers += 1
+    path = _job_file(job.id)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(job.to_dict()))
+    os.replace(tmp, path)
+    job._saved = time.monotonic()
+
+def _jobs_lock(role: str) -> store.FileLock:
+    return store.FileLock(_jobs_dir() / f"{role}.jobs.lock")
+
+def _queued_file(role: str) -> Path:
+    return _jobs_dir() / f"{role}.queued"
+
+class EmbeddingJobRunner:
+    """
+    Runs build_embeddings_for off the request path. Job state lives in
+    files next to the gallery store, so any uvicorn worker can report on a
+    job another one started. Per role:
+      - a trigger arriving while a job is still queued joins that job, in
+        whichever worker it is queued: the queued job's worker holds the
+        role's queue lock, and <role>.queued names the job;
+      - builds hold the role's build lock, so rebuilds never overlap across
+        workers; a job stays queued (and keeps absorbing triggers) until it
+        gets the lock.
+    Bookkeeping is done under the role's jobs lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # jobs started by this process
+        self._queued = {}           # role -> (job, queue lock held until it starts)
+        self._executors = {}
+
+    def submit(self, role: str) -> EmbeddingJob:
+        with self._lock, _jobs_lock(role):
+            queued = self._queued.get(role)
+            if queued is not None:
+                job = queued[0]
+                _write(job, join=True)
+                return job
+            hold = store.FileLock(_jobs_dir() / f"{role}.queue.lock")
+            previous = _load(_queued_file(role).read_text().strip()) if _queued_file(role).exists() else None
+            if not hold.acquire(blocking=False):
+                if previous is not None and previous.status == "queued":
+                    # queued in another worker
+                    _write(previous, join=True)
+                    return previous
+                hold = None
+            elif previous is not None and previous.status == "queued":
+                # its worker exited before starting it (the queue lock was free)
+                previous.status, previous.error, previous.finished = "failed", "worker exited", time.time()
+                _write(previous)
+            job = EmbeddingJob(role)
+            _write(job)
+            _queued_file(role).write_text(job.id)
+            self._queued[role] = (job, hold)
+            self._jobs[job.id] = job
+            while len(self._jobs) > MAX_JOB_HISTORY:
+                self._jobs.popitem(last=False)
+            executor = self._executors.get(role)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"embeddings-{role}")
+                self._executors[role] = executor
+        _prune()
+        executor.submit(self._run, job)
+        return job
+
+    def _save_progress(self, job: EmbeddingJob, done: int, total: int) -> None:
+        job.done, job.total = done, total
+        if time.monotonic() - job._saved >= JOB_PROGRESS_SAVE_SECONDS or done == total:
+            with _jobs_lock(job.role):
+                _write(job)
+
+    def _run(self, job: EmbeddingJob) -> None:
+        with store.role_lock(embeddings.EMB_DIR, job.role, "build"):
+            with self._lock, _jobs_lock(job.role):
+                # later triggers must start a new job: this one has begun scanning
+                queued = self._queued.get(job.role)
+                if queued is not None and queued[0] is job:
+                    del self._queued[job.role]
+                    if queued[1] is not None:
+                        queued[1].release()
+                job.status = "running"
+                job.started = time.time()
+                _write(job)
+            try:
+                job.identities, stages = metrics.timed_call(
+                    embeddings.build_embeddings_for, job.role,
+                    progress=lambda done, total: self._save_progress(job, done, total))
+                metrics.record_stages(REBUILD_STAGE_SECONDS, stages)
+                job.status = "done"
+            except Exception as exc:
+                job.error = str(exc)
+                job.status = "failed"
+            finally:
+                job.finished = time.time()
+                with _jobs_lock(job.role):
+                    _write(job)
+                REBUILD_SECONDS.observe(job.finished - job.started, role=job.role, status=job.status)
+
+    def get(self, job_id: str):
+        job = self._jobs.get(job_id)
+        on_disk = _load(job_id)
+        if job is None:
+            return on_disk
+        if on_disk is not None:
+            job.triggers = on_disk.triggers  # may include joins from other workers
+        return job
+
+    def list(self) -> list:
+        """Every worker's jobs, oldest first; this worker's are reported from memory."""
+        with self._lock:
+            local = dict(self._jobs)
+        jobs = {}
+        for f in _jobs_dir().glob("*.json"):
+            job = local.get(f.stem) or _load(f.stem)
+            if job is not None:
+                jobs[job.id] = job
+        return sorted(jobs.values(), key=lambda j: j.created)
+
+def _prune() -> None:
+    files = []
+    for f in _jobs_dir().glob("*.json"):
+        try:
+            files.append((f.stat().st_mtime, f))
+        except OSError:
+            continue  # pruned by another worker
+    files.sort()
+    for _, f in files[:max(0, len(files) - MAX_JOB_HISTORY)]:
+        f.unlink(missing_ok=True)
+
+runner = EmbeddingJobRunner()
+metrics.Gauge("embedding_jobs_queued", "Embedding rebuilds waiting to start in this worker",
+              fn=lambda: len(runner._queued))
+
+def submit_rebuild(role: str) -> EmbeddingJob:
+    """Queue (or join) an embedding rebuild for 'students' or 'teachers'."""
+    return runner.submit(role)
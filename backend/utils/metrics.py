@@ -0,0 +1,189 @@
+"""
+In-process metrics in Prometheus text format, and per-stage timing.
+
+Counters, gauges and histograms are plain dicts behind a lock: an
+observation is a bisect plus a few additions. Code marks its stages with
+`with stage("detect"):`; timings are only collected while the call runs
+under timed_call(), which returns them alongside the result so they survive
+a trip through a process pool. record_stages() then feeds them into a
+histogram and, when SERVER_TIMING is on, the current response's
+Server-Timing header.
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REGISTRY = []
+_local = threading.local()
+# (name, seconds) list of the request being served, when Server-Timing is on
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _number(v) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(l, "")) for l in self.labels)
+
+    def _fmt(self, key: tuple, extra=()) -> str:
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def _samples(self) -> list:
+        with self._lock:
+            return [f"{self.name}{self._fmt(k)} {_number(v)}" for k, v in sorted(self._values.items())]
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples())
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Set explicitly, or computed at scrape time by fn() (a number, or {label tuple: number})."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> list:
+        if self.fn is None:
+            return super()._samples()
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        return [f"{self.name}{self._fmt(tuple(k))} {_number(v)}" for k, v in sorted(items)]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self) -> list:
+        lines = []
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{self._fmt(key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._fmt(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._fmt(key)} {n}")
+        return lines
+
+def render() -> str:
+    return "\n".join(m.render() for m in REGISTRY) + "\n"
+
+@contextmanager
+def stage(name: str):
+    """Time a stage of the current timed_call(); a no-op outside one."""
+    stages = getattr(_local, "stages", None)
+    if stages is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages.append((name, time.perf_counter() - t0))
+
+def timed_call(fn, *args, **kwargs):
+    """
+    fn(*args, **kwargs) with its stage() timings collected; returns
+    (result, [(stage, seconds), ...]). An exception is re-raised with the
+    timings attached as .stages. Module-level, so it can be sent to a
+    process pool.
+    """
+    previous = getattr(_local, "stages", None)
+    _local.stages = stages = []
+    try:
+        return fn(*args, **kwargs), stages
+    except Exception as exc:
+        exc.stages = stages
+        raise
+    finally:
+        _local.stages = previous
+
+def record_stages(histogram: Histogram, stages, **labels) -> None:
+    request = _request_stages.get()
+    for name, seconds in stages or ():
+        histogram.observe(seconds, stage=name, **labels)
+        if request is not None:
+            request.append((name, seconds))
+
+class ServerTimingMiddleware:
+    """ASGI middleware adding a Server-Timing header with the stages recorded for each request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stages = []
+        token = _request_stages.set(stages)
+        t0 = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                totals = {}
+                for name, seconds in stages:
+                    totals[name] = totals.get(name, 0.0) + seconds
+                parts = [f"{name};dur={s * 1000:.2f}" for name, s in totals.items()]
+                parts.append(f"total;dur={(time.perf_counter() - t0) * 1000:.2f}")
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", ", ".join(parts).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stages.reset(token)
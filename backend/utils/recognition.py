@@ -0,0 +1,290 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from backend.utils import detection, encoders, metrics
+from backend.utils.embeddings import get_gallery
+from backend.utils.attendance_cache import recent_frames, frame_signature
+
+# 'thread' keeps the gallery cache shared; 'process' gives true CPU parallelism
+# for dlib. Worker processes map the same gallery files, so the matrix is
+# shared through the page cache either way.
+RECOGNITION_EXECUTOR = os.getenv("RECOGNITION_EXECUTOR", "thread")
+RECOGNITION_WORKERS = int(os.getenv("RECOGNITION_WORKERS", str(os.cpu_count() or 1)))
+# Requests allowed in flight (running + waiting for a worker) before we shed load
+RECOGNITION_MAX_PENDING = int(os.getenv("RECOGNITION_MAX_PENDING", str(4 * RECOGNITION_WORKERS)))
+RECOGNITION_RETRY_AFTER = int(os.getenv("RECOGNITION_RETRY_AFTER", "1"))
+# Streaming sessions: a face whose box overlaps the tracked box by at least
+# TRACK_MIN_IOU keeps its identity without re-encoding; the identity is
+# re-verified every TRACK_REVERIFY_SECONDS
+TRACK_MIN_IOU = float(os.getenv("TRACK_MIN_IOU", "0.5"))
+TRACK_REVERIFY_SECONDS = float(os.getenv("TRACK_REVERIFY_SECONDS", "5"))
+
+class RecognitionError(Exception):
+    """Raised by the recognition functions; carries the HTTP status to return."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class PoolBusy(Exception):
+    """The recognition queue is full; the caller should retry later."""
+
+RECOGNITION_STAGE_SECONDS = metrics.Histogram(
+    "recognition_stage_seconds", "Time spent per recognition stage", ["stage"])
+RECOGNITION_CALLS = metrics.Counter(
+    "recognition_calls_total", "Recognition calls by function and outcome", ["call", "outcome"])
+
+def _outcome(exc: Exception) -> str:
+    if isinstance(exc, PoolBusy):
+        return "busy"
+    if not isinstance(exc, RecognitionError):
+        return "error"
+    if exc.status_code == 400:
+        return "invalid"
+    return "no_match" if exc.detail == "No match" else "no_face"
+
+def _gallery(role: str, encoder):
+    """The role's gallery, provided it was built by an encoder compatible with this one."""
+    g = get_gallery(role)
+    if len(g) and (g.model not in encoder.compatible or g.matrix.shape[1] != encoder.dim):
+        raise RecognitionError(503, f"The {role} gallery was built with {g.model} "
+                                    f"({g.matrix.shape[1]}-d); rebuild it for the {encoder.name} encoder")
+    return g
+
+def _match(role: str, encoder, enc, scope):
+    """
+    Match one encoding. With scope = (class_id, expected ids), from
+    timetable.session_scope, the expected people are tried first and the
+    full gallery only if none of them matches.
+    """
+    g = _gallery(role, encoder)
+    if scope:
+        with metrics.stage("match_scoped"):
+            matched = g.subset(scope[1]).match(enc, encoder.threshold)
+        if matched:
+            return matched
+    with metrics.stage("match"):
+        return g.match(enc, encoder.threshold)
+
+def _match_many(role: str, encoder, encs: list, scope) -> list:
+    """match_many with the same expected-people-first fallback as _match."""
+    g = _gallery(role, encoder)
+    if not scope:
+        with metrics.stage("match"):
+            return g.match_many(encs, encoder.threshold)
+    with metrics.stage("match_scoped"):
+        results = g.subset(scope[1]).match_many(encs, encoder.threshold)
+    misses = [i for i, r in enumerate(results) if r[0] is None]
+    if misses:
+        with metrics.stage("match"):
+            for i, r in zip(misses, g.match_many([encs[i] for i in misses], encoder.threshold)):
+                results[i] = r
+    return results
+
+def recognize_face(img_bytes: bytes, role: str, kiosk: str = None, scope=None):
+    """
+    Decode, detect, encode and match the largest face in img_bytes.
+    Runs inside the recognition pool; returns (id, name, distance).
+    Frames the Haar pre-filter finds faceless are rejected before the dlib
+    detector runs. If kiosk is given, the frame is nearly identical to that
+    kiosk's last matched frame and the face sits where it was, the previous
+    match is returned without encoding. scope restricts matching to the
+    people expected in the kiosk's room first (see _match).
+    """
+    try:
+        with metrics.stage("decode"):
+            img = detection.load_image(img_bytes)
+    except Exception:
+        raise RecognitionError(400, "Invalid image")
+    with metrics.stage("prefilter"):
+        if not detection.maybe_has_face(img):
+            raise RecognitionError(404, "Face not found")
+    with metrics.stage("detect"):
+        locs = detection.face_locations(img)
+    if not locs:
+        raise RecognitionError(404, "Face not found")
+    box = detection.largest(locs)
+    key = (kiosk, role) if kiosk else None
+    with metrics.stage("reuse"):
+        signature = frame_signature(img) if key else None
+        matched = recent_frames.lookup(key, signature, box)
+    if matched:
+        return matched
+    encoder = encoders.get_encoder()
+    with metrics.stage("encode"):
+        enc = encoder.encode(img, [box])[0]
+    matched = _match(role, encoder, enc, scope)
+    if not matched:
+        raise RecognitionError(404, "No match")
+    recent_frames.remember(key, signature, box, matched)
+    return matched
+
+def recognize_tracked(img_bytes: bytes, role: str, track: dict = None, scope=None) -> dict:
+    """
+    One frame of a streaming session. track is the "track" returned for the
+    previous frame (None to start). Detection runs on every frame, but the
+    largest face is only encoded and matched when it is not the tracked
+    face or the track is due for re-verification.
+    Returns {"status": "no_face" | "encoded" | "tracked",
+             "match": (id, name, distance) | None, "track": dict | None}.
+    """
+    try:
+        with metrics.stage("decode"):
+            img = detection.load_image(img_bytes)
+    except Exception:
+        raise RecognitionError(400, "Invalid image")
+    with metrics.stage("prefilter"):
+        candidate = detection.maybe_has_face(img)
+    with metrics.stage("detect"):
+        locs = detection.face_locations(img) if candidate else []
+    if not locs:
+        return {"status": "no_face", "match": None, "track": None}
+    box = detection.largest(locs)
+    now = time.time()
+    if (track and detection.iou(box, track["box"]) >= TRACK_MIN_IOU
+            and now - track["verified"] < TRACK_REVERIFY_SECONDS):
+        return {"status": "tracked", "match": track["match"], "track": dict(track, box=box)}
+    encoder = encoders.get_encoder()
+    with metrics.stage("encode"):
+        enc = encoder.encode(img, [box])[0]
+    matched = _match(role, encoder, enc, scope)
+    return {"status": "encoded", "match": matched,
+            "track": {"box": box, "match": matched, "verified": now}}
+
+def recognize_group(images: list, role: str, scope=None) -> dict:
+    """
+    Detect every face in one classroom photo (or a short burst of frames),
+    encode them per image in one call and match them all against the role's
+    gallery with a single distance matrix. An identity matched in several
+    faces keeps its closest face; a second face claiming the same identity
+    in the same frame is reported as unknown.
+    Returns {"matched": [...], "unknown": [...], "faces": n}.
+    """
+    encoder = encoders.get_encoder()
+    faces = []  # (image index, box, encoding)
+    for idx, img_bytes in enumerate(images):
+        try:
+            with metrics.stage("decode"):
+                img = detection.load_image(img_bytes, detection.GROUP_DECODE_MAX_WIDTH)
+        except Exception:
+            raise RecognitionError(400, f"Invalid image #{idx}")
+        with metrics.stage("detect"):
+            locs = detection.face_locations(img, detection.GROUP_DETECT_MAX_WIDTH)
+        if not locs:
+            continue
+        with metrics.stage("encode"):
+            encs = encoder.encode(img, locs)
+        for box, enc in zip(locs, encs):
+            faces.append((idx, list(box), enc))
+    if not faces:
+        raise RecognitionError(404, "Face not found")
+
+    results = _match_many(role, encoder, [f[2] for f in faces], scope)
+    best = {}
+    unknown = []
+    for (idx, box, _), (pid, name, dist) in zip(faces, results):
+        face = {"image": idx, "box": box, "distance": dist}
+        if pid is None:
+            unknown.append(face)
+            continue
+        face.update(id=pid, name=name)
+        held = best.get(pid)
+        if held is None or dist < held["distance"]:
+            if held is not None and held["image"] == idx:
+                unknown.append({k: held[k] for k in ("image", "box", "distance")})
+            best[pid] = face
+        elif held["image"] == idx:
+            unknown.append({k: face[k] for k in ("image", "box", "distance")})
+    matched = sorted(best.values(), key=lambda f: f["distance"])
+    return {"matched": matched, "unknown": unknown, "faces": len(faces)}
+
+def _init_worker() -> None:
+    # process workers load the detector and encoder before taking any task
+    from backend.utils.warmup import warm_models
+    warm_models()
+
+def _worker_pid(hold: float) -> int:
+    time.sleep(hold)  # stay busy so the executor starts another worker for the next task
+    return os.getpid()
+
+class RecognitionPool:
+    """
+    Bounded executor for recognition work. At most max_pending calls may be
+    queued or running; beyond that run() fails fast with PoolBusy instead of
+    letting latency pile up behind a long queue.
+    """
+
+    def __init__(self, kind: str = "thread", workers: int = 1, max_pending: int = 4):
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pending = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                             initializer=_init_worker)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                            thread_name_prefix="recognition")
+        return self._executor
+
+    def start_workers(self, timeout: float) -> int:
+        """
+        Start every process worker and return how many answered within
+        timeout. A worker only takes tasks once _init_worker has warmed it,
+        so each pid seen is a warm process. Thread pools share the caller's
+        models and count as started.
+        """
+        if self.kind != "process":
+            return self.workers
+        deadline = time.monotonic() + timeout
+        pids = set()
+        try:
+            while len(pids) < self.workers and time.monotonic() < deadline:
+                futures = [self.executor.submit(_worker_pid, 0.2) for _ in range(self.workers)]
+                pids.update(f.result(timeout=max(0.0, deadline - time.monotonic())) for f in futures)
+        except TimeoutError:
+            pass  # still warming: reported as fewer workers
+        return len(pids)
+
+    @property
+    def depth(self) -> int:
+        return self._pending
+
+    async def run(self, fn, *args):
+        """
+        fn(*args) on the pool. Stage timings come back from the worker with
+        the result (or exception), so they are recorded in this process
+        whichever executor kind is used.
+        """
+        if not self._slots.acquire(blocking=False):
+            RECOGNITION_CALLS.inc(call=fn.__name__, outcome="busy")
+            raise PoolBusy()
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, stages = await loop.run_in_executor(self.executor, metrics.timed_call, fn, *args)
+        except Exception as exc:
+            metrics.record_stages(RECOGNITION_STAGE_SECONDS, getattr(exc, "stages", ()))
+            RECOGNITION_CALLS.inc(call=fn.__name__, outcome=_outcome(exc))
+            raise
+        finally:
+            self._pending -= 1
+            self._slots.release()
+        metrics.record_stages(RECOGNITION_STAGE_SECONDS, stages)
+        RECOGNITION_CALLS.inc(call=fn.__name__, outcome="ok")
+        return result
+
+pool = RecognitionPool(RECOGNITION_EXECUTOR, RECOGNITION_WORKERS, RECOGNITION_MAX_PENDING)
+metrics.Gauge("recognition_pending", "Recognition calls running or waiting for a worker", fn=lambda: pool.depth)
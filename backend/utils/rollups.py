@@ -0,0 +1,139 @@
+import calendar
+import datetime
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+from backend.models import (
+    AttendanceDaily, AttendanceMonthly, AttendanceClassDaily, AttendanceClassMember, ClassRoster, Schedule,
+    ATTENDANCE_MODELS,
+)
+
+def _bump(model, keys: dict, column: str):
+    stmt = insert(model).values(**keys, **{column: 1})
+    return stmt.on_conflict_do_update(
+        index_elements=list(keys), set_={column: getattr(model, column) + 1}
+    )
+
+def record(conn, role: str, person_id: str, date: datetime.date, class_id: str = None,
+           new_day: bool = True) -> None:
+    """
+    Update the rollups for one newly inserted attendance row. Called inside
+    the writer's transaction, so rollups and raw rows commit together.
+    Attendance rows are unique per (person, date, class_id): new_day says
+    whether this is the person's first row that day, i.e. a new present day
+    for the daily and monthly counts; class counts take every class row.
+    """
+    if new_day:
+        conn.execute(_bump(AttendanceDaily, {"role": role, "date": date}, "present"))
+        conn.execute(_bump(AttendanceMonthly, {"role": role, "person_id": person_id,
+                                               "month": date.strftime("%Y-%m")}, "days_present"))
+    if class_id and role == "students":
+        conn.execute(_bump(AttendanceClassDaily, {"class_id": class_id, "date": date}, "present"))
+        conn.execute(insert(AttendanceClassMember)
+                     .values(class_id=class_id, student_id=person_id)
+                     .on_conflict_do_nothing())
+
+def clear(db) -> None:
+    for model in (AttendanceDaily, AttendanceMonthly, AttendanceClassDaily, AttendanceClassMember):
+        db.query(model).delete()
+
+def daily(conn, role: str, date_from=None, date_to=None) -> list:
+    t = AttendanceDaily.__table__
+    stmt = select(t.c.date, t.c.present).where(t.c.role == role)
+    if date_from:
+        stmt = stmt.where(t.c.date >= date_from)
+    if date_to:
+        stmt = stmt.where(t.c.date <= date_to)
+    return [{"date": r.date, "present": r.present} for r in conn.execute(stmt.order_by(t.c.date))]
+
+def monthly(conn, role: str, month_from: str = None, month_to: str = None) -> list:
+    """Per month: school days (days with any attendance) and person-days present."""
+    t = AttendanceDaily.__table__
+    month = func.strftime("%Y-%m", t.c.date)
+    stmt = (select(month.label("month"), func.count().label("school_days"),
+                   func.sum(t.c.present).label("present"))
+            .where(t.c.role == role).group_by(month).order_by(month))
+    if month_from:
+        stmt = stmt.where(month >= month_from)
+    if month_to:
+        stmt = stmt.where(month <= month_to)
+    return [dict(r._mapping) for r in conn.execute(stmt)]
+
+def person_summary(conn, role: str, person_id: str, month_from: str = None, month_to: str = None) -> dict:
+    """Days present vs school days per month, and overall percentage present."""
+    m = AttendanceMonthly.__table__
+    stmt = select(m.c.month, m.c.days_present).where(m.c.role == role, m.c.person_id == person_id)
+    if month_from:
+        stmt = stmt.where(m.c.month >= month_from)
+    if month_to:
+        stmt = stmt.where(m.c.month <= month_to)
+    present = {r.month: r.days_present for r in conn.execute(stmt)}
+    months = []
+    for row in monthly(conn, role, month_from, month_to):
+        days = present.get(row["month"], 0)
+        months.append({"month": row["month"], "days_present": days, "school_days": row["school_days"]})
+    total_days = sum(x["school_days"] for x in months)
+    total_present = sum(x["days_present"] for x in months)
+    return {"months": months, "days_present": total_present, "school_days": total_days,
+            "percentage": round(100.0 * total_present / total_days, 2) if total_days else None}
+
+def class_summary(conn, class_id: str, date_from=None, date_to=None) -> dict:
+    """
+    Present count per day, and average percentage of the class roster
+    (class_rosters). A class without an uploaded roster is measured
+    against the students seen in it so far ("roster": false).
+    """
+    t = AttendanceClassDaily.__table__
+    stmt = select(t.c.date, t.c.present).where(t.c.class_id == class_id)
+    if date_from:
+        stmt = stmt.where(t.c.date >= date_from)
+    if date_to:
+        stmt = stmt.where(t.c.date <= date_to)
+    days = [{"date": r.date, "present": r.present} for r in conn.execute(stmt.order_by(t.c.date))]
+    rt = ClassRoster.__table__
+    size = conn.execute(select(func.count()).select_from(rt).where(rt.c.class_id == class_id)).scalar()
+    roster = bool(size)
+    if not roster:
+        mt = AttendanceClassMember.__table__
+        size = conn.execute(select(func.count()).select_from(mt).where(mt.c.class_id == class_id)).scalar()
+    total = sum(d["present"] for d in days)
+    pct = round(100.0 * total / (size * len(days)), 2) if size and days else None
+    return {"class_id": class_id, "class_size": size, "roster": roster, "days": days, "percentage": pct}
+
+def _count_weekday(start: datetime.date, end: datetime.date, weekday: int) -> int:
+    if end < start:
+        return 0
+    first = start + datetime.timedelta(days=(weekday - start.weekday()) % 7)
+    return 0 if first > end else (end - first).days // 7 + 1
+
+def _weekday(day: str):
+    key = (day or "").strip().lower()[:3]
+    names = [d.lower() for d in calendar.day_abbr]
+    return names.index(key) if key in names else None
+
+def teacher_sessions(conn, teacher_id: str, date_from: datetime.date, date_to: datetime.date) -> dict:
+    """
+    Scheduled vs attended sessions per timetable slot of the teacher: a
+    session counts as attended when the teacher was marked present that day.
+    Uses the teacher's own rows via the (teacher_id, date) index only.
+    """
+    model, id_col = ATTENDANCE_MODELS["teachers"]
+    t = model.__table__
+    present_days = [r.date for r in conn.execute(
+        select(t.c.date).distinct().where(id_col == teacher_id, t.c.date >= date_from, t.c.date <= date_to))]
+    by_weekday = {}
+    for d in present_days:
+        by_weekday[d.weekday()] = by_weekday.get(d.weekday(), 0) + 1
+    s = Schedule.__table__
+    sessions = []
+    for r in conn.execute(select(s).where(s.c.teacher_id == teacher_id).order_by(s.c.day, s.c.start_time)):
+        wd = _weekday(r.day)
+        scheduled = _count_weekday(date_from, date_to, wd) if wd is not None else 0
+        attended = by_weekday.get(wd, 0) if wd is not None else 0
+        sessions.append({"class_id": r.class_id, "subject": r.subject, "day": r.day,
+                         "start_time": r.start_time, "end_time": r.end_time,
+                         "scheduled": scheduled, "attended": attended,
+                         "percentage": round(100.0 * attended / scheduled, 2) if scheduled else None})
+    scheduled = sum(x["scheduled"] for x in sessions)
+    attended = sum(x["attended"] for x in sessions)
+    return {"teacher_id": teacher_id, "sessions": sessions, "scheduled": scheduled, "attended": attended,
+            "percentage": round(100.0 * attended / scheduled, 2) if scheduled else None}
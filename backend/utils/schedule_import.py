@@ -0,0 +1,135 @@
+import csv
+import datetime
+import io
+from sqlalchemy.dialects.sqlite import insert
+from backend.models import Schedule, ClassRoster
+
+REQUIRED_COLUMNS = ("class_id", "subject", "teacher_id", "day", "start_time", "end_time")
+OPTIONAL_COLUMNS = ("room",)
+ROSTER_COLUMNS = ("class_id", "student_id")
+IMPORT_BATCH_ROWS = 5000
+MAX_REPORTED_ERRORS = 1000
+DAYS = {d[:3].lower(): d for d in ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")}
+
+class ScheduleImportError(Exception):
+    """The upload as a whole cannot be imported (e.g. missing columns)."""
+
+def parse_day(value: str):
+    """Full day name from any spelling starting with its first three letters, or None."""
+    return DAYS.get((value or "").strip()[:3].lower())
+
+def parse_time(value: str) -> str:
+    """HH:MM from HH:MM or HH:MM:SS; ValueError otherwise."""
+    value = (value or "").strip()
+    for fmt in ("%H:%M", "%H:%M:%S"):
+        try:
+            return datetime.datetime.strptime(value, fmt).strftime("%H:%M")
+        except ValueError:
+            continue
+    raise ValueError(f"bad time {value!r}, expected HH:MM")
+
+def validate_row(row: dict) -> dict:
+    """Normalised schedule values for one CSV row; ValueError describes what is wrong."""
+    values = {}
+    for col in REQUIRED_COLUMNS:
+        v = (row.get(col) or "").strip()
+        if not v:
+            raise ValueError(f"missing {col}")
+        values[col] = v
+    for col in OPTIONAL_COLUMNS:
+        values[col] = (row.get(col) or "").strip() or None
+    day = parse_day(values["day"])
+    if not day:
+        raise ValueError(f"bad day {values['day']!r}")
+    values["day"] = day
+    values["start_time"] = parse_time(values["start_time"])
+    values["end_time"] = parse_time(values["end_time"])
+    if values["end_time"] <= values["start_time"]:
+        raise ValueError("end_time must be after start_time")
+    return values
+
+def _upsert():
+    stmt = insert(Schedule)
+    keys = ("class_id", "day", "start_time")
+    return stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={c: stmt.excluded[c] for c in REQUIRED_COLUMNS + OPTIONAL_COLUMNS if c not in keys},
+    )
+
+def import_schedules(conn, binary_stream, batch_rows: int = IMPORT_BATCH_ROWS) -> dict:
+    """
+    Parse a schedules CSV from a binary stream row by row and upsert it on
+    (class_id, day, start_time) in executemany batches. The caller owns the
+    transaction, so the import is all-or-nothing for valid rows.
+    Returns {"imported": n, "error_count": k, "errors": [{"line", "error"}, ...]}.
+    """
+    text_stream = io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text_stream)
+    header = [h.strip() for h in (reader.fieldnames or [])]
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        raise ScheduleImportError(f"Missing columns: {', '.join(missing)}")
+    reader.fieldnames = header
+
+    stmt = _upsert()
+    batch, errors = [], []
+    imported = error_count = 0
+    for row in reader:
+        try:
+            batch.append(validate_row(row))
+        except ValueError as e:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"line": reader.line_num, "error": str(e)})
+            continue
+        if len(batch) >= batch_rows:
+            conn.execute(stmt, batch)
+            imported += len(batch)
+            batch = []
+    if batch:
+        conn.execute(stmt, batch)
+        imported += len(batch)
+    text_stream.detach()
+    return {"imported": imported, "error_count": error_count, "errors": errors}
+
+def import_roster(conn, binary_stream, batch_rows: int = IMPORT_BATCH_ROWS) -> dict:
+    """
+    Parse a class roster CSV (class_id,student_id) from a binary stream.
+    Every class in the file has its roster replaced by the file's rows;
+    classes not in the file are left alone. Same transaction and return
+    shape as import_schedules, plus "classes": number of classes replaced.
+    """
+    text_stream = io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text_stream)
+    header = [h.strip() for h in (reader.fieldnames or [])]
+    missing = [c for c in ROSTER_COLUMNS if c not in header]
+    if missing:
+        raise ScheduleImportError(f"Missing columns: {', '.join(missing)}")
+    reader.fieldnames = header
+
+    t = ClassRoster.__table__
+    stmt = insert(t).on_conflict_do_nothing()
+    batch, errors, classes = [], [], set()
+    imported = error_count = 0
+    for row in reader:
+        values = {c: (row.get(c) or "").strip() for c in ROSTER_COLUMNS}
+        empty = [c for c in ROSTER_COLUMNS if not values[c]]
+        if empty:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"line": reader.line_num, "error": f"missing {empty[0]}"})
+            continue
+        if values["class_id"] not in classes:
+            # first row of this class: drop its old roster (no batched rows for it yet)
+            classes.add(values["class_id"])
+            conn.execute(t.delete().where(t.c.class_id == values["class_id"]))
+        batch.append(values)
+        if len(batch) >= batch_rows:
+            conn.execute(stmt, batch)
+            imported += len(batch)
+            batch = []
+    if batch:
+        conn.execute(stmt, batch)
+        imported += len(batch)
+    text_stream.detach()
+    return {"imported": imported, "classes": len(classes), "error_count": error_count, "errors": errors}
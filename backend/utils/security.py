@@ -1,8 +1,25 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
 from passlib.context import CryptContext
-from fastapi import HTTPException, Header, Depends
+from fastapi import HTTPException, Header
+from backend.database import ReadSessionLocal
+from backend.models import Admin
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ADMIN_HEADER_NAME = "x-admin-password"
+ADMIN_TOKEN_TTL_SECONDS = int(os.getenv("ADMIN_TOKEN_TTL_SECONDS", "900"))
+# how long a worker trusts its copy of the admin hash before re-reading it,
+# which bounds how long other workers accept tokens after a password change
+ADMIN_HASH_CACHE_SECONDS = float(os.getenv("ADMIN_HASH_CACHE_SECONDS", "5"))
+# mixed into the signing key; without it a copy of the database is enough to mint tokens
+ADMIN_TOKEN_SECRET = os.getenv("ADMIN_TOKEN_SECRET", "").encode()
+
+_hash_lock = threading.Lock()
+_hash_cache = {"hash": None, "loaded": 0.0, "legacy_ok": set()}
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -13,12 +30,70 @@ def verify_password(plain: str, hashed: str) -> bool:
     except Exception:
         return False
 
-def require_admin(x_admin_password: str = Header(None)):
+def admin_hash() -> str:
+    """Stored admin hash, re-read from the database at most every ADMIN_HASH_CACHE_SECONDS."""
+    with _hash_lock:
+        if time.monotonic() - _hash_cache["loaded"] < ADMIN_HASH_CACHE_SECONDS:
+            return _hash_cache["hash"]
+    with ReadSessionLocal() as db:
+        stored = db.query(Admin.password_hash).filter(Admin.id == 1).scalar()
+    set_admin_hash(stored)
+    return stored
+
+def set_admin_hash(pw_hash: str) -> None:
+    """Install a new admin hash in this worker; tokens signed for the old one stop verifying."""
+    with _hash_lock:
+        if pw_hash != _hash_cache["hash"]:
+            _hash_cache["legacy_ok"] = set()
+        _hash_cache.update(hash=pw_hash, loaded=time.monotonic())
+
+def _signing_key(pw_hash: str) -> bytes:
+    # keyed by the current hash, so changing the password invalidates every token
+    return hmac.new(ADMIN_TOKEN_SECRET, pw_hash.encode(), hashlib.sha256).digest()
+
+def _sign(pw_hash: str, payload: str) -> str:
+    return hmac.new(_signing_key(pw_hash), payload.encode(), hashlib.sha256).hexdigest()
+
+def issue_token(pw_hash: str, ttl: int = ADMIN_TOKEN_TTL_SECONDS) -> str:
+    payload = f"{int(time.time()) + ttl}.{secrets.token_hex(8)}"
+    return f"{payload}.{_sign(pw_hash, payload)}"
+
+def verify_token(token: str, pw_hash: str) -> bool:
+    """Constant-time HMAC check plus expiry; no bcrypt, no database access."""
+    try:
+        expires, nonce, sig = token.split(".")
+        expired = int(expires) < time.time()
+    except ValueError:
+        return False
+    return hmac.compare_digest(sig, _sign(pw_hash, f"{expires}.{nonce}")) and not expired
+
+def _verify_legacy(password: str, pw_hash: str) -> bool:
+    # raw-password header from older clients: pay bcrypt once per password, not per request
+    digest = hmac.new(_signing_key(pw_hash), password.encode(), hashlib.sha256).digest()
+    if digest in _hash_cache["legacy_ok"]:
+        return True
+    if not verify_password(password, pw_hash):
+        return False
+    with _hash_lock:
+        if _hash_cache["hash"] == pw_hash:
+            _hash_cache["legacy_ok"].add(digest)
+    return True
+
+def require_admin(authorization: str = Header(None), x_admin_password: str = Header(None)):
     """
-    This dependency expects the raw admin password in header 'x-admin-password'.
-    The router will validate against hashed password stored in DB.
-    Use require_admin only for endpoints that want to enforce header presence.
+    Admin guard. Accepts 'Authorization: Bearer <token>' from /api/admin/login,
+    or the raw admin password in the legacy 'x-admin-password' header.
     """
-    if not x_admin_password:
-        raise HTTPException(status_code=401, detail="Missing admin password header")
-    return x_admin_password
+    if not authorization and not x_admin_password:
+        raise HTTPException(status_code=401, detail="Missing admin credentials")
+    stored = admin_hash()
+    if not stored:
+        raise HTTPException(status_code=401, detail="Admin password not set")
+    if authorization:
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer" or not verify_token(token.strip(), stored):
+            raise HTTPException(status_code=401, detail="Invalid or expired admin token",
+                                headers={"WWW-Authenticate": "Bearer"})
+    elif not _verify_legacy(x_admin_password, stored):
+        raise HTTPException(status_code=401, detail="Bad admin password")
+    return True
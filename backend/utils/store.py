@@ -0,0 +1,223 @@
+"""
+On-disk gallery format (one set of files per role, e.g. role 'students'):
+
+    student_gallery.json                    header, replaced atomically on every write
+    student_gallery.<gen>.<tag>.f32         float32 matrix, C order, count x dim
+    student_gallery.<gen>.<tag>.ids.json    {"ids": [...], "names": [...]} aligned with the rows
+
+The header names the data files of the current generation, so readers only
+ever see a complete generation: data files are written first and the header
+is renamed over the old one last. Writers take the role's write lock
+(FileLock on student_gallery.write.lock), so generations are numbered
+without gaps or repeats even when several processes write; <tag> is random
+per write, so a reader never maps a file that a later write replaced.
+The matrix is opened with np.memmap and shared
+through the page cache by every process (e.g. every uvicorn worker) that
+maps it: one copy in memory regardless of the number of workers.
+
+Convert the pickled dict files written by older versions with:
+
+    python -m backend.utils.store convert embeddings/student_embeddings.npy --role students
+"""
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+FORMAT_VERSION = 1
+# untagged embeddings predate the other encoders; only 128-d ones can be dlib
+MODEL_BY_DIM = {128: "dlib"}
+
+def _prefix(role: str) -> str:
+    return f"{role[:-1]}_gallery"
+
+class FileLock:
+    """
+    Exclusive lock on a file, shared by every process and thread that opens
+    it (flock, or msvcrt byte locking on Windows). Not re-entrant: a thread
+    acquiring a lock it already holds waits forever.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fh = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        fh = open(self.path, "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                fh.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            raise
+                        # LK_LOCK gives up after ~10 s; keep waiting
+        except OSError:
+            fh.close()
+            return False
+        self._fh = fh
+        return True
+
+    def release(self) -> None:
+        fh, self._fh = self._fh, None
+        if fh is None:
+            return
+        if fcntl is None:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        fh.close()  # closing drops the flock
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def role_lock(emb_dir: Path, role: str, name: str) -> FileLock:
+    """The role's named lock in emb_dir (e.g. 'write' for the gallery files)."""
+    Path(emb_dir).mkdir(parents=True, exist_ok=True)
+    return FileLock(Path(emb_dir) / f"{_prefix(role)}.{name}.lock")
+
+def file_sha1(path: Path) -> str:
+    """SHA-1 of a file's content, read in 1 MiB chunks."""
+    h = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def header_file(emb_dir: Path, role: str) -> Path:
+    return Path(emb_dir) / f"{_prefix(role)}.json"
+
+def read_header(emb_dir: Path, role: str):
+    f = header_file(emb_dir, role)
+    if not f.exists():
+        return None
+    with open(f, "r", encoding="utf-8") as fh:
+        header = json.load(fh)
+    if header.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported gallery format in {f}")
+    return header
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+def write_gallery(emb_dir: Path, role: str, ids, names, matrix, model: str = None) -> dict:
+    """
+    Write a new generation of the role's gallery and return its header.
+    Holds the role's write lock, so concurrent writers (other workers, the
+    CLI) take turns instead of racing on the generation number and renames.
+    """
+    emb_dir = Path(emb_dir)
+    emb_dir.mkdir(parents=True, exist_ok=True)
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    count = len(ids)
+    dim = int(matrix.shape[1]) if count else 0
+    with role_lock(emb_dir, role, "write"):
+        previous = read_header(emb_dir, role)
+        generation = (previous["generation"] + 1) if previous else 1
+        prefix = f"{_prefix(role)}.{generation}.{os.urandom(4).hex()}"
+        header = {
+            "format_version": FORMAT_VERSION,
+            "role": role,
+            "generation": generation,
+            "count": count,
+            "dim": dim,
+            "dtype": "float32",
+            "model": model or MODEL_BY_DIM.get(dim, "unknown"),
+            "matrix": f"{prefix}.f32",
+            "ids": f"{prefix}.ids.json",
+        }
+        _write_atomic(emb_dir / header["matrix"], matrix.tobytes())
+        _write_atomic(emb_dir / header["ids"],
+                      json.dumps({"ids": list(ids), "names": list(names)}).encode("utf-8"))
+        _write_atomic(header_file(emb_dir, role), json.dumps(header, indent=2).encode("utf-8"))
+        _remove_old_generations(emb_dir, role, keep={generation, generation - 1})
+    return header
+
+def _remove_old_generations(emb_dir: Path, role: str, keep: set) -> None:
+    # the previous generation is kept for readers that mapped it just before the swap
+    prefix = _prefix(role) + "."
+    for f in emb_dir.glob(prefix + "*"):
+        gen = f.name[len(prefix):].split(".", 1)[0]
+        if gen.isdigit() and int(gen) not in keep:
+            try:
+                f.unlink()
+            except OSError:
+                pass  # gone already, or still mapped on a platform that forbids deleting it
+
+def open_gallery(emb_dir: Path, role: str, header: dict = None):
+    """
+    (header, ids, names, matrix) for the role's current generation, or None.
+    matrix is a read-only np.memmap; nothing is copied into process memory.
+    """
+    emb_dir = Path(emb_dir)
+    header = header or read_header(emb_dir, role)
+    if header is None:
+        return None
+    with open(emb_dir / header["ids"], "r", encoding="utf-8") as fh:
+        sidecar = json.load(fh)
+    count, dim = header["count"], header["dim"]
+    if count == 0:
+        matrix = np.empty((0, dim), dtype=np.float32)
+    else:
+        matrix = np.memmap(emb_dir / header["matrix"], dtype=np.float32, mode="r", shape=(count, dim))
+    return header, sidecar["ids"], sidecar["names"], matrix
+
+def rows_from_dict(data: dict):
+    """
+    ids, names and stacked rows from a pickled embeddings dict, either keyed
+    by id (backend builds) or by folder name with an "id" field
+    (generate_embeddings.py).
+    """
+    ids, names, rows = [], [], []
+    for key, rec in data.items():
+        ids.append(rec.get("id", key))
+        names.append(rec["name"])
+        rows.append(np.asarray(rec["embedding"], dtype=np.float32).reshape(-1))
+    matrix = np.vstack(rows) if rows else np.empty((0, 0), dtype=np.float32)
+    return ids, names, matrix
+
+def convert_legacy(npy_file: Path, emb_dir: Path, role: str, model: str = None) -> dict:
+    """Convert a pickled-dict .npy embeddings file into the gallery format."""
+    data = np.load(npy_file, allow_pickle=True).item()
+    ids, names, matrix = rows_from_dict(data)
+    return write_gallery(emb_dir, role, ids, names, matrix, model=model)
+
+def main():
+    parser = argparse.ArgumentParser(description="Gallery store tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    conv = sub.add_parser("convert", help="convert a pickled .npy embeddings file")
+    conv.add_argument("npy_file")
+    conv.add_argument("--role", required=True, choices=["students", "teachers"])
+    conv.add_argument("--out", help="output directory (default: next to the input file)")
+    conv.add_argument("--model", help="model name for the header (default: dlib for 128-d rows, else unknown)")
+    args = parser.parse_args()
+
+    if args.cmd == "convert":
+        src = Path(args.npy_file)
+        header = convert_legacy(src, Path(args.out) if args.out else src.parent, args.role, args.model)
+        print(f"Wrote {header['count']} x {header['dim']} ({header['model']}) "
+              f"generation {header['generation']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Timetable lookups for room-scoped recognition.
+
+A kiosk tied to a room asks session_scope(role, room) which class is
+timetabled there right now and who is expected: the class roster for
+students, the session's teacher for teachers. Timetable times have minute
+resolution, so the answer is cached per (room, day, minute) and a busy
+kiosk costs one indexed query a minute; rosters are cached for
+TIMETABLE_CACHE_SECONDS (uploads clear both caches in this process).
+A cache hit touches no database connection.
+"""
+import datetime
+import os
+import threading
+import time
+from sqlalchemy import select
+from backend.database import read_engine
+from backend.models import Schedule, ClassRoster
+
+TIMETABLE_CACHE_SECONDS = float(os.getenv("TIMETABLE_CACHE_SECONDS", "30"))
+DAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+_MAX_CACHED = 4096
+
+_sessions: dict = {}  # (room, day, "HH:MM") -> (expires, session dict or None)
+_rosters: dict = {}   # class_id -> (expires, frozenset of student ids)
+_lock = threading.Lock()
+
+def current_session(conn, room: str, when: datetime.datetime):
+    """The schedules row running in room at when, as a dict, or None."""
+    s = Schedule.__table__
+    hhmm = when.strftime("%H:%M")
+    row = conn.execute(
+        select(s).where(s.c.room == room, s.c.day == DAY_NAMES[when.weekday()],
+                        s.c.start_time <= hhmm, s.c.end_time > hhmm)
+        .order_by(s.c.start_time.desc()).limit(1)
+    ).mappings().first()
+    return dict(row) if row else None
+
+def class_roster(conn, class_id: str) -> frozenset:
+    t = ClassRoster.__table__
+    return frozenset(r[0] for r in conn.execute(select(t.c.student_id).where(t.c.class_id == class_id)))
+
+def _cached(cache: dict, key, load):
+    """
+    Cached value for key, or load() it. Loads run outside the lock: two
+    threads missing together both query and store the same answer.
+    """
+    now = time.monotonic()
+    with _lock:
+        hit = cache.get(key)
+    if hit is not None and hit[0] > now:
+        return hit[1]
+    value = load()
+    with _lock:
+        if len(cache) >= _MAX_CACHED:
+            cache.clear()
+        cache[key] = (now + TIMETABLE_CACHE_SECONDS, value)
+    return value
+
+def _query(fn, *args):
+    with read_engine.connect() as conn:
+        return fn(conn, *args)
+
+def session_scope(role: str, room: str, when: datetime.datetime = None):
+    """
+    (class_id, frozenset of expected person ids) for the session in room
+    at when (default now), or None if nothing is timetabled there or
+    nobody is expected. Blocking, but only on a cache miss: a connection
+    is taken from the read pool only to load what is not cached.
+    """
+    if not room:
+        return None
+    when = when or datetime.datetime.now()
+    key = (room, when.weekday(), when.strftime("%H:%M"))
+    session = _cached(_sessions, key, lambda: _query(current_session, room, when))
+    if session is None:
+        return None
+    if role == "teachers":
+        ids = frozenset([session["teacher_id"]]) if session["teacher_id"] else frozenset()
+    else:
+        ids = _cached(_rosters, session["class_id"], lambda: _query(class_roster, session["class_id"]))
+    return (session["class_id"], ids) if ids else None
+
+def clear_cache() -> None:
+    with _lock:
+        _sessions.clear()
+        _rosters.clear()
@@ -0,0 +1,98 @@
+"""
+Startup: schema, warmup and readiness.
+
+Importing the app loads nothing heavy; dlib, the encoder weights and the
+galleries are loaded on first use. warmup() makes that first use happen
+before traffic does: it maps both galleries, loads the detector and
+encoder and runs one inference on a blank frame. With
+RECOGNITION_EXECUTOR=process every worker process does the same in its
+initializer before taking work, and warmup starts all of them: the
+server is not ready until each one has answered.
+
+    WARMUP=background  serve at once, warm up in a thread (default)
+    WARMUP=blocking    finish warming up before the server accepts connections
+    WARMUP=off         load everything on first use
+
+/api/health is liveness and always answers; /api/ready answers 503 until
+warmup has finished, so a rolling restart only sends traffic to a worker
+once its first request will be as fast as the rest.
+"""
+import os
+import threading
+import time
+import numpy as np
+from backend.database import Base, engine
+from backend.migrations import run_migrations
+from backend import models  # noqa: F401  (registers the tables on Base)
+
+WARMUP = os.getenv("WARMUP", "background")
+WARMUP_POOL_TIMEOUT = float(os.getenv("WARMUP_POOL_TIMEOUT", "120"))
+ROLES = ("students", "teachers")
+
+_state = {"status": "pending", "steps": {}, "error": None}
+_lock = threading.Lock()
+
+def prepare_database() -> None:
+    """Create missing tables and apply pending migrations."""
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+def warm_models() -> float:
+    """Load the detector, pre-filter and encoder and run them once; returns the seconds taken."""
+    from backend.utils import detection, encoders
+    t0 = time.perf_counter()
+    frame = np.zeros((detection.DECODE_MAX_WIDTH or 480, detection.DECODE_MAX_WIDTH or 480, 3), dtype=np.uint8)
+    detection.maybe_has_face(frame)
+    detection.face_locations(frame)
+    encoders.get_encoder().encode(frame, [(40, 120, 120, 40)])
+    return time.perf_counter() - t0
+
+def _step(name: str, fn) -> None:
+    t0 = time.perf_counter()
+    fn()
+    _state["steps"][name] = round(time.perf_counter() - t0, 3)
+
+def _galleries() -> None:
+    from backend.utils.embeddings import get_gallery
+    for role in ROLES:
+        get_gallery(role)
+
+def _pool() -> None:
+    from backend.utils.recognition import pool
+    started = pool.start_workers(WARMUP_POOL_TIMEOUT)
+    _state["recognition_workers"] = {"warm": started, "total": pool.workers}
+    if started < pool.workers:
+        raise RuntimeError(f"only {started} of {pool.workers} recognition workers warmed up "
+                           f"within {WARMUP_POOL_TIMEOUT:g}s")
+
+def warmup() -> None:
+    with _lock:
+        if _state["status"] != "pending":
+            return
+        _state["status"] = "warming"
+    t0 = time.perf_counter()
+    try:
+        _step("galleries", _galleries)
+        _step("models", warm_models)
+        _step("recognition_pool", _pool)
+    except Exception as exc:
+        _state["error"] = f"{type(exc).__name__}: {exc}"
+        _state["status"] = "failed"
+    else:
+        _state["status"] = "ready"
+    _state["seconds"] = round(time.perf_counter() - t0, 3)
+
+def start() -> None:
+    """Run warmup() as configured by WARMUP."""
+    if WARMUP == "off":
+        _state["status"] = "ready"
+    elif WARMUP == "blocking":
+        warmup()
+    else:
+        threading.Thread(target=warmup, name="warmup", daemon=True).start()
+
+def ready() -> bool:
+    return _state["status"] == "ready"
+
+def status() -> dict:
+    return {**_state, "steps": dict(_state["steps"])}
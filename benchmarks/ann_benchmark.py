@@ -0,0 +1,84 @@
+"""
+Recall vs latency of the IVF index against exact search.
+
+    python -m benchmarks.ann_benchmark --identities 100000 --dim 128 --nprobe 1 4 8 16 32
+
+Gallery rows are drawn around random cluster centres (real face embeddings
+are far from uniform) and queries are gallery rows plus noise, so the exact
+nearest neighbour is known. recall@1 is the fraction of queries for which
+the indexed search returns the same identity as the exact scan.
+"""
+import argparse
+import json
+import time
+import numpy as np
+from backend.utils.ann import IVFIndex, ids_digest
+from backend.utils.embeddings import Gallery
+
+def synthetic_gallery(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    x = centres[rng.integers(0, clusters, size=n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x.astype(np.float32)
+
+def _time_queries(gallery: Gallery, queries: np.ndarray):
+    rows, lat = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        i, _ = gallery._nearest(q)
+        lat.append(time.perf_counter() - t0)
+        rows.append(i)
+    lat = np.array(lat) * 1000.0
+    return np.array(rows), {"p50_ms": float(np.percentile(lat, 50)),
+                            "p95_ms": float(np.percentile(lat, 95)),
+                            "mean_ms": float(lat.mean())}
+
+def run(identities: int, dim: int, queries: int, nlist: int, nprobes: list, clusters: int, noise: float) -> dict:
+    x = synthetic_gallery(identities, dim, clusters)
+    ids = [f"P{i}" for i in range(identities)]
+    gallery = Gallery(ids, ids, x)
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, identities, size=queries)
+    q = x[picks] + noise * rng.normal(size=(queries, dim)).astype(np.float32)
+
+    exact_rows, exact_lat = _time_queries(gallery, q)
+    t0 = time.perf_counter()
+    index = IVFIndex.build(x, nlist=nlist, digest=ids_digest(ids))
+    build_s = time.perf_counter() - t0
+
+    results = {"identities": identities, "dim": dim, "queries": queries, "nlist": index.nlist,
+               "index_build_s": round(build_s, 3), "exact": exact_lat, "ivf": []}
+    for nprobe in nprobes:
+        gallery.attach_index(index, nprobe)
+        rows, lat = _time_queries(gallery, q)
+        recall = float(np.mean(rows == exact_rows))
+        results["ivf"].append({"nprobe": nprobe, "recall_at_1": recall, **lat})
+    gallery.index = None
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--identities", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nlist", type=int, default=0, help="0 = about 4 * sqrt(identities)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=0.1)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    res = run(args.identities, args.dim, args.queries, args.nlist, args.nprobe, args.clusters, args.noise)
+    print(f"{res['identities']} identities, dim {res['dim']}, nlist {res['nlist']}, "
+          f"index built in {res['index_build_s']}s")
+    print(f"exact      p50 {res['exact']['p50_ms']:.3f} ms  p95 {res['exact']['p95_ms']:.3f} ms")
+    for r in res["ivf"]:
+        print(f"nprobe {r['nprobe']:>3} p50 {r['p50_ms']:.3f} ms  p95 {r['p95_ms']:.3f} ms  "
+              f"recall@1 {r['recall_at_1']:.4f}")
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(res, fh, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Offline benchmark suite for recognition, enrollment and attendance writes.
+
+    python -m benchmarks.run --json results.json
+    python -m benchmarks.run --suites match writer --sizes 1000 100000 --dims 128 512
+    python -m benchmarks.run --images fixtures/faces --json new.json --compare results.json
+
+Everything runs against a scratch workspace (temporary database, dataset
+and embeddings directories); the real attendance.db and galleries are never
+touched. Galleries are random unit vectors; images are JPEG fixtures from
+--images if given, otherwise synthetic frames (which contain no face, so
+recognize/build then measure decode + detection only).
+
+Suites:
+    match      match_embedding latency per gallery size and dimension
+    recognize  /api/recognize/student latency under concurrent load (TestClient)
+    build      build_embeddings_for throughput, full and incremental
+    writer     attendance insert throughput through the group-commit writer
+
+Results are written as JSON. --compare flags metrics that regressed by
+more than --tolerance against an earlier run and exits non-zero if any did.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+import numpy as np
+
+SUITES = ("match", "recognize", "build", "writer")
+
+def _percentiles(seconds: list) -> dict:
+    ms = np.array(seconds) * 1000.0
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), "mean_ms": float(ms.mean())}
+
+def unit_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    x = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+def synthetic_jpeg(rng, width: int = 640, height: int = 480) -> bytes:
+    from PIL import Image
+    buf = BytesIO()
+    Image.fromarray((rng.random((height, width, 3)) * 255).astype(np.uint8)).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+def load_images(images_dir: str, count: int, seed: int = 0) -> list:
+    if images_dir:
+        files = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+        if not files:
+            raise SystemExit(f"No images in {images_dir}")
+        return [files[i % len(files)].read_bytes() for i in range(count)]
+    rng = np.random.default_rng(seed)
+    return [synthetic_jpeg(rng) for _ in range(count)]
+
+def workspace(root: Path):
+    """Point the backend at scratch storage; must run before backend modules are imported."""
+    os.environ["ATTENDANCE_DB_PATH"] = str(root / "bench.db")
+    from backend.utils import embeddings
+    embeddings.DATASET_DIR = root / "dataset"
+    embeddings.EMB_DIR = root / "embeddings"
+    embeddings.EMB_DIR.mkdir(parents=True, exist_ok=True)
+    return embeddings
+
+def install_gallery(embeddings, role: str, n: int, dim: int, model: str = "synthetic"):
+    from backend.utils import store
+    x = unit_vectors(n, dim)
+    ids = [f"P{i}" for i in range(n)]
+    store.write_gallery(embeddings.EMB_DIR, role, ids, ids, x, model=model)
+    embeddings.invalidate_gallery(role)
+    g = embeddings.get_gallery(role)
+    embeddings._publish_gallery(role, g)  # builds the IVF index when the gallery is large enough
+    return x
+
+def bench_match(embeddings, sizes: list, dims: list, queries: int) -> list:
+    out = []
+    rng = np.random.default_rng(1)
+    for dim in dims:
+        for n in sizes:
+            x = install_gallery(embeddings, "students", n, dim)
+            q = x[rng.integers(0, n, size=queries)] + 0.01 * rng.normal(size=(queries, dim)).astype(np.float32)
+            embeddings.match_embedding(q[0], "students")  # warm the cache
+            lat = []
+            for v in q:
+                t0 = time.perf_counter()
+                embeddings.match_embedding(v, "students")
+                lat.append(time.perf_counter() - t0)
+            g = embeddings.get_gallery("students")
+            out.append({"identities": n, "dim": dim, "indexed": g.index is not None,
+                        "queries_per_s": queries / sum(lat), **_percentiles(lat)})
+    return out
+
+def bench_recognize(embeddings, images: list, identities: int, concurrency: list, requests: int) -> list:
+    from fastapi.testclient import TestClient
+    from backend.main import app
+    from backend.utils import encoders
+    # tagged with the serving encoder, or recognition refuses the gallery
+    encoder = encoders.get_encoder()
+    install_gallery(embeddings, "students", identities, encoder.dim, model=encoder.name)
+    out = []
+    with TestClient(app) as client:  # runs the startup hook: schema and warmup
+        for c in concurrency:
+            def one(i):
+                t0 = time.perf_counter()
+                # a distinct kiosk id per request keeps the frame-reuse cache out of the measurement
+                r = client.post("/api/recognize/student", headers={"x-kiosk-id": f"bench-{c}-{i}"},
+                                files={"file": ("frame.jpg", images[i % len(images)], "image/jpeg")})
+                return time.perf_counter() - t0, r.status_code
+            one(0)  # warm-up: frame pools and caches
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=c) as ex:
+                results = list(ex.map(one, range(requests)))
+            wall = time.perf_counter() - t0
+            statuses = {}
+            for _, code in results:
+                statuses[str(code)] = statuses.get(str(code), 0) + 1
+            out.append({"concurrency": c, "requests": requests, "requests_per_s": requests / wall,
+                        "statuses": statuses, **_percentiles([r[0] for r in results])})
+    return out
+
+def bench_build(embeddings, images: list, people: int, per_person: int, workers: int) -> dict:
+    base = embeddings.DATASET_DIR / "students"
+    shutil.rmtree(base, ignore_errors=True)
+    k = 0
+    for p in range(people):
+        d = base / f"B{p:05d}_Bench_{p}"
+        d.mkdir(parents=True)
+        for i in range(per_person):
+            (d / f"{i:03d}.jpg").write_bytes(images[k % len(images)])
+            k += 1
+    t0 = time.perf_counter()
+    embeddings.build_embeddings_for("students", full=True, workers=workers)
+    full_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    embeddings.build_embeddings_for("students", workers=workers)
+    incremental_s = time.perf_counter() - t0
+    return {"people": people, "images": k, "workers": workers, "full_s": full_s,
+            "images_per_s": k / full_s, "incremental_noop_s": incremental_s}
+
+def bench_writer(rows: int, people: int) -> dict:
+    from backend.utils import warmup
+    from backend.utils.attendance_writer import writer
+    warmup.prepare_database()
+    day0 = datetime.datetime(2000, 1, 1, 9, 0)
+    t0 = time.perf_counter()
+    futures = [writer.submit("students", f"W{i % people}", day0 + datetime.timedelta(days=i // people))
+               for i in range(rows)]
+    inserted = sum(1 for f in futures if f.result())
+    wall = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    dupes = [writer.submit("students", f"W{i % people}", day0) for i in range(min(rows, people))]
+    ignored = sum(1 for f in dupes if not f.result())
+    dupe_wall = time.perf_counter() - t0
+    return {"rows": rows, "inserted": inserted, "rows_per_s": rows / wall,
+            "duplicates": len(dupes), "ignored": ignored, "duplicates_per_s": len(dupes) / dupe_wall}
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """{"suite.case.metric": value} for every numeric metric; list entries are keyed by their parameters."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, list):
+            for item in value:
+                params = ",".join(f"{k}={item[k]}" for k in ("identities", "dim", "concurrency") if k in item)
+                flat.update(flatten({k: v for k, v in item.items() if k not in ("identities", "dim", "concurrency")},
+                                    f"{name}[{params}]."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def _direction(metric: str) -> int:
+    # +1: higher is better, -1: lower is better, 0: not a performance metric
+    if metric.endswith("_per_s"):
+        return 1
+    if metric.endswith("_ms") or metric.endswith("_s"):
+        return -1
+    return 0
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list:
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    regressions = []
+    for metric in sorted(set(old) & set(new)):
+        sign = _direction(metric)
+        if not sign or not old[metric]:
+            continue
+        change = (new[metric] - old[metric]) / old[metric]
+        worse = -change * sign
+        flag = "REGRESSION" if worse > tolerance else ""
+        print(f"{metric:<70} {old[metric]:>12.4f} {new[metric]:>12.4f} {change:+8.1%} {flag}")
+        if flag:
+            regressions.append(metric)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dims", type=int, nargs="+", default=[128, 512])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--images", help="directory of JPEG/PNG fixtures (default: synthetic frames)")
+    parser.add_argument("--identities", type=int, default=1000, help="gallery size for the recognize suite")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--build-people", type=int, default=50)
+    parser.add_argument("--build-images", type=int, default=5, help="images per person")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--writer-rows", type=int, default=20000)
+    parser.add_argument("--writer-people", type=int, default=500)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch workspace")
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix="attendance-bench-"))
+    embeddings = workspace(root)
+    images = None
+    if "recognize" in args.suites or "build" in args.suites:
+        images = load_images(args.images, max(args.requests, args.build_people * args.build_images))
+    knobs = {k: v for k, v in os.environ.items()
+             if k.startswith(("ANN_", "RECOGNITION_", "DETECT", "DECODE_", "ATTENDANCE_WRITER_", "EMBEDDING_"))}
+    report = {"meta": {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                       "python": sys.version.split()[0], "numpy": np.__version__,
+                       "platform": platform.platform(), "cpus": os.cpu_count(),
+                       "images": args.images or "synthetic", "args": vars(args), "env": knobs},
+              "results": {}}
+    try:
+        if "match" in args.suites:
+            report["results"]["match"] = bench_match(embeddings, args.sizes, args.dims, args.queries)
+        if "recognize" in args.suites:
+            report["results"]["recognize"] = bench_recognize(embeddings, images, args.identities,
+                                                             args.concurrency, args.requests)
+        if "build" in args.suites:
+            report["results"]["build"] = bench_build(embeddings, images, args.build_people,
+                                                     args.build_images, args.workers)
+        if "writer" in args.suites:
+            report["results"]["writer"] = bench_writer(args.writer_rows, args.writer_people)
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print(json.dumps(report["results"], indent=2))
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(report, fh, indent=2)
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        if compare(baseline, report, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,23 @@
 import cv2
 import os
+import queue
+import threading
 import time
 import streamlit as st
 import numpy as np
 import re
 
+# Best-frames mode: frames are read continuously by a background thread,
+# faces are detected on a copy no wider than DETECT_WIDTH and every face is
+# scored; the best diverse frames are written by a second thread.
+DETECT_WIDTH = 320
+MIN_FACE_SIZE = 60          # px in the full frame, as in timed mode
+MIN_SHARPNESS = 40.0        # Laplacian variance of the 160x160 face; below is motion blur
+SHARPNESS_TARGET = 300.0    # sharpness counted as "fully sharp" when scoring
+FACE_SIZE_TARGET = 0.35     # face width / frame width counted as "close enough"
+MIN_DIVERSITY = 0.25        # mean abs difference of normalised 32x32 face thumbnails between kept frames
+MAX_CANDIDATES = 150        # candidate face crops held in memory while capturing
+
 # Title of the Streamlit app
 st.title("📸 Face Data Capture (Local Only)")
 
@@ -30,7 +43,10 @@ user_id = sanitize_id(raw_id)
 unique_user = f"{user_id}_{user_name}" if user_id and user_name else None
 
 # Image capture configuration
+mode = st.radio("Capture mode:", ["Best frames (fast)", "Timed (one every 3 s)"])
 max_images = st.slider("Number of images to capture:", 10, 50, 30)
+if mode.startswith("Best"):
+    capture_seconds = st.slider("Seconds to record (turn your head slowly while recording):", 3, 20, 8)
 capture_btn = st.button("Start Capture")
 
 # Placeholder for showing the webcam feed
@@ -46,19 +62,165 @@ def enhance_image(img):
     sharpened = cv2.convertScaleAbs(equalized, alpha=1.5, beta=0)
     return cv2.cvtColor(sharpened, cv2.COLOR_GRAY2BGR)
 
-# Handle the image capture logic
-if capture_btn and unique_user:
-    local_path = os.path.join("dataset", unique_user)
-    os.makedirs(local_path, exist_ok=True)
+def face_image(frame, box):
+    """The saved form of a face: enhanced 160x160 crop"""
+    x, y, w, h = box
+    return cv2.resize(enhance_image(frame[y:y+h, x:x+w]), (160, 160), interpolation=cv2.INTER_AREA)
 
-    cap = cv2.VideoCapture(0)
-    st.info("🔄 Initializing camera...")
-    time.sleep(3)
+class CameraReader:
+    """Reads the camera in a background thread; latest() returns the newest frame and its number"""
+
+    def __init__(self, cap):
+        self.cap = cap
+        self.frame = None
+        self.seq = 0
+        self.failed = False
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            with self._cond:
+                if not ret:
+                    self.failed = True
+                    self._cond.notify_all()
+                    return
+                self.frame, self.seq = frame, self.seq + 1
+                self._cond.notify_all()
+
+    def latest(self, after=0, timeout=1.0):
+        """Newest frame numbered after `after`, waiting up to timeout; (None, seq) on failure"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > after or self.failed, timeout)
+            if self.seq <= after:
+                return None, self.seq
+            return self.frame, self.seq
+
+    def stop(self):
+        self._running = False
+        self._thread.join(timeout=2)
+
+class ImageWriter:
+    """JPEG-encodes and writes face images in a background thread"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.written = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            filename, img = item
+            ok, data = cv2.imencode(".jpg", img)
+            if ok:
+                with open(os.path.join(self.folder, filename), "wb") as fh:
+                    fh.write(data.tobytes())
+                self.written += 1
+
+    def put(self, filename, img):
+        self._queue.put((filename, img))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+def detect_faces(frame):
+    """Haar boxes (x, y, w, h) in frame coordinates, detected on a copy at most DETECT_WIDTH wide"""
+    scale = min(1.0, DETECT_WIDTH / frame.shape[1])
+    small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else frame
+    gray = cv2.equalizeHist(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY))
+    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=6,
+                                          minSize=(max(1, int(MIN_FACE_SIZE * scale)),) * 2)
+    return [tuple(int(round(v / scale)) for v in f) for f in faces]
+
+def score_face(frame, box):
+    """(quality, thumbnail) of one face, or (None, None) if it is too blurry to keep"""
+    x, y, w, h = box
+    gray = cv2.resize(cv2.cvtColor(frame[y:y+h, x:x+w], cv2.COLOR_BGR2GRAY), (160, 160),
+                      interpolation=cv2.INTER_AREA)
+    sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+    if sharpness < MIN_SHARPNESS:
+        return None, None
+    size = w / frame.shape[1]
+    quality = 0.7 * min(sharpness / SHARPNESS_TARGET, 1.0) + 0.3 * min(size / FACE_SIZE_TARGET, 1.0)
+    # pose signature: a tiny normalised thumbnail; different head poses differ a lot
+    thumb = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    thumb = (thumb - thumb.mean()) / (thumb.std() + 1e-6)
+    return quality, thumb
 
+def select_best(candidates, k):
+    """
+    Greedy best-K: highest quality first, skipping frames within
+    MIN_DIVERSITY of one already kept; tops up with the best of the
+    rest if too few poses were different enough.
+    """
+    ranked = sorted(candidates, key=lambda c: c["quality"], reverse=True)
+    chosen = []
+    for c in ranked:
+        if all(np.abs(c["thumb"] - o["thumb"]).mean() >= MIN_DIVERSITY for o in chosen):
+            chosen.append(c)
+            if len(chosen) == k:
+                return chosen
+    chosen_ids = {id(c) for c in chosen}
+    return chosen + [c for c in ranked if id(c) not in chosen_ids][:k - len(chosen)]
+
+def show(frame, box, msg, color):
+    annotated = frame.copy()
+    if box is not None:
+        x, y, w, h = box
+        cv2.rectangle(annotated, (x, y), (x+w, y+h), color, 2)
+    cv2.putText(annotated, msg, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+    frame_placeholder.image(cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB), channels="RGB")
+
+def capture_best(camera, local_path):
+    """Record for capture_seconds, keep the best max_images diverse faces; returns the number saved"""
+    candidates = []
+    progress = st.progress(0.0)
+    seq = 0
+    start = time.time()
+    while time.time() - start < capture_seconds:
+        frame, seq = camera.latest(seq)
+        if frame is None:
+            st.error("⚠ Webcam not accessible.")
+            break
+        faces = detect_faces(frame)
+        if len(faces) != 1:
+            show(frame, None, "❌ No face" if not faces else "❌ Multiple faces", (0, 0, 255))
+            continue
+        box = faces[0]
+        quality, thumb = score_face(frame, box)
+        if quality is None:
+            show(frame, box, "Hold still", (0, 165, 255))
+            continue
+        candidates.append({"quality": quality, "thumb": thumb, "face": face_image(frame, box)})
+        if len(candidates) > MAX_CANDIDATES:
+            # thin out the pool: drop the lower-quality half of two near-identical frames
+            candidates = select_best(candidates, MAX_CANDIDATES // 2)
+        show(frame, box, f"✅ {len(candidates)} candidate frames", (0, 255, 0))
+        progress.progress(min(1.0, (time.time() - start) / capture_seconds))
+    progress.progress(1.0)
+
+    writer = ImageWriter(local_path)
+    for i, c in enumerate(select_best(candidates, max_images)):
+        writer.put(f"{i}.jpg", c["face"])
+    writer.close()
+    return writer.written
+
+def capture_timed(camera, local_path):
+    """One face every 3 seconds until max_images are saved; returns the number saved"""
     count = 0
+    seq = 0
     while count < max_images:
-        ret, frame = cap.read()
-        if not ret:
+        frame, seq = camera.latest(seq)
+        if frame is None:
             st.error("⚠ Webcam not accessible.")
             break
 
@@ -67,34 +229,44 @@ if capture_btn and unique_user:
         faces = face_cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=6)
 
         if len(faces) != 1:
-            annotated = frame.copy()
-            msg = "❌ No face" if len(faces) == 0 else "❌ Multiple faces"
-            cv2.putText(annotated, msg, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-            frame_placeholder.image(cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB), channels="RGB")
+            show(frame, None, "❌ No face" if len(faces) == 0 else "❌ Multiple faces", (0, 0, 255))
             continue
 
         (x, y, w, h) = faces[0]
-        if w < 60 or h < 60:
-            cv2.putText(frame, "⬆ Move closer", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-            frame_placeholder.image(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), channels="RGB")
+        if w < MIN_FACE_SIZE or h < MIN_FACE_SIZE:
+            show(frame, None, "⬆ Move closer", (0, 0, 255))
             continue
 
         # Save face
         face_img = frame[y:y+h, x:x+w]
         face_resized = cv2.resize(face_img, (160, 160), interpolation=cv2.INTER_AREA)
-        filename = f"{count}.jpg"
-        cv2.imwrite(os.path.join(local_path, filename), face_resized)
+        cv2.imwrite(os.path.join(local_path, f"{count}.jpg"), face_resized)
 
         # Show capture status
-        annotated = frame.copy()
-        cv2.rectangle(annotated, (x, y), (x+w, y+h), (0, 255, 0), 2)
-        cv2.putText(annotated, f"✅ Saved {count+1}/{max_images}", (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-        frame_placeholder.image(cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB), channels="RGB")
+        show(frame, (x, y, w, h), f"✅ Saved {count+1}/{max_images}", (255, 255, 255))
 
         count += 1
         time.sleep(3)
+    return count
+
+# Handle the image capture logic
+if capture_btn and unique_user:
+    local_path = os.path.join("dataset", unique_user)
+    os.makedirs(local_path, exist_ok=True)
+
+    cap = cv2.VideoCapture(0)
+    st.info("🔄 Initializing camera...")
+    camera = CameraReader(cap)
+    # wait for the first frame instead of a fixed delay
+    if camera.latest(0, timeout=5)[0] is None:
+        count = 0
+        st.error("⚠ Webcam not accessible.")
+    elif mode.startswith("Best"):
+        count = capture_best(camera, local_path)
+    else:
+        count = capture_timed(camera, local_path)
 
+    camera.stop()
     cap.release()
     st.success(f"✅ Capture completed! {count} face images saved to: dataset/{unique_user}/")
 else:
@@ -48,21 +48,78 @@ function stopStream(stream){
   stream.getTracks().forEach(t => t.stop());
 }
 
-function captureFrame(videoEl){
+// Recognition frames are decoded server-side at no more than 640px wide
+// (DECODE_MAX_WIDTH); sending larger frames only costs upload and decode time.
+const CAPTURE_MAX_WIDTH = 640;
+
+function captureFrame(videoEl, maxWidth = CAPTURE_MAX_WIDTH){
   return new Promise(resolve => {
     try{
       const canvas = document.createElement('canvas');
-      canvas.width = videoEl.videoWidth || 1280;
-      canvas.height = videoEl.videoHeight || 720;
+      const w = videoEl.videoWidth || 1280, h = videoEl.videoHeight || 720;
+      const scale = maxWidth && w > maxWidth ? maxWidth / w : 1;
+      canvas.width = Math.round(w * scale);
+      canvas.height = Math.round(h * scale);
       const ctx = canvas.getContext('2d');
       ctx.drawImage(videoEl, 0, 0, canvas.width, canvas.height);
-      canvas.toBlob(blob => resolve(blob), 'image/jpeg', 0.9);
+      canvas.toBlob(blob => resolve(blob), 'image/jpeg', 0.85);
     }catch(e){
       resolve(null);
     }
   });
 }
 
+// Kiosk room: open the kiosk page as student.html?room=B12 (remembered in
+// localStorage). The server then matches the class timetabled in that room
+// first and tags attendance rows with it.
+function kioskRoom(){
+  const room = new URLSearchParams(location.search).get('room');
+  if(room) localStorage.setItem('kioskRoom', room);
+  return room || localStorage.getItem('kioskRoom') || '';
+}
+function withRoom(url){
+  const room = kioskRoom();
+  return room ? `${url}${url.includes('?') ? '&' : '?'}room=${encodeURIComponent(room)}` : url;
+}
+
+// Kiosk id: a random id remembered in localStorage and sent as X-Kiosk-Id, so
+// the server can reuse this camera's last match while the same person stands
+// still in front of it. Without it every frame is encoded.
+function kioskId(){
+  let id = localStorage.getItem('kioskId');
+  if(!id){
+    id = Math.random().toString(36).slice(2) + Date.now().toString(36);
+    localStorage.setItem('kioskId', id);
+  }
+  return id;
+}
+
+// Streaming recognition: one WebSocket per kiosk instead of an upload per tick.
+// role is 'student' or 'teacher'; onEvent receives the server's JSON events
+// ({event:'marked'|'already_marked'|'no_face'|'no_match'|'busy'|'error', ...}).
+// onClosed is called if the socket cannot be opened or drops (not when the
+// returned stop function is called), so the page can fall back to uploads.
+function streamRecognition(videoEl, role, onEvent, intervalMs = 300, onClosed = null){
+  const proto = location.protocol === 'https:' ? 'wss:' : 'ws:';
+  const ws = new WebSocket(withRoom(`${proto}//${location.host}/api/ws/recognize/${role}`));
+  ws.binaryType = 'arraybuffer';
+  let timer = null, stopped = false;
+  ws.onopen = () => {
+    timer = setInterval(async () => {
+      // skip a tick rather than queue frames behind a slow connection
+      if(ws.readyState !== WebSocket.OPEN || ws.bufferedAmount > 0) return;
+      const blob = await captureFrame(videoEl);
+      if(blob) ws.send(blob);
+    }, intervalMs);
+  };
+  ws.onmessage = e => { try{ onEvent(JSON.parse(e.data)); }catch(err){} };
+  ws.onclose = () => {
+    if(timer) clearInterval(timer);
+    if(!stopped && onClosed) onClosed();
+  };
+  return () => { stopped = true; if(timer) clearInterval(timer); ws.close(); };
+}
+
 // ---------- Demo storage (localStorage) ----------
 const LS_USERS = 'gf_demo_users_v1';
 const LS_ATT = 'gf_demo_attendance_v1';
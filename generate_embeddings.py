@@ -1,40 +1,117 @@
 import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 import torch
 import numpy as np
 import cv2
 from PIL import Image
 from facenet_pytorch import MTCNN, InceptionResnetV1
+from backend.utils import store, encoders
 
 # --------------------- Configuration ---------------------
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-# Face detector and FaceNet model
-mtcnn = MTCNN(image_size=160, margin=20, min_face_size=40, device=device)
-model = InceptionResnetV1(pretrained='vggface2').eval().to(device)
-
 # Dataset and output folders
 base_dataset_path = 'dataset'
 students_path = os.path.join(base_dataset_path, 'students')
 teachers_path = os.path.join(base_dataset_path, 'teachers')
 
 embeddings_dir = 'embeddings'
-os.makedirs(embeddings_dir, exist_ok=True)
+
+# Defaults for the batched build (override with --workers / --batch-size)
+DEFAULT_WORKERS = int(os.getenv("EMBEDDING_WORKERS", str(os.cpu_count() or 1)))
+DEFAULT_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+mtcnn = None
+model = None
+
+def load_models():
+    """Face detector and FaceNet model (created once, on first use)."""
+    global mtcnn, model
+    if model is None:
+        mtcnn = MTCNN(image_size=160, margin=20, min_face_size=40, device=device)
+        model = InceptionResnetV1(pretrained='vggface2').eval().to(device)
+    return mtcnn, model
 
 # ---------------------------------------------------------
 
-def generate_embeddings(source_dir: str) -> dict:
+def _read_rgb(image_path: str):
+    img_bgr = cv2.imread(image_path)
+    if img_bgr is None:
+        return None
+    img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+    return Image.fromarray(img_rgb)
+
+def _detect_faces(images: list, batch_size: int) -> list:
+    """
+    Run MTCNN over images in batches. MTCNN only batches images of equal
+    size, so images are grouped by size first. Returns one face tensor
+    (or None) per input image, in input order.
+    """
+    faces = [None] * len(images)
+    by_size = {}
+    for i, img in enumerate(images):
+        by_size.setdefault(img.size, []).append(i)
+    for idxs in by_size.values():
+        for start in range(0, len(idxs), batch_size):
+            chunk = idxs[start:start + batch_size]
+            out = mtcnn([images[i] for i in chunk])
+            for i, face in zip(chunk, out):
+                faces[i] = face
+    return faces
+
+def _embed_faces(faces: list, batch_size: int, encoder=None) -> list:
+    """
+    Batched InceptionResnetV1 forward pass; returns one (1, 512) array per face.
+    encoder: a backend.utils.encoders facenet backend (e.g. the int8 one)
+    to run instead of the eager model.
+    """
+    embeddings = []
+    for start in range(0, len(faces), batch_size):
+        batch = torch.stack(faces[start:start + batch_size])
+        if encoder is not None:
+            out = encoder.embed(batch.numpy())
+        else:
+            with torch.no_grad():
+                out = model(batch.to(device)).cpu().numpy()
+        embeddings.extend(row[None, :] for row in out)
+    return embeddings
+
+def generate_embeddings(source_dir: str, workers: int = 1, batch_size: int = 1, encoder=None) -> dict:
     """
     Generate embeddings for all subfolders inside source_dir.
     Each subfolder name format: ID_Name
+    Images are decoded on `workers` threads and run through MTCNN and
+    FaceNet `batch_size` at a time; batch_size=1 is the original
+    one-image-at-a-time behaviour and gives the same embeddings.
     """
+    load_models()
     embedding_dict = {}
     print(f"🔍 Generating embeddings from: {source_dir}")
 
-    for folder_name in os.listdir(source_dir):
+    # Collect (folder_name, image_path) pairs for the whole source_dir
+    entries = []
+    for folder_name in sorted(os.listdir(source_dir)):
         person_folder = os.path.join(source_dir, folder_name)
         if not os.path.isdir(person_folder):
             continue
+        for image_name in sorted(os.listdir(person_folder)):
+            entries.append((folder_name, os.path.join(person_folder, image_name)))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        decoded = list(pool.map(_read_rgb, [path for _, path in entries]))
+    entries = [(folder, img) for (folder, _), img in zip(entries, decoded) if img is not None]
+
+    # Detect and encode faces
+    faces = _detect_faces([img for _, img in entries], batch_size)
+    owners = [folder for (folder, _), face in zip(entries, faces) if face is not None]
+    vectors = _embed_faces([face for face in faces if face is not None], batch_size, encoder)
+
+    per_folder = {}
+    for folder_name, embedding in zip(owners, vectors):
+        per_folder.setdefault(folder_name, []).append(embedding)
 
+    for folder_name, embeddings in per_folder.items():
         # Extract ID and Name (split only once)
         parts = folder_name.split("_", 1)
         if len(parts) == 2:
@@ -43,44 +120,45 @@ def generate_embeddings(source_dir: str) -> dict:
             person_id, person_name = parts[0], "Unknown"
 
         person_name = person_name.replace(" ", "_")
-        embeddings = []
-
-        for image_name in os.listdir(person_folder):
-            image_path = os.path.join(person_folder, image_name)
-
-            img_bgr = cv2.imread(image_path)
-            if img_bgr is None:
-                continue
-
-            img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-            img_pil = Image.fromarray(img_rgb)
-
-            # Detect and encode face
-            face_tensor = mtcnn(img_pil)
-            if face_tensor is not None:
-                face_tensor = face_tensor.unsqueeze(0).to(device)
-                with torch.no_grad():
-                    embedding = model(face_tensor).cpu().numpy()
-                    embeddings.append(embedding)
-
-        if embeddings:
-            avg_embedding = np.mean(embeddings, axis=0)
-            embedding_dict[folder_name] = {
-                "id": person_id,
-                "name": person_name,
-                "embedding": avg_embedding
-            }
-            print(f"✅ Processed: {person_name} (ID: {person_id}, {len(embeddings)} images)")
+        avg_embedding = np.mean(embeddings, axis=0)
+        embedding_dict[folder_name] = {
+            "id": person_id,
+            "name": person_name,
+            "embedding": avg_embedding
+        }
+        print(f"✅ Processed: {person_name} (ID: {person_id}, {len(embeddings)} images)")
 
     return embedding_dict
 
 # ------------------ Generate & Save -----------------------
-# Students
-student_embeddings = generate_embeddings(students_path)
-np.save(os.path.join(embeddings_dir, 'student_embeddings.npy'), student_embeddings)
-print("💾 Saved student embeddings to embeddings/student_embeddings.npy")
-
-# Teachers
-teacher_embeddings = generate_embeddings(teachers_path)
-np.save(os.path.join(embeddings_dir, 'teacher_embeddings.npy'), teacher_embeddings)
-print("💾 Saved teacher embeddings to embeddings/teacher_embeddings.npy")
+def save_gallery(embedding_dict: dict, role: str, model_name: str = "facenet"):
+    """Write embeddings in the shared gallery format (see backend/utils/store.py)."""
+    ids, names, matrix = store.rows_from_dict(embedding_dict)
+    header = store.write_gallery(embeddings_dir, role, ids, names, matrix, model=model_name)
+    print(f"💾 Saved {role[:-1]} embeddings to {embeddings_dir}/{header['matrix']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate FaceNet embeddings for students and teachers")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="CPU threads for decoding and torch inference")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="images per MTCNN / InceptionResnetV1 batch (1 = sequential)")
+    parser.add_argument("--encoder", choices=("facenet", "facenet-int8"), default="facenet",
+                        help="facenet-int8: quantized CPU model (see python -m backend.utils.encoders)")
+    args = parser.parse_args()
+    encoder = encoders.get_encoder(args.encoder) if args.encoder != "facenet" else None
+
+    if device.type == 'cpu':
+        torch.set_num_threads(max(1, args.workers))
+    os.makedirs(embeddings_dir, exist_ok=True)
+
+    # Students
+    student_embeddings = generate_embeddings(students_path, args.workers, args.batch_size, encoder)
+    save_gallery(student_embeddings, 'students', args.encoder)
+
+    # Teachers
+    teacher_embeddings = generate_embeddings(teachers_path, args.workers, args.batch_size, encoder)
+    save_gallery(teacher_embeddings, 'teachers', args.encoder)
+
+if __name__ == "__main__":
+    main()
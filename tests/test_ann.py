@@ -0,0 +1,48 @@
+import numpy as np
+from backend.utils.ann import IVFIndex, ids_digest
+from backend.utils.embeddings import Gallery
+
+def clustered(n=2000, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32) * 5
+    return (centers[rng.integers(0, clusters, size=n)] + rng.normal(size=(n, dim))).astype(np.float32)
+
+def test_build_buckets_every_row_once():
+    x = clustered()
+    index = IVFIndex.build(x, nlist=16, seed=1)
+    assert index.nlist == 16
+    assert index.offsets[0] == 0 and index.offsets[-1] == len(x)
+    assert sorted(index.order.tolist()) == list(range(len(x)))
+
+def test_save_load_round_trip(tmp_path):
+    x = clustered()
+    index = IVFIndex.build(x, nlist=16, digest="abc")
+    path = tmp_path / "index.npz"
+    index.save(path)
+    loaded = IVFIndex.load(path)
+    assert loaded.digest == "abc"
+    np.testing.assert_array_equal(loaded.centroids, index.centroids)
+    np.testing.assert_array_equal(loaded.order, index.order)
+    np.testing.assert_array_equal(loaded.offsets, index.offsets)
+
+def test_candidates():
+    x = clustered()
+    index = IVFIndex.build(x, nlist=16)
+    assert sorted(index.candidates(x[0], index.nlist).tolist()) == list(range(len(x)))
+    rows = index.candidates(x[0], 2)
+    assert 0 in rows
+    assert len(rows) < len(x)
+
+def test_match_falls_back_to_exact_when_probed_buckets_are_empty():
+    x = clustered(n=200)
+    ids = [f"P{i}" for i in range(len(x))]
+    g = Gallery(ids, ids, x)
+    # two buckets, every row in the second; the query is nearest the empty first one
+    far = x.mean(axis=0) + 1000.0
+    index = IVFIndex(np.stack([far, x.mean(axis=0)]), np.arange(len(x)), [0, 0, len(x)], ids_digest(ids))
+    assert g.attach_index(index, nprobe=1)
+    q = far - 1.0
+    assert index.candidates(q, 1).size == 0
+    expected = int(np.argmin(np.linalg.norm(x - q, axis=1)))
+    assert g.match(q, threshold=1e9)[0] == ids[expected]
+    assert g.match_many([q, x[3]], threshold=1e9)[0][0] == ids[expected]
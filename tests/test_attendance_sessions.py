@@ -0,0 +1,45 @@
+import datetime
+from concurrent.futures import Future
+import pytest
+from sqlalchemy import create_engine, insert, text
+from backend.database import Base
+from backend.migrations import run_migrations
+from backend.models import ClassRoster
+from backend.utils import attendance_writer, rollups
+
+DAY = datetime.datetime(2026, 3, 2, 9, 0)
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'attendance.db'}")
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    monkeypatch.setattr(attendance_writer, "engine", engine)
+    return engine
+
+def write(*rows):
+    """Flush rows of (person, class_id, when) in one batch; returns the inserted flags."""
+    batch = [("students", pid, when, "Present", class_id, Future()) for pid, class_id, when in rows]
+    attendance_writer.AttendanceWriter()._flush(batch)
+    return [fut.result() for *_, fut in batch]
+
+def test_one_row_per_class_session(engine):
+    later = DAY.replace(hour=11)
+    assert write(("S1", "C1", DAY), ("S1", "C2", later), ("S1", "C1", later)) == [True, True, False]
+    assert write(("S1", None, DAY), ("S1", None, later)) == [True, False]
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM attendance_students")).scalar() == 3
+        # one present day for the person, one present row for each class
+        assert rollups.daily(conn, "students") == [{"date": DAY.date(), "present": 1}]
+        assert rollups.person_summary(conn, "students", "S1")["days_present"] == 1
+        assert rollups.class_summary(conn, "C2")["days"] == [{"date": DAY.date(), "present": 1}]
+
+def test_class_summary_uses_the_roster(engine):
+    with engine.begin() as conn:
+        conn.execute(insert(ClassRoster), [{"class_id": "C1", "student_id": f"S{i}"} for i in range(4)])
+    write(("S0", "C1", DAY), ("S1", "C1", DAY))
+    with engine.connect() as conn:
+        summary = rollups.class_summary(conn, "C1")
+        assert (summary["class_size"], summary["roster"], summary["percentage"]) == (4, True, 50.0)
+        summary = rollups.class_summary(conn, "C9")
+        assert (summary["class_size"], summary["roster"]) == (0, False)
@@ -0,0 +1,68 @@
+import asyncio
+import datetime
+import pytest
+from sqlalchemy import create_engine, text
+from backend.database import Base
+from backend.migrations import run_migrations
+from backend.utils import attendance_writer
+from backend.utils.attendance_writer import AttendanceWriter
+
+NOW = datetime.datetime(2026, 3, 2, 9, 0, 0, 123456)
+
+class CountingEngine:
+    """The writer's engine, counting transactions."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.transactions = 0
+
+    def begin(self):
+        self.transactions += 1
+        return self.engine.begin()
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'attendance.db'}")
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    counting = CountingEngine(engine)
+    monkeypatch.setattr(attendance_writer, "engine", counting)
+    return counting
+
+async def write_all(writer, rows):
+    return await asyncio.gather(*[writer.write("students", pid, NOW) for pid in rows])
+
+def test_concurrent_writes_share_one_transaction(engine):
+    writer = AttendanceWriter(max_batch=64, max_delay_ms=200)
+    results = asyncio.run(write_all(writer, [f"S{i}" for i in range(20)]))
+    assert results == [True] * 20
+    assert engine.transactions == 1
+    with engine.engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM attendance_students")).scalar() == 20
+        assert conn.execute(text("SELECT present FROM attendance_daily")).scalar() == 20
+        assert conn.execute(text("SELECT DISTINCT time FROM attendance_students")).scalar() == "09:00:00"
+
+def test_batches_are_capped(engine):
+    writer = AttendanceWriter(max_batch=4, max_delay_ms=200)
+    asyncio.run(write_all(writer, [f"S{i}" for i in range(10)]))
+    assert engine.transactions == 3
+
+def test_duplicate_resolves_false(engine):
+    writer = AttendanceWriter(max_delay_ms=50)
+    assert asyncio.run(write_all(writer, ["S1", "S1", "S2"])) == [True, False, True]
+    assert asyncio.run(write_all(writer, ["S1"])) == [False]
+    with engine.engine.connect() as conn:
+        assert conn.execute(text("SELECT present FROM attendance_daily")).scalar() == 2
+
+def test_db_error_rejects_every_future_in_the_batch(tmp_path, monkeypatch):
+    # no tables: the first insert fails and the transaction rolls back
+    monkeypatch.setattr(attendance_writer, "engine", create_engine(f"sqlite:///{tmp_path / 'empty.db'}"))
+    writer = AttendanceWriter(max_delay_ms=200)
+    futures = [writer.submit("students", f"S{i}", NOW) for i in range(5)]
+    for fut in futures:
+        with pytest.raises(Exception, match="no such table"):
+            fut.result(timeout=10)
+
+def test_unknown_role_is_refused():
+    with pytest.raises(ValueError):
+        AttendanceWriter().submit("parents", "P1", NOW)
@@ -0,0 +1,80 @@
+from io import BytesIO
+import numpy as np
+import pytest
+from PIL import Image
+from backend.utils import recognition
+from backend.utils.attendance_cache import RecentFrames, frame_signature
+
+BOX = (20, 80, 80, 20)
+
+def png(arr: np.ndarray) -> bytes:
+    buf = BytesIO()
+    Image.fromarray(arr).save(buf, format="PNG")
+    return buf.getvalue()
+
+def textured(seed=0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, size=(120, 160, 3), dtype=np.uint8)
+
+def blank(level=0) -> np.ndarray:
+    return np.full((120, 160, 3), level, dtype=np.uint8)
+
+class StubEncoder:
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, img, boxes):
+        self.calls += 1
+        return [np.zeros(128, dtype=np.float32)]
+
+@pytest.fixture
+def kiosk(monkeypatch):
+    """recognize_face with detection, encoding and matching replaced; returns the stubs."""
+    state = {"locs": [BOX], "match": ("S1", "Alice", 0.3)}
+    encoder = StubEncoder()
+    monkeypatch.setattr(recognition, "recent_frames", RecentFrames(ttl=60))
+    monkeypatch.setattr(recognition.detection, "maybe_has_face", lambda img: True)
+    monkeypatch.setattr(recognition.detection, "face_locations", lambda img, *a: list(state["locs"]))
+    monkeypatch.setattr(recognition.encoders, "get_encoder", lambda: encoder)
+    monkeypatch.setattr(recognition, "_match", lambda role, enc, e, scope: state["match"])
+    return state, encoder
+
+def test_flat_frames_have_no_signature():
+    assert frame_signature(blank(0)) is None
+    assert frame_signature(blank(200)) is None
+    assert frame_signature(textured()) is not None
+    assert RecentFrames(ttl=60).lookup("k", None, BOX) is None
+
+def test_same_frame_reuses_match(kiosk):
+    _, encoder = kiosk
+    frame = png(textured())
+    assert recognition.recognize_face(frame, "students", "k1")[0] == "S1"
+    assert recognition.recognize_face(frame, "students", "k1")[0] == "S1"
+    assert encoder.calls == 1
+
+def test_blank_frame_after_match_is_not_credited(kiosk):
+    state, encoder = kiosk
+    recognition.recognize_face(png(textured()), "students", "k1")
+    state["locs"] = []
+    with pytest.raises(recognition.RecognitionError) as exc:
+        recognition.recognize_face(png(blank()), "students", "k1")
+    assert exc.value.status_code == 404
+    # a flat frame the detector accepts is still encoded, never reused
+    state["locs"], state["match"] = [BOX], None
+    with pytest.raises(recognition.RecognitionError):
+        recognition.recognize_face(png(blank(3)), "students", "k1")
+    assert encoder.calls == 2
+
+def test_moved_face_is_encoded_again(kiosk):
+    state, encoder = kiosk
+    frame = png(textured())
+    recognition.recognize_face(frame, "students", "k1")
+    state["locs"] = [(60, 150, 110, 100)]
+    recognition.recognize_face(frame, "students", "k1")
+    assert encoder.calls == 2
+
+def test_no_reuse_without_kiosk_id(kiosk):
+    _, encoder = kiosk
+    frame = png(textured())
+    recognition.recognize_face(frame, "students", None)
+    recognition.recognize_face(frame, "students", None)
+    assert encoder.calls == 2
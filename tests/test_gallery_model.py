@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from backend.utils import encoders, recognition
+from backend.utils.embeddings import Gallery
+
+def legacy(dim):
+    return {f"S{i}": {"name": f"Student {i}", "embedding": np.full(dim, i, dtype=np.float32)} for i in range(3)}
+
+@pytest.mark.parametrize("gallery, encoder, ok", [
+    (Gallery.from_dict(legacy(128)), encoders.DlibEncoder, True),
+    (Gallery.from_dict(legacy(128)), encoders.FacenetEncoder, False),
+    (Gallery.from_dict(legacy(512)), encoders.DlibEncoder, False),
+    (Gallery(["S1"], ["Student"], np.zeros((1, 512), np.float32), model="facenet"), encoders.FacenetEncoder, True),
+    (Gallery(["S1"], ["Student"], np.zeros((1, 512), np.float32), model=None), encoders.FacenetEncoder, False),
+    (Gallery(["S1"], ["Student"], np.zeros((1, 128), np.float32), model="facenet"), encoders.FacenetEncoder, False),
+])
+def test_gallery_must_match_encoder(monkeypatch, gallery, encoder, ok):
+    monkeypatch.setattr(recognition, "get_gallery", lambda role: gallery)
+    encoder = encoder.__new__(encoder)  # no model load
+    if ok:
+        assert recognition._gallery("students", encoder) is gallery
+    else:
+        with pytest.raises(recognition.RecognitionError) as exc:
+            recognition._gallery("students", encoder)
+        assert exc.value.status_code == 503
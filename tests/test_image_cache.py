@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from PIL import Image
+from backend.utils import embeddings, encoders, store
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, "EMB_DIR", tmp_path / "embeddings")
+    monkeypatch.setattr(embeddings, "DATASET_DIR", tmp_path / "dataset")
+    monkeypatch.setattr(encoders, "get_encoder", lambda: encoders.DlibEncoder())
+    (tmp_path / "embeddings").mkdir()
+    return tmp_path
+
+def add_image(dirs, person: str, name: str, seed: int):
+    d = dirs / "dataset" / "students" / person
+    d.mkdir(parents=True, exist_ok=True)
+    pixels = np.random.default_rng(seed).integers(0, 256, size=(8, 8, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(d / name)
+    st = (d / name).stat()
+    return {"sha1": store.file_sha1(d / name), "mtime_ns": st.st_mtime_ns, "size": st.st_size,
+            "encodings": [np.full(128, seed, dtype=np.float32)], "model": "dlib", "dhash": seed}
+
+def test_upload_touches_only_the_persons_sidecar(dirs, monkeypatch):
+    embeddings._save_image_cache("students", {"S9_Big/x.jpg": {"sha1": "0"}})
+    monkeypatch.setattr(embeddings, "_load_image_cache", lambda role: pytest.fail("role cache loaded"))
+    embeddings.update_image_cache("students", "S1_Ann", {"a.jpg": {"dhash": 1}})
+    embeddings.update_image_cache("students", "S1_Ann", {"b.jpg": {"dhash": 2}})
+    assert embeddings.image_cache_entries("students", "S1_Ann") == {"a.jpg": {"dhash": 1}, "b.jpg": {"dhash": 2}}
+    assert embeddings.image_cache_entries("students", "S2_Bob") == {}
+
+def test_rebuild_merges_uploaded_entries_without_encoding(dirs, monkeypatch):
+    entry = add_image(dirs, "S1_Ann", "a.png", 3)
+    embeddings.update_image_cache("students", "S1_Ann", {"a.png": entry})
+    encoded = []
+    monkeypatch.setattr(embeddings, "_encode_many",
+                        lambda paths, workers, progress=None: encoded.extend(paths) or [[] for _ in paths])
+    assert embeddings.build_embeddings_for("students") == 1
+    assert encoded == []
+    assert embeddings._load_image_cache("students")["S1_Ann/a.png"]["dhash"] == 3
+    np.testing.assert_array_equal(embeddings.load_embeddings("students")["S1"]["embedding"], entry["encodings"][0])
+
+def test_rebuild_drops_sidecars_of_deleted_folders(dirs, monkeypatch):
+    add_image(dirs, "S1_Ann", "a.png", 3)
+    embeddings.update_image_cache("students", "S7_Gone", {"a.png": {"dhash": 1}})
+    monkeypatch.setattr(embeddings, "_encode_many", lambda paths, workers, progress=None: [[] for _ in paths])
+    embeddings.build_embeddings_for("students")
+    assert embeddings.image_cache_entries("students", "S7_Gone") == {}
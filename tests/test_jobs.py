@@ -0,0 +1,79 @@
+import threading
+import time
+import pytest
+from backend.utils import embeddings, jobs
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, "EMB_DIR", tmp_path)
+    return jobs.EmbeddingJobRunner()
+
+def wait_for(runner, job_id, status, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        # on disk, so the job's worker thread has finished writing it
+        if getattr(jobs._load(job_id), "status", None) == status:
+            return runner.get(job_id)
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}")
+
+def test_submit_while_queued_joins_the_queued_job(runner, monkeypatch):
+    release = threading.Event()
+    builds = []
+
+    def build(role, progress=None):
+        builds.append(role)
+        release.wait(10)
+        progress(1, 1)
+        return 7
+
+    monkeypatch.setattr(embeddings, "build_embeddings_for", build)
+    first = runner.submit("students")
+    wait_for(runner, first.id, "running")
+    second = runner.submit("students")
+    third = runner.submit("students")
+    assert third.id == second.id and second.id != first.id
+    assert runner.get(second.id).triggers == 2
+    release.set()
+    done = wait_for(runner, second.id, "done")
+    assert done.identities == 7
+    assert done.to_dict()["progress"] == {"done": 1, "total": 1}
+    assert wait_for(runner, first.id, "done").triggers == 1
+    assert builds == ["students", "students"]
+
+def test_failed_build_reports_error(runner, monkeypatch):
+    def build(role, progress=None):
+        raise RuntimeError("dataset missing")
+
+    monkeypatch.setattr(embeddings, "build_embeddings_for", build)
+    job = wait_for(runner, runner.submit("teachers").id, "failed")
+    assert job.error == "dataset missing"
+    assert job.finished is not None
+
+def test_other_workers_see_job_state(runner, monkeypatch):
+    monkeypatch.setattr(embeddings, "build_embeddings_for", lambda role, progress=None: 3)
+    job = runner.submit("students")
+    wait_for(runner, job.id, "done")
+    other = jobs.EmbeddingJobRunner()  # a second worker process shares only the files
+    seen = other.get(job.id)
+    assert (seen.status, seen.identities, seen.role) == ("done", 3, "students")
+    assert [j.id for j in other.list()] == [job.id]
+    assert other.get("../../etc") is None
+
+def test_submit_in_another_worker_joins_its_queued_job(runner, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(embeddings, "build_embeddings_for", lambda role, progress=None: release.wait(10) and 1)
+    first = runner.submit("students")
+    wait_for(runner, first.id, "running")
+    queued = runner.submit("students")
+    # flock conflicts across open files even in one process, as between workers
+    other = jobs.EmbeddingJobRunner()
+    joined = other.submit("students")
+    assert joined.id == queued.id
+    assert runner.get(queued.id).triggers == 2
+    release.set()
+    wait_for(runner, queued.id, "done")
+    # the queue lock was released when the job started: the next trigger starts a new job
+    fresh = other.submit("students")
+    assert fresh.id != queued.id
+    wait_for(other, fresh.id, "done")
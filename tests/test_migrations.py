@@ -0,0 +1,36 @@
+from sqlalchemy import create_engine, text
+from backend.migrations import m005_schedules_unique_slot, m007_schedules_normalise
+
+def old_schedules(conn):
+    conn.execute(text("CREATE TABLE schedules (id INTEGER PRIMARY KEY, class_id VARCHAR, subject VARCHAR, "
+                      "teacher_id VARCHAR, day VARCHAR, start_time VARCHAR, end_time VARCHAR)"))
+    conn.execute(text("INSERT INTO schedules (class_id, subject, teacher_id, day, start_time, end_time) VALUES "
+                      "('C1', 'Maths', 'T1', 'mon', '9:00', '10:00:00'),"
+                      "('C1', 'Maths v2', 'T1', 'Monday', '09:00', '10:00'),"
+                      "('C2', 'Art', 'T2', ' TUESDAY ', '13:30:00', '14:30'),"
+                      "('C3', 'Odd', 'T3', 'someday', 'noon', '13:00')"))
+
+def rows(conn):
+    return conn.execute(text("SELECT class_id, subject, day, start_time, end_time FROM schedules "
+                             "ORDER BY class_id")).fetchall()
+
+def test_m005_normalises_before_deduplicating():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        old_schedules(conn)
+        m005_schedules_unique_slot(conn)
+        assert rows(conn) == [
+            ("C1", "Maths v2", "Monday", "09:00", "10:00"),
+            ("C2", "Art", "Tuesday", "13:30", "14:30"),
+            ("C3", "Odd", "someday", "noon", "13:00"),
+        ]
+        indexes = {r[1] for r in conn.execute(text("PRAGMA index_list(schedules)"))}
+        assert "ux_schedules_class_day_start" in indexes
+
+def test_m007_normalises_databases_past_m005():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        old_schedules(conn)
+        conn.execute(text("CREATE UNIQUE INDEX ux_schedules_class_day_start ON schedules (class_id, day, start_time)"))
+        m007_schedules_normalise(conn)
+        assert [r[:2] for r in rows(conn)] == [("C1", "Maths v2"), ("C2", "Art"), ("C3", "Odd")]
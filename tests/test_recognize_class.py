@@ -0,0 +1,33 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from backend.routers import attendance
+
+MATCHED = [{"image": 0, "box": [0, 10, 10, 0], "distance": 0.3, "id": "S1", "name": "Ann"},
+           {"image": 0, "box": [0, 30, 10, 20], "distance": 0.4, "id": "S2", "name": "Bob"}]
+
+@pytest.fixture
+def client(monkeypatch):
+    async def recognize(fn, *args):
+        return {"matched": [dict(m) for m in MATCHED], "unknown": [], "faces": 2}
+
+    async def mark(role, pid, now, class_id=None):
+        return pid != "S2"  # S2 was marked earlier today
+
+    async def no_scope(role, conn):
+        return None
+
+    monkeypatch.setattr(attendance, "_recognize", recognize)
+    monkeypatch.setattr(attendance, "_mark", mark)
+    monkeypatch.setattr(attendance, "_scope", no_scope)
+    app = FastAPI()
+    app.include_router(attendance.router, prefix="/api")
+    return TestClient(app)
+
+def test_class_photo_reports_rows_actually_written(client):
+    res = client.post("/api/recognize/class", files=[("files", ("a.jpg", b"jpeg", "image/jpeg"))])
+    assert res.status_code == 200
+    body = res.json()
+    assert body["marked"] == 1
+    assert body["message"] == "Attendance marked for 1 students (1 already marked)"
+    assert [m["already_marked"] for m in body["matched"]] == [False, True]
@@ -0,0 +1,84 @@
+import time
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.database import Base
+from backend.models import Admin
+from backend.utils import security
+
+@pytest.fixture
+def admin_db(tmp_path, monkeypatch):
+    """An admin row with password 'secret'; returns a function that changes it."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'attendance.db'}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(security, "ReadSessionLocal", Session)
+    monkeypatch.setattr(security, "ADMIN_HASH_CACHE_SECONDS", 0.2)
+    monkeypatch.setattr(security, "_hash_cache", {"hash": None, "loaded": 0.0, "legacy_ok": set()})
+
+    def set_password(password: str) -> None:
+        with Session() as db:
+            db.merge(Admin(id=1, password_hash=security.hash_password(password)))
+            db.commit()
+
+    set_password("secret")
+    return set_password
+
+def bearer(token: str) -> str:
+    return f"Bearer {token}"
+
+def require_admin(authorization=None, x_admin_password=None):
+    # called directly, not through FastAPI, so both headers are passed
+    return security.require_admin(authorization=authorization, x_admin_password=x_admin_password)
+
+def test_valid_token_is_accepted(admin_db):
+    token = security.issue_token(security.admin_hash())
+    assert security.verify_token(token, security.admin_hash())
+    assert require_admin(authorization=bearer(token)) is True
+
+def test_expired_token_is_rejected(admin_db):
+    token = security.issue_token(security.admin_hash(), ttl=-1)
+    assert not security.verify_token(token, security.admin_hash())
+    with pytest.raises(HTTPException) as exc:
+        require_admin(authorization=bearer(token))
+    assert exc.value.status_code == 401
+
+@pytest.mark.parametrize("tamper", [
+    lambda t: t[:-1] + ("0" if t[-1] != "0" else "1"),          # signature
+    lambda t: str(int(t.split(".")[0]) + 3600) + t[t.index("."):],  # expiry
+    lambda t: "not-a-token",
+])
+def test_tampered_token_is_rejected(admin_db, tamper):
+    token = tamper(security.issue_token(security.admin_hash()))
+    with pytest.raises(HTTPException):
+        require_admin(authorization=bearer(token))
+
+def test_password_change_invalidates_tokens(admin_db):
+    token = security.issue_token(security.admin_hash())
+    admin_db("changed")
+    # another worker notices within ADMIN_HASH_CACHE_SECONDS
+    time.sleep(0.25)
+    with pytest.raises(HTTPException):
+        require_admin(authorization=bearer(token))
+    assert require_admin(authorization=bearer(security.issue_token(security.admin_hash())))
+
+def test_password_change_in_this_worker_is_immediate(admin_db):
+    token = security.issue_token(security.admin_hash())
+    security.set_admin_hash(security.hash_password("changed"))
+    assert not security.verify_token(token, security.admin_hash())
+
+def test_legacy_password_header(admin_db):
+    assert require_admin(x_admin_password="secret") is True
+    assert require_admin(x_admin_password="secret") is True  # cached, no bcrypt
+    with pytest.raises(HTTPException):
+        require_admin(x_admin_password="wrong")
+    admin_db("changed")
+    time.sleep(0.25)
+    with pytest.raises(HTTPException):
+        require_admin(x_admin_password="secret")
+
+def test_missing_credentials(admin_db):
+    with pytest.raises(HTTPException) as exc:
+        require_admin()
+    assert exc.value.status_code == 401
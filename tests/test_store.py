@@ -0,0 +1,50 @@
+import json
+import numpy as np
+from backend.utils import store
+
+def gallery(n, dim=128, seed=0):
+    ids = [f"S{i}" for i in range(n)]
+    return ids, [f"Name {i}" for i in ids], np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+def test_write_open_round_trip(tmp_path):
+    ids, names, matrix = gallery(5)
+    header = store.write_gallery(tmp_path, "students", ids, names, matrix)
+    assert (header["generation"], header["count"], header["dim"], header["model"]) == (1, 5, 128, "dlib")
+    opened_header, opened_ids, opened_names, opened = store.open_gallery(tmp_path, "students")
+    assert opened_header == header
+    assert (opened_ids, opened_names) == (ids, names)
+    assert isinstance(opened, np.memmap) and not opened.flags.writeable
+    np.testing.assert_array_equal(opened, matrix)
+
+def test_empty_gallery_round_trip(tmp_path):
+    header = store.write_gallery(tmp_path, "teachers", [], [], np.empty((0, 0), np.float32), model="dlib")
+    assert (header["count"], header["dim"]) == (0, 0)
+    _, ids, names, matrix = store.open_gallery(tmp_path, "teachers")
+    assert ids == [] and names == [] and matrix.shape == (0, 0)
+
+def test_missing_gallery(tmp_path):
+    assert store.open_gallery(tmp_path, "students") is None
+
+def test_generations_and_cleanup_keep_current_and_previous(tmp_path):
+    headers = [store.write_gallery(tmp_path, "students", *gallery(3, seed=g)) for g in range(4)]
+    assert [h["generation"] for h in headers] == [1, 2, 3, 4]
+    files = {f.name for f in tmp_path.glob("student_gallery.*") if not f.name.endswith(".lock")}
+    kept = {h[k] for h in headers[2:] for k in ("matrix", "ids")} | {"student_gallery.json"}
+    assert files == kept
+    # the previous generation's files still open after the swap
+    _, ids, _, matrix = store.open_gallery(tmp_path, "students", headers[2])
+    np.testing.assert_array_equal(matrix, gallery(3, seed=2)[2])
+
+def test_remove_old_generations(tmp_path):
+    for gen in (1, 2, 3, 5):
+        (tmp_path / f"student_gallery.{gen}.abcd.f32").write_bytes(b"")
+    (tmp_path / "student_gallery.json").write_text("{}")
+    (tmp_path / "teacher_gallery.1.abcd.f32").write_bytes(b"")
+    store._remove_old_generations(tmp_path, "students", keep={5, 4})
+    assert sorted(f.name for f in tmp_path.iterdir()) == [
+        "student_gallery.5.abcd.f32", "student_gallery.json", "teacher_gallery.1.abcd.f32"]
+
+def test_untagged_model_from_dimension(tmp_path):
+    assert store.write_gallery(tmp_path, "students", *gallery(2, dim=512))["model"] == "unknown"
+    header = json.loads(store.header_file(tmp_path, "students").read_text())
+    assert header["dim"] == 512
@@ -0,0 +1,33 @@
+import datetime
+import pytest
+from backend.utils import timetable
+
+MONDAY_9 = datetime.datetime(2026, 3, 2, 9, 15)
+
+@pytest.fixture
+def queries(monkeypatch):
+    calls = []
+
+    class Engine:
+        def connect(self):
+            calls.append("connect")
+            raise AssertionError("read pool connection taken")
+
+    monkeypatch.setattr(timetable, "read_engine", Engine())
+    timetable.clear_cache()
+    yield calls
+    timetable.clear_cache()
+
+def test_cache_hit_takes_no_connection(queries, monkeypatch):
+    loads = []
+    monkeypatch.setattr(timetable, "_query", lambda fn, *args: loads.append(fn.__name__) or (
+        {"class_id": "C1", "teacher_id": "T1"} if fn is timetable.current_session else frozenset({"S1"})))
+    assert timetable.session_scope("students", "B12", MONDAY_9) == ("C1", frozenset({"S1"}))
+    assert timetable.session_scope("students", "B12", MONDAY_9) == ("C1", frozenset({"S1"}))
+    assert timetable.session_scope("teachers", "B12", MONDAY_9) == ("C1", frozenset({"T1"}))
+    assert loads == ["current_session", "class_roster"]
+    assert queries == []
+
+def test_no_room_no_lookup(queries):
+    assert timetable.session_scope("students", "", MONDAY_9) is None
+    assert queries == []
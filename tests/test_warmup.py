@@ -0,0 +1,44 @@
+import multiprocessing
+import time
+import pytest
+from backend.utils import recognition, warmup
+
+# the patched initializer only reaches forked workers
+FORKED = pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="workers must be forked")
+
+def warm_slowly():
+    time.sleep(0.3)
+
+def fail_to_warm():
+    raise RuntimeError("no model")
+
+@pytest.fixture
+def process_pool(monkeypatch):
+    def make(init, workers=3):
+        monkeypatch.setattr(recognition, "_init_worker", init)
+        pool = recognition.RecognitionPool("process", workers)
+        monkeypatch.setattr(recognition, "pool", pool)
+        return pool
+    yield make
+
+@FORKED
+def test_every_process_worker_warms_before_ready(process_pool):
+    pool = process_pool(warm_slowly)
+    try:
+        assert pool.start_workers(timeout=30) == 3
+        warmup._pool()
+        assert warmup._state["recognition_workers"] == {"warm": 3, "total": 3}
+    finally:
+        pool.executor.shutdown()
+
+@FORKED
+def test_worker_that_cannot_warm_fails_warmup(process_pool):
+    pool = process_pool(fail_to_warm, workers=2)
+    try:
+        with pytest.raises(Exception):
+            warmup._pool()
+    finally:
+        pool.executor.shutdown()
+
+def test_thread_pool_needs_no_start():
+    assert recognition.RecognitionPool("thread", 4).start_workers(timeout=0) == 4